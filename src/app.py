@@ -2,7 +2,26 @@ import dash
 from dash import html, dcc
 import dash_bootstrap_components as dbc
 
-app = dash.Dash(__name__, use_pages=True, external_stylesheets=[dbc.themes.SPACELAB])
+from utils.lazy import start_warm_up
+from utils.watcher import start_watcher
+from utils import export, http, metrics, traces
+
+# page layouts are functions that load their data on first visit, so callbacks are
+# registered for components that are not in the initial layout
+app = dash.Dash(
+    __name__,
+    use_pages=True,
+    external_stylesheets=[dbc.themes.SPACELAB],
+    suppress_callback_exceptions=True
+)
+# WSGI entry point for production servers, see serve.py
+server = app.server
+metrics.install(server)
+# before http, as hooks added later run first: traces sees the response that is sent
+traces.install(server)
+http.install(server)
+export.install(server)
+
 sidebar = dbc.Nav(
             [
                 dbc.NavLink(
@@ -50,4 +69,6 @@ app.layout = dbc.Container(
 
 
 if __name__ == "__main__":
+    start_warm_up()
+    start_watcher()
     app.run(debug=False)
@@ -0,0 +1,24 @@
+// Clientside loading of the prebuilt figures (see utils/artifacts.py and utils/http.py).
+// Pages list the figures' URLs in a store; the browser fetches them in parallel and,
+// as the URLs change whenever a figure does, serves repeat visits from its cache.
+// A null URL (a figure the server cannot build) leaves its graph as it is.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    figures: {
+        fetch_all: function(urls) {
+            if (!urls) {
+                return window.dash_clientside.no_update;
+            }
+            return Promise.all(urls.map(function(url) {
+                if (!url) {
+                    return window.dash_clientside.no_update;
+                }
+                return fetch(url).then(function(response) {
+                    if (!response.ok) {
+                        throw new Error(url + ": HTTP " + response.status);
+                    }
+                    return response.json();
+                });
+            }));
+        }
+    }
+});
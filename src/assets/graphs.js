@@ -0,0 +1,15 @@
+// Clientside part of the Student Characteristic graph (see pages/categoricalVisualizer.py).
+// Figures that were not cached are built by a background job; by the time one arrives
+// the user may have moved on to another selection, and then it is not shown: its job
+// is no longer the latest, or its id was written to 'graph-wanted' to cancel it.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    graphs: {
+        show_rendered: function(rendered, job, cancelled) {
+            var no_update = window.dash_clientside.no_update;
+            if (!rendered || !job || rendered.id !== job.id || rendered.id === cancelled) {
+                return [no_update, no_update];
+            }
+            return [rendered.figure, rendered.key];
+        }
+    }
+});
@@ -0,0 +1,162 @@
+// Clientside callbacks for the year slider of the Regional Data page
+// (see pages/pg2.py). The 'regional-years' store holds, for every year, a base64
+// little-endian float32 array of values in the order of its 'authorities' list, with
+// NaN for suppressed values, and the counts behind them the same way. Both charts are updated from it without a round trip.
+// Clicking a region fetches the prebuilt charts and values of its local authorities
+// (see components/regional.py) and swaps them in, at the slider's year.
+(function() {
+    var decoded = new WeakMap();
+
+    function decode(encoded) {
+        var bytes = Uint8Array.from(atob(encoded), function(c) { return c.charCodeAt(0); });
+        return new Float32Array(bytes.buffer);
+    }
+
+    // values, numerators and denominators of every year as Float32Arrays, decoded once
+    // per store
+    function yearArrays(store) {
+        var arrays = decoded.get(store);
+        if (!arrays) {
+            arrays = {
+                values: store.values.map(decode),
+                numerators: store.numerators.map(decode),
+                denominators: store.denominators.map(decode)
+            };
+            decoded.set(store, arrays);
+        }
+        return arrays;
+    }
+
+    // [[authority, value, numerator, denominator], ...] of the year, without
+    // suppressed values
+    function yearValues(store, year) {
+        var index = store.years.indexOf(year);
+        if (index < 0) {
+            return null;
+        }
+        var arrays = yearArrays(store);
+        var values = arrays.values[index];
+        var rows = [];
+        for (var i = 0; i < values.length; i++) {
+            if (!isNaN(values[i])) {
+                rows.push([store.authorities[i], values[i], arrays.numerators[index][i], arrays.denominators[index][i]]);
+            }
+        }
+        return rows;
+    }
+
+    // past store.max_bars bars, the store.top_n_bars highest and one "Other (<count>)"
+    // bar pooling the rest from their counts, as components/regional.py does for the
+    // first year with utils.aggregate; suppressed counts are left out of both sums
+    function topN(sorted, store) {
+        if (!store.max_bars || sorted.length <= store.max_bars) {
+            return sorted;
+        }
+        var rest = sorted.slice(0, sorted.length - store.top_n_bars);
+        var num = 0, den = 0;
+        rest.forEach(function(row) {
+            if (!isNaN(row[2]) && !isNaN(row[3])) {
+                num += row[2];
+                den += row[3];
+            }
+        });
+        return [["Other (" + rest.length + ")", den > 0 ? 100 * num / den : NaN]].concat(sorted.slice(rest.length));
+    }
+
+    function column(pairs, i) {
+        return pairs.map(function(pair) { return pair[i]; });
+    }
+
+    // shallow copy of the figure with the first trace's attributes replaced; the rest
+    // (e.g. the map's geojson) is shared with the current figure
+    function withTrace(fig, attributes) {
+        var trace = Object.assign({}, fig.data[0], attributes);
+        return Object.assign({}, fig, {data: [trace].concat(fig.data.slice(1))});
+    }
+
+    // both charts at the year, or null when the store has no values for it; the map
+    // is null when the page has none
+    function showYear(year, store, map, bars) {
+        var pairs = yearValues(store, year);
+        if (!pairs || !bars) {
+            return null;
+        }
+        var names = column(pairs, 0);
+        var values = column(pairs, 1);
+        var sorted = topN(pairs.slice().sort(function(a, b) { return a[1] - b[1]; }), store);
+        var sortedValues = column(sorted, 1);
+        return [
+            map && withTrace(map, {locations: names, z: values}),
+            withTrace(bars, {
+                x: sortedValues,
+                y: column(sorted, 0),
+                marker: Object.assign({}, bars.data[0].marker, {color: sortedValues})
+            })
+        ];
+    }
+
+    function fetchJson(url) {
+        return fetch(url).then(function(response) {
+            if (!response.ok) {
+                throw new Error(url + ": HTTP " + response.status);
+            }
+            return response.json();
+        });
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        regional: {
+            show_year: function(year, store, map, bars) {
+                var no_update = window.dash_clientside.no_update;
+                var figures = showYear(year, store, map, bars) || [null, null];
+                return [figures[0] || no_update, figures[1] || no_update];
+            },
+
+            select_region: function(clickData, backClicks, region, regionUrls, figureUrls, nationalYears, year) {
+                var no_update = window.dash_clientside.no_update;
+                var ctx = window.dash_clientside.callback_context;
+                var trigger = ctx.triggered.length ? ctx.triggered[0].prop_id : "";
+                var load, name;
+                if (trigger.startsWith("regional-back")) {
+                    if (!region) {
+                        return [no_update, no_update, no_update, no_update, no_update];
+                    }
+                    name = null;
+                    load = Promise.all(figureUrls.map(fetchJson)).then(function(figures) {
+                        return {map: figures[0], bars: figures[1], years: nationalYears};
+                    });
+                } else {
+                    // clicks on the authorities of a region do not drill further
+                    name = clickData && clickData.points.length ? clickData.points[0].location : null;
+                    if (region || !regionUrls[name]) {
+                        return [no_update, no_update, no_update, no_update, no_update];
+                    }
+                    load = fetchJson(regionUrls[name]);
+                }
+                return load.then(function(level) {
+                    var figures = showYear(year, level.years, level.map, level.bars) || [level.map, level.bars];
+                    return [figures[0], figures[1], level.years, name, {display: name ? "inline-block" : "none"}];
+                });
+            },
+
+            play: function(n_clicks, n_intervals, year, disabled, store) {
+                var ctx = window.dash_clientside.callback_context;
+                var trigger = ctx.triggered.length ? ctx.triggered[0].prop_id : "";
+                var years = store.years;
+                var last = years[years.length - 1];
+                if (trigger.startsWith("regional-play")) {
+                    if (!disabled) {
+                        return [window.dash_clientside.no_update, true, "Play"];
+                    }
+                    // start again from the beginning once the last year was reached
+                    return [year === last ? years[0] : window.dash_clientside.no_update, false, "Pause"];
+                }
+                var next = years[years.indexOf(year) + 1];
+                if (next === undefined) {
+                    return [window.dash_clientside.no_update, true, "Play"];
+                }
+                return [next, next === last, next === last ? "Play" : "Pause"];
+            }
+        }
+    });
+})();
@@ -0,0 +1,76 @@
+// Clientside callbacks for the Student Characteristic selector cascade
+// (see pages/categoricalVisualizer.py). Option lists and descriptions come from the
+// 'selector-options' store, the catalog entry of the selected file (see
+// utils/catalog.py), so only a change of file needs a round trip to the server.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    selectors: {
+        populate_file_description: function(entry) {
+            if (!entry) {
+                return [""];
+            }
+            return [entry.summary];
+        },
+
+        populate_category_description: function(year, entry) {
+            if (year == null || !entry) {
+                return "";
+            }
+            return entry.category_labels[0] || "";
+        },
+
+        populate_metric_description: function(metric, entry) {
+            if (metric == null || !entry) {
+                return "";
+            }
+            return entry.descriptions[metric] || "";
+        },
+
+        update_year_selector: function(entry) {
+            if (!entry) {
+                return [{"display": "none"}, "", []];
+            }
+            return [{"display": "block"}, "Academic year", entry.years];
+        },
+
+        update_category_selector: function(year, entry) {
+            var categoryOptions = entry ? entry.categories : [];
+            if (year == null) {
+                return [{"display": "none"}, categoryOptions];
+            }
+            return [{"display": "block"}, categoryOptions];
+        },
+
+        update_sub_column_visibility: function(categories, entry) {
+            if (categories == null) {
+                return [{"display": "none"}, ""];
+            }
+            var labels = entry ? entry.category_labels : [];
+            return [{"display": "block"}, labels[1] || ""];
+        },
+
+        update_sub_category_options: function(categories, entry) {
+            if (categories == null || !entry) {
+                return [];
+            }
+            // characteristics of the selected groups, without repeats
+            var seen = {};
+            var subCategories = [];
+            categories.forEach(function(category) {
+                (entry.hierarchy[category] || []).forEach(function(option) {
+                    if (!seen.hasOwnProperty(option.value)) {
+                        seen[option.value] = true;
+                        subCategories.push(option);
+                    }
+                });
+            });
+            return subCategories;
+        },
+
+        update_metric_selector: function(subCategories, entry) {
+            if (subCategories == null || !entry) {
+                return [{"display": "none"}, []];
+            }
+            return [{"display": "block"}, entry.metrics];
+        }
+    }
+});
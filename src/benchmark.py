@@ -0,0 +1,299 @@
+'''
+Benchmarks for data loading, figure building and callback latency
+
+Each case is run --repeat times and its wall time summarised; figure cases also
+record the size of the serialized figure JSON, which is what the browser downloads.
+
+usage (from src/):
+    python benchmark.py --output bench.json
+    python benchmark.py --output bench.json --compare baseline.json [--tolerance 0.2]
+    python benchmark.py --filter get_figure
+
+With --compare, cases whose median time or payload grew by more than the tolerance
+(20% by default) relative to the baseline are reported, and the exit status is 1.
+'''
+import argparse
+import atexit
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import pandas as pd
+import plotly
+import plotly.graph_objects as go
+
+# background jobs keep their results in a cache of their own (see utils.jobs), so
+# evicting the benchmark's figures never touches the one running servers share
+os.environ["FIGURE_JOB_DIR"] = tempfile.mkdtemp(prefix="benchmark-jobs-")
+atexit.register(shutil.rmtree, os.environ["FIGURE_JOB_DIR"], ignore_errors=True)
+
+import app  # registers the pages
+from components import regional
+from pages import categoricalVisualizer as cv
+from pages import scaledScores
+from utils import catalog, data, engine, export, jobs, scores
+
+CHARACTERISTICS_FILE = "ks2_national_pupil_characteristics_2016_to_2022_provisional.csv"
+
+# representative selections for the Student Characteristic page
+SELECTIONS = {
+    "small": (["Disadvantage status"], ["Disadvantaged", "Not known to be disadvantaged"]),
+    "medium": (["All pupils", "Disadvantage status", "First language"],
+               ["Total", "Disadvantaged", "Not known to be disadvantaged",
+                "Known or believed to be English", "Known or believed to be other than English"]),
+}
+YEARS = {"all-years": "all", "one-year": 202122}
+CHART_TYPES = ["bar", "line", "scatter"]
+METRIC = "pt_mat_met_expected_standard"
+# the inputs of update_graph, in the order of get_figure_args
+SELECTOR_IDS = ["file-selector", "year-selector", "category-selector", "sub-category-selector",
+                "metric-selector", "gender-selector", "chart-type-selector"]
+
+
+#--------------------------------------------------------------------------------------------------------
+# Cases
+#--------------------------------------------------------------------------------------------------------
+def figure_size(fig):
+    if isinstance(fig, bytes):
+        return len(fig)
+    return len(fig.to_json())
+
+
+def callback_request(client, output, spec, values, query=""):
+    '''
+    call a server-side callback through the Dash HTTP endpoint, as the browser does
+
+    :param query: query string, e.g. the job handles of a background callback
+    :return: the response body
+    '''
+    inputs = [dict(item, value=values[item["id"]]) for item in spec["inputs"]]
+    state = [dict(item, value=values.get(item["id"])) for item in spec["state"]]
+    response = client.post("/_dash-update-component" + query, json={
+        "output": output,
+        "outputs": [{"id": o.split(".")[0], "property": o.split(".")[1]} for o in output.strip(".").split("...")]
+        if output.startswith("..") else {"id": output.split(".")[0], "property": output.split(".")[1]},
+        "inputs": inputs,
+        "state": state,
+        "changedPropIds": [f"{inputs[0]['id']}.{inputs[0]['property']}"],
+        })
+    if response.status_code not in (200, 204):
+        raise RuntimeError(f"{output}: HTTP {response.status_code}")
+    return response.data
+
+
+def background_request(client, output, spec, values):
+    '''
+    start a background callback and poll it until its result is ready, as the browser does
+
+    :return: the body of the response carrying the result
+    '''
+    handles = json.loads(callback_request(client, output, spec, values))
+    query = f"?cacheKey={handles['cacheKey']}&job={handles['job']}"
+    while True:
+        body = callback_request(client, output, spec, values, query)
+        if "response" in json.loads(body):
+            return body
+        time.sleep(0.01)
+
+
+def cases():
+    '''
+    yield (name, function, whether the function returns a figure)
+    '''
+    for filename in data.list_csv_names():
+        path = data.data_path(filename)
+        yield f"load/csv/{filename}", lambda path=path: data.read_source_csv(path), False
+        yield f"load/cache/{filename}", lambda f=filename: data.load_dataframe(f), False
+        yield f"load/compact/{filename}", lambda path=path: data.compact(data.read_source_csv(path)), False
+    yield "load/guidance", lambda: json.load(open(data.data_path(data.GUIDANCE_FILE))), False
+    yield "load/page-data", lambda: cv.load_data.__wrapped__(data.current_snapshot()), False
+    yield "load/catalog", lambda: catalog.load_catalog.__wrapped__(data.current_snapshot()), False
+    snapshot = data.current_snapshot()
+    yield "engine/dataset", \
+        lambda: engine.Dataset(CHARACTERISTICS_FILE, snapshot.frames[CHARACTERISTICS_FILE], snapshot.guidance,
+                               snapshot.reasons[CHARACTERISTICS_FILE]), False
+
+    cv.load_data()
+    for selection, (categories, sub_categories) in SELECTIONS.items():
+        for year_mode, year in YEARS.items():
+            for chart_type in CHART_TYPES:
+                args = (CHARACTERISTICS_FILE, year, categories, sub_categories, METRIC, "Total", chart_type, "benchmark")
+                yield f"get_figure/{chart_type}/{year_mode}/{selection}", lambda args=args: cv.get_figure(*args), True
+
+    regional_df = data.get_dataframe(regional.REGIONAL_FILE)
+    yield "horizontal_total_students", lambda: regional.horizontal_total_students(regional_df), True
+    if os.path.exists(data.data_path(regional.AUTHORITIES_FILE)):
+        authorities = regional.load_authorities()
+        yield "plot_year_map", lambda: regional.plot_year_map(regional_df, authorities, METRIC), True
+        regions = regional.load_regions()
+        yield "regional/dissolve", regional.load_regions, False
+        yield "plot_year_map/regions", \
+            lambda: regional.plot_year_map(regional_df, regions, METRIC, level=regional.REGIONAL), True
+        region = regional.REGION_CODES[0]
+        yield "regional/region", lambda: json.dumps(regional.build_region(region)).encode(), True
+    yield "regional/year-values", lambda: regional.encode_year_values(regional.year_values(regional_df, METRIC)), False
+
+    # the whole regional file, as the /_export endpoint streams it
+    regional_dataset = engine.get_dataset(regional.REGIONAL_FILE)
+    selection, columns = regional_dataset.resolve({}), list(regional_df.columns)
+    yield "export/csv", \
+        lambda: "".join(export.csv_chunks(regional_dataset, selection, columns)).encode(), True
+    yield "export/arrow", lambda: b"".join(export.arrow_chunks(regional_dataset, selection, columns)), True
+
+    distributions = scores.load_distributions()
+    distribution = distributions[(202122, "Maths", "Total", "Allschools")]
+    yield "scores/build-distributions", \
+        lambda: scores.build_distributions(data.get_dataframe(scores.SCORES_FILE)), False
+    yield "scores/lookups", lambda: (
+        [scores.percentile(distribution, p) for p in (10, 25, 50, 75, 90)],
+        scores.percent_at_least(distribution, 110)), False
+    yield "scores/figure", \
+        lambda: scaledScores.get_distribution_figure({"Total": distribution}, 110), True
+
+    # every server-side callback of the Student Characteristic page, through HTTP;
+    # the others are clientside and never reach the server
+    client = app.server.test_client()
+    client.get("/")
+    categories, sub_categories = SELECTIONS["medium"]
+    values = {
+        "file-selector": CHARACTERISTICS_FILE,
+        "year-selector": "all",
+        "category-selector": categories,
+        "sub-category-selector": sub_categories,
+        "metric-selector": METRIC,
+        "gender-selector": "Total",
+        "chart-type-selector": "bar",
+        "selector-options": None,
+    }
+    for output, spec in app.app.callback_map.items():
+        if "callback" not in spec or any(item["id"] not in values for item in spec["inputs"]):
+            continue
+        request = lambda output=output, spec=spec: callback_request(client, output, spec, values)
+        if "graph.figure" in output:
+            # a figure not built yet: the hand-off to a background job, the job and the
+            # polling for its result
+            render = app.app.callback_map["graph-rendered.data"]
+            def build(gender, output=output, spec=spec):
+                selection = dict(values, **{"gender-selector": gender})
+                cv.figure_cache.clear()
+                key = cv.figure_key(cv.get_figure_args(*(selection[name] for name in SELECTOR_IDS)))
+                jobs.results.delete(jobs.result_key(key))
+                job = json.loads(callback_request(client, output, spec, selection))["response"]["graph-job"]["data"]
+                return background_request(client, "graph-rendered.data", render, {"graph-job": job})
+            yield "callback/graph.figure/miss", lambda: build("Total"), True
+            # built by a job, so not in this worker's cache yet
+            def shared_hit(request=request):
+                cv.figure_cache.clear()
+                return request()
+            yield "callback/graph.figure/shared-hit", shared_hit, True
+            yield "callback/graph.figure/hit", request, True
+
+            # same selection for another gender: a Patch of the traces' values. Both
+            # figures are built on the first call, the warm-up run of run_case
+            patched = {}
+            def patch(output=output, spec=spec, request=request):
+                if not patched:
+                    build("Boys")
+                    build("Total")
+                    shown = json.loads(request())["response"]["graph-selection"]["data"]
+                    patched.update(values, **{"gender-selector": "Boys", "graph-selection": shown})
+                return callback_request(client, output, spec, patched)
+            yield "callback/graph.figure/patch", patch, True
+        else:
+            yield f"callback/{output}", request, True
+
+
+def run_case(func, repeat, is_figure):
+    func()  # warm up imports and caches that are not what is being measured
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    summary = {
+        "repeat": repeat,
+        "min_ms": timings[0],
+        "median_ms": statistics.median(timings),
+        "mean_ms": statistics.fmean(timings),
+        "p95_ms": timings[min(len(timings) - 1, int(round(0.95 * (len(timings) - 1))))],
+    }
+    if is_figure:
+        if isinstance(result, go.Figure) and not result.data:
+            raise RuntimeError("the figure has no traces")
+        summary["payload_bytes"] = figure_size(result)
+    return summary
+
+
+#--------------------------------------------------------------------------------------------------------
+# Comparison
+#--------------------------------------------------------------------------------------------------------
+def compare(results, baseline, tolerance):
+    '''
+    cases whose median time or payload grew by more than tolerance over the baseline
+    '''
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric in ("median_ms", "payload_bytes"):
+            if metric in current and metric in previous and previous[metric] > 0:
+                change = current[metric] / previous[metric] - 1
+                if change > tolerance:
+                    regressions.append((name, metric, previous[metric], current[metric], change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark data loading, figures and callbacks")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file from a previous run")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed relative growth before a case counts as a regression")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, func, is_figure in cases():
+        if args.filter not in name:
+            continue
+        results[name] = run_case(func, args.repeat, is_figure)
+        summary = results[name]
+        size = f"  {summary['payload_bytes']:>9,} B" if "payload_bytes" in summary else ""
+        print(f"{name:<60} {summary['median_ms']:9.2f} ms (p95 {summary['p95_ms']:8.2f}){size}")
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "plotly": plotly.__version__,
+            "machine": platform.machine(),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        for name, metric, previous, current, change in regressions:
+            print(f"REGRESSION {name} {metric}: {previous:.2f} -> {current:.2f} (+{change:.0%})")
+        if regressions:
+            return 1
+        print(f"no regressions against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,46 @@
+'''
+Precompute the static figures of the app (see utils.artifacts)
+
+Run from src/ as part of a deploy:
+    python build.py            build every figure that is missing or stale
+    python build.py --force    rebuild everything
+    python build.py regional-map overview-math
+
+The artifacts a figure was built as before are removed once it is up to date.
+'''
+import argparse
+import sys
+import time
+
+from utils.artifacts import FIGURES, build_figure, remove_stale
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the prebuilt figure artifacts")
+    parser.add_argument("names", nargs="*", help=f"figures to build (default: all of {', '.join(FIGURES)})")
+    parser.add_argument("--force", action="store_true", help="rebuild even if the artifact is up to date")
+    args = parser.parse_args(argv)
+
+    unknown = [name for name in args.names if name not in FIGURES]
+    if unknown:
+        parser.error(f"unknown figure(s): {', '.join(unknown)}")
+
+    failed = 0
+    for name in args.names or FIGURES:
+        start = time.perf_counter()
+        try:
+            path, built = build_figure(name, force=args.force)
+        except (OSError, ValueError) as e:
+            failed += 1
+            print(f"{name}: failed ({e})")
+            continue
+        status = f"built in {time.perf_counter() - start:.2f}s" if built else "up to date"
+        removed = remove_stale(name, path)
+        if removed:
+            status += f", {removed} stale file(s) removed"
+        print(f"{name}: {status} -> {path}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+'''
+Figures for the Overview page
+
+Built ahead of time by build.py (see utils.artifacts) from the headline metrics of
+utils.headlines. Years without assessments are drawn interpolated, without markers.
+'''
+import math
+
+import plotly.graph_objs as go
+
+from utils.headlines import OUTCOMES, build_headlines
+
+SUBJECT_COLORS = {"Science": "#EE8636", "Math": "#356CB0", "Writing": "#529E3E", "Grammar": "#7D7D7D"}
+
+
+def padded_range(values, step):
+    '''
+    axis range around values, widened to the multiples of step beyond them
+    '''
+    values = [value for value in values if value is not None]
+    return [step * (math.floor(min(values) / step) - 1), step * (math.ceil(max(values) / step) + 1)]
+
+
+# chart one
+def math_expected_standard():
+    '''
+    Percentage of pupils meeting the expected standard in maths, by year
+    '''
+    math_series = build_headlines()["subjects"]["Math"]
+    figchart1 = go.Figure(
+        data=[go.Scatter(y=math_series["values"], x=math_series["years"])],
+        layout=go.Layout(
+            title=go.layout.Title(text="Percentage of pupils meeting expected standard in math")
+            )
+        )
+
+    figchart1.update_layout(
+        xaxis_title="Data Source: Key stage 2 attainment by pupil characteristics (England, state-funded schools)",
+        height=530,
+        title={
+            'y':0.9,
+            'x':0.5,
+            'xanchor': 'center',
+            'yanchor': 'top',
+            'font_color': '#5E5E5E',
+            }
+        )
+
+    dot_opacity = [int(measured) for measured in math_series["measured"]]
+
+    figchart1.update_xaxes(title_font=dict(size=12, color='#A4A5A5'), linecolor='#7D7D7D', ticks="", color='#7D7D7D')
+    figchart1.update_yaxes(linecolor='#7D7D7D', ticks="", color='#7D7D7D', range=padded_range(math_series["values"], 5))
+    figchart1.update_traces(line=dict(color="#356CB0", width=3), marker=dict(size=10, opacity=dot_opacity))
+    return figchart1
+
+
+# chart two
+def disadvantage_gap_index():
+    '''
+    Disadvantage gap index, by year
+    '''
+    gap_series = build_headlines()["gap_index"]
+    figchart2 = go.Figure(
+        data=[go.Scatter(
+            y=gap_series["values"], 
+            x=gap_series["years"])
+            ],
+        layout=go.Layout(
+            title=go.layout.Title(text="Disadvantaged gap index")
+            )
+        )
+
+    figchart2.update_layout(
+        xaxis_title="Data Source: Key stage 2 disadvantage gap index (England, state-funded schools)",
+        height=530,
+        title={
+            'y':0.9,
+            'x':0.5,
+            'xanchor': 'center',
+            'yanchor': 'top',
+            'font_color': "#5E5E5E",
+            }
+        )
+
+    dot_opacity = [int(measured) for measured in gap_series["measured"]]
+
+    figchart2.update_xaxes(title_font=dict(size=12, color='#A4A5A5'), linecolor='#7D7D7D', ticks="", color='#7D7D7D')
+    figchart2.update_yaxes(linecolor='#7D7D7D', ticks="", color='#7D7D7D', range=padded_range(gap_series["values"], 0.1))
+    figchart2.update_traces(line=dict(color="#356CB0", width=3), marker=dict(size=10, opacity=dot_opacity))
+    return figchart2
+
+
+# chart three
+def subject_expected_standard():
+    '''
+    Percentage of pupils meeting the expected standard, one line per subject
+    '''
+    subjects = build_headlines()["subjects"]
+    figchart3 = go.Figure(
+        layout=go.Layout(
+            title=go.layout.Title(text="Percentage of pupils meeting expected standard by subject")
+            )
+        )
+
+    # one line per subject, grammar hidden until picked in the legend
+    for name, subject in subjects.items():
+        figchart3.add_trace(
+            go.Scatter(
+                y=subject["values"], 
+                x=subject["years"], 
+                name=name, 
+                line=dict(color=SUBJECT_COLORS[name]),
+                visible='legendonly' if name == "Grammar" else True
+                )
+            )
+
+    figchart3.update_layout(
+        xaxis_title="Data Source: Key stage 2 attainment by pupil characteristics (England, state-funded schools)",
+        height=530,
+        title={
+            'y':0.9,
+            'x':0.5,
+            'xanchor': 'center',
+            'yanchor': 'top',
+            'font_color': "#5E5E5E",
+            }
+        )
+
+    values = [value for subject in subjects.values() for value in subject["values"]]
+    figchart3.update_xaxes(title_font=dict(size=12, color='#A4A5A5'), linecolor='#7D7D7D', ticks="", color='#7D7D7D')
+    figchart3.update_yaxes(linecolor='#7D7D7D', ticks="", color='#7D7D7D', range=padded_range(values, 5))
+    figchart3.update_traces(line=dict(width=3), marker=dict(opacity=0))
+    return figchart3
+
+
+# chart four
+def math_change_by_gender():
+    '''
+    Change in maths results by gender compared to 2019
+    '''
+    headlines = build_headlines()
+    figchart4 = go.Figure(
+        data=[
+            go.Bar(
+                name=gender, 
+                x=list(OUTCOMES.values()),
+                y=[headlines["changes"][gender][outcome] for outcome in OUTCOMES],
+                text=[f'{headlines["changes"][gender][outcome]:.1f}%' for outcome in OUTCOMES],
+                textposition='auto',
+                marker_color=color
+                )
+            for gender, color in (("Boys", "#356CB0"), ("Girls", "#529E3E"))
+            ],
+        layout=go.Layout(
+            title=go.layout.Title(text=f"Percentage Change in Math Scores by Gender since {headlines['baseline_year']}")
+            )
+        )
+
+    figchart4.update_layout(
+        xaxis_title="Data Source: Key stage 2 attainment by pupil characteristics (England, all schools)",
+        height=516,
+        barmode='group',
+        title={
+            'y':0.9,
+            'x':0.5,
+            'xanchor': 'center',
+            'yanchor': 'top',
+            'font_color': '#5E5E5E',
+            }
+        )
+
+    figchart4.update_xaxes(
+        title_font=dict(size=12, 
+        color='#A4A5A5'), 
+        linecolor='#7D7D7D', 
+        ticks="", 
+        color='#7D7D7D',
+        tickmode='array',
+        tickvals=[0,1,2,3],
+        ticktext=["Meeting Expected</br></br>Standard", "Reaching Higher</br></br>Standard", "Not Meeting</br></br>Expected Standard"]
+        )
+    changes = [change for bar in figchart4.data for change in bar.y]
+    figchart4.update_yaxes(linecolor='#7D7D7D', ticks="", ticksuffix = "%", color='#7D7D7D', range=padded_range(changes, 1))
+    return figchart4
@@ -0,0 +1,315 @@
+'''
+Figures for the Regional Data page
+
+These are static for a given data release, so they are built ahead of time by
+build.py (see utils.artifacts) rather than per request. Both charts are built for a
+single year; the values of every year are shipped once as compact arrays (see
+encode_year_values) and the page's year slider swaps them in client-side.
+
+The page opens on England's nine regions, from the file's pre-aggregated "Regional"
+rows, drawn with outlines dissolved from their authorities' boundaries (see
+utils.geometry.dissolve). Each region's authorities, with their boundaries, values
+and bars, are a separate artifact (build_region) the page only fetches when the
+region is clicked.
+'''
+import base64
+import json
+import math
+
+import plotly.express as px
+
+from utils.aggregate import aggregate, count_columns, derived_measures
+from utils.data import data_path, file_hash, get_dataframe
+from utils.geometry import AUTHORITY_NAME, bounding_box, build_topology, dissolve, load_geojson, topology_to_geojson
+from utils.rendering import SETTINGS, top_n
+
+REGIONAL_FILE = "ks2_regional_and_local_authority_2016_to_2022_provisional.csv"
+AUTHORITIES_FILE = "Counties_and_Unitary_Authorities_(December_2021)_UK_BGC.geojson"
+
+# ONS codes of England's nine regions; the file's other "Regional" rows (Inner and
+# Outer London) overlap them
+REGION_CODES = tuple(f"E12{n:06d}" for n in range(1, 10))
+REGION_NAME = "RGN21NM"
+REGION_CODE = "RGN21CD"
+
+METRIC = "pt_mat_met_expected_standard"
+LOCAL_AUTHORITY = "Local authority"
+REGIONAL = "Regional"
+# dataframe column, boundary property and axis label of the areas at each level
+LEVELS = {
+    LOCAL_AUTHORITY: ("la_name", AUTHORITY_NAME, "Local Authority"),
+    REGIONAL: ("region_name", REGION_NAME, "Region"),
+}
+
+MAP_SIZE = (800, 550)
+
+# simplified boundaries by the hash of the boundary file, shared by the artifacts of a build
+_topologies = {}
+
+
+def _area_rows(df, level, region):
+    rows = (df["geographic_level"] == level) & (df["gender"] == "Total")
+    if level == REGIONAL:
+        rows &= df["region_code"].isin(REGION_CODES)
+    if region is not None:
+        rows &= df["region_code"] == region
+    return rows
+
+
+def year_values(df, column, level=LOCAL_AUTHORITY, region=None):
+    '''
+    values of column for every area of a level and year, suppressed values as NaN
+
+    :param level: LOCAL_AUTHORITY or REGIONAL
+    :param region: only the local authorities of this region code
+    :return: float dataframe indexed by area name (la_name or region_name) with one
+        column per time_period, keeping only the years that have data
+    '''
+    name = LEVELS[level][0]
+    # value columns are numeric with suppressed values as NaN, see utils.data.compact
+    rows = _area_rows(df, level, region)
+    table = df.loc[rows, [name, "time_period", column]].pivot(index=name, columns="time_period", values=column)
+    return table.dropna(axis="columns", how="all").sort_index()
+
+
+def year_counts(df, column, table, level=LOCAL_AUTHORITY, region=None):
+    '''
+    the counts a pt_ column is derived from (see utils.aggregate), laid out like its
+    year_values table, so areas can be pooled by summing them
+
+    :return: (numerators, denominators) dataframes
+    '''
+    numerator, denominator, _ = derived_measures(count_columns(df))[column]
+    name = LEVELS[level][0]
+    rows = df.loc[_area_rows(df, level, region), [name, "time_period", numerator, denominator]]
+    return tuple(
+        rows.pivot(index=name, columns="time_period", values=count).reindex(index=table.index, columns=table.columns)
+        for count in (numerator, denominator)
+    )
+
+
+def pooled_value(df, column, year, level, areas):
+    '''
+    column for the areas taken together, from their summed counts (see utils.aggregate)
+    '''
+    name = LEVELS[level][0]
+    pooled = aggregate(
+        df,
+        by=[name],
+        where={"geographic_level": level, "gender": "Total", "time_period": year},
+        rollups={name: {area: "pooled" for area in areas}},
+        measures=[column])
+    return pooled[column].iloc[0] if len(pooled) else float("nan")
+
+
+def region_names(df):
+    '''
+    {region code: region name} of the regions in REGION_CODES
+    '''
+    rows = df.loc[df["geographic_level"] == REGIONAL, ["region_code", "region_name"]].drop_duplicates()
+    names = dict(zip(rows["region_code"], rows["region_name"]))
+    return {code: names[code] for code in REGION_CODES if code in names}
+
+
+def format_year(time_period):
+    '''
+    201617 -> 2016/17
+    '''
+    time_period = str(time_period)
+    return f"{time_period[:4]}/{time_period[4:]}"
+
+
+def horizontal_total_students(df, year=None, level=LOCAL_AUTHORITY, region=None):
+    '''
+    Plot a horizontal bar chart of the number of students who achieved expected standard in maths in each local authority
+
+    :param year: time_period to plot, the first year with data by default; the page
+        swaps in the other years client-side (see assets/regional.js)
+    :param level: LOCAL_AUTHORITY, or REGIONAL for one bar per region
+    :param region: only the local authorities of this region code
+    '''
+    name, _, label = LEVELS[level]
+    table = year_values(df, "pt_mat_met_expected_standard", level, region)
+    year = table.columns[0] if year is None else year
+    values = table[year].dropna().rename("pt_mat_met_expected_standard").reset_index()
+    # past RENDER_MAX_BARS authorities, draw the top ones and one bar for the rest
+    values = top_n(
+        values, name, "pt_mat_met_expected_standard",
+        merge=lambda rest: pooled_value(df, "pt_mat_met_expected_standard", year, level, rest[name])
+    ).sort_values("pt_mat_met_expected_standard")
+    fig = px.bar(values,
+    x="pt_mat_met_expected_standard", 
+    y=name, 
+    orientation='h', 
+    title=None, 
+    width=400, 
+    height=600, 
+    labels={"pt_mat_met_expected_standard":"% Passing", name: label}, 
+    color= "pt_mat_met_expected_standard", 
+    color_continuous_scale="Hot_r", 
+    range_color=[55,90])
+    fig.update(layout_coloraxis_showscale=False)
+    fig.update_yaxes(visible=False, showticklabels=False)
+    fig.update_xaxes(range=[0,100])
+
+    return fig
+
+
+def fit_view(geojson, width, height):
+    '''
+    center and zoom of a web mercator map showing every feature of geojson
+    '''
+    x0, y0, x1, y1 = bounding_box(geojson)
+    mercator = lambda lat: math.log(math.tan(math.pi / 4 + math.radians(lat) / 2))
+    # a 512 px wide world at zoom 0, as mapbox draws it
+    zoom_x = math.log2(width * 360 / (512 * max(x1 - x0, 1e-6)))
+    zoom_y = math.log2(height * 2 * math.pi / (512 * max(mercator(y1) - mercator(y0), 1e-6)))
+    center = {"lat": math.degrees(2 * math.atan(math.exp((mercator(y0) + mercator(y1)) / 2)) - math.pi / 2),
+              "lon": (x0 + x1) / 2}
+    # some margin around the features
+    return center, min(zoom_x, zoom_y) - 0.3
+
+
+def plot_year_map(df, authorities, column, year=None, level=LOCAL_AUTHORITY, region=None):
+    '''
+    generate a map of the UK with a colour scale based on the values in the column for one year
+
+    :param df: dataframe containing the data to be plotted
+    :param authorities: geojson containing the boundaries of the areas of the level
+    :param column: the column in the dataframe to be plotted
+    :param year: time_period to plot, the first year with data by default; the page
+        swaps in the other years client-side (see assets/regional.js)
+    :param level: LOCAL_AUTHORITY, or REGIONAL for the regions
+    :param region: only the local authorities of this region code, zoomed to them
+    :return: the figure
+
+    '''
+    name, boundary_name, _ = LEVELS[level]
+    table = year_values(df, column, level, region)
+    year = table.columns[0] if year is None else year
+    values = table[year].dropna().rename("% Passing").reset_index()
+    center, zoom = ({"lat": 53, "lon": -1.5}, 4.5) if region is None else fit_view(authorities, *MAP_SIZE)
+
+    fig = px.choropleth_mapbox(
+    values,
+    geojson=authorities,
+    locations=name,
+    featureidkey=f"properties.{boundary_name}",
+    color_continuous_scale="Hot_r",
+    mapbox_style="carto-positron",
+    center=center,
+    zoom=zoom,
+    range_color=(55,90),
+    labels=None,
+    opacity=0.5,
+    title=None,
+    color="% Passing",
+    width=MAP_SIZE[0],
+    height=MAP_SIZE[1])
+    return fig
+
+
+def encode_year_values(table, counts):
+    '''
+    the year table as compact arrays for the browser
+
+    Each year is a little-endian float32 array in authority order, base64 encoded;
+    NaN marks a suppressed or missing value. The counts behind the values are sent the
+    same way, for the browser to pool the areas of the "Other" bar as top_n does.
+
+    :param counts: (numerators, denominators) of the table, see year_counts
+    :return: {"years": [...], "labels": [...], "authorities": [...], "values": [base64, ...],
+        "numerators": [...], "denominators": [...], "max_bars": ..., "top_n_bars": ...}
+        with the bar limits of utils.rendering
+    '''
+    encode = lambda frame: [
+        base64.b64encode(frame[year].to_numpy(dtype="<f4").tobytes()).decode("ascii")
+        for year in frame.columns
+    ]
+    numerators, denominators = counts
+    return {
+        "max_bars": SETTINGS["max_bars"],
+        "top_n_bars": SETTINGS["top_n_bars"],
+        "years": [int(year) for year in table.columns],
+        "labels": [format_year(year) for year in table.columns],
+        "authorities": table.index.tolist(),
+        "values": encode(table),
+        "numerators": encode(numerators),
+        "denominators": encode(denominators),
+    }
+
+
+def build_year_values(df, level=LOCAL_AUTHORITY, region=None):
+    '''
+    the encoded year values of METRIC, see encode_year_values
+    '''
+    table = year_values(df, METRIC, level, region)
+    return encode_year_values(table, year_counts(df, METRIC, table, level, region))
+
+
+def load_topology():
+    '''
+    local authority boundaries, simplified and quantized as a topology (see utils.geometry)
+    '''
+    path = data_path(AUTHORITIES_FILE)
+    digest = file_hash(path)
+    if digest not in _topologies:
+        _topologies.clear()
+        _topologies[digest] = build_topology(load_geojson(path))
+    return _topologies[digest]
+
+
+def load_authorities(region=None):
+    '''
+    local authority boundaries, simplified and quantized for the browser
+
+    :param region: only the authorities of this region code
+    '''
+    if region is None:
+        return topology_to_geojson(load_topology())
+    authorities = authority_regions(get_dataframe(REGIONAL_FILE))
+    return topology_to_geojson(load_topology(), keep=lambda properties: authorities.get(properties[AUTHORITY_NAME]) == region)
+
+
+def authority_regions(df):
+    '''
+    {la_name: region code} of the local authorities in the regions of REGION_CODES
+    '''
+    rows = df.loc[df["geographic_level"] == LOCAL_AUTHORITY, ["la_name", "region_code"]].drop_duplicates()
+    return {name: code for name, code in zip(rows["la_name"], rows["region_code"]) if code in REGION_CODES}
+
+
+def load_regions():
+    '''
+    region boundaries, dissolved from the simplified local authority boundaries
+    '''
+    df = get_dataframe(REGIONAL_FILE)
+    regions = {code: {REGION_CODE: code, REGION_NAME: name} for code, name in region_names(df).items()}
+    authorities = {name: code for name, code in authority_regions(df).items() if code in regions}
+    topology = dissolve(load_topology(), lambda properties: authorities.get(properties[AUTHORITY_NAME]), regions)
+    return topology_to_geojson(topology, name="groups")
+
+
+def build_map():
+    return plot_year_map(get_dataframe(REGIONAL_FILE), load_regions(), METRIC, level=REGIONAL)
+
+
+def build_bar_race():
+    return horizontal_total_students(get_dataframe(REGIONAL_FILE), level=REGIONAL)
+
+
+def build_regional_year_values():
+    return build_year_values(get_dataframe(REGIONAL_FILE), REGIONAL)
+
+
+def build_region(region):
+    '''
+    the map, bars and year values of one region's local authorities, fetched by the
+    page when the region is clicked
+    '''
+    df = get_dataframe(REGIONAL_FILE)
+    return {
+        "map": json.loads(plot_year_map(df, load_authorities(region), METRIC, region=region).to_json()),
+        "bars": json.loads(horizontal_total_students(df, region=region).to_json()),
+        "years": build_year_values(df, region=region),
+    }
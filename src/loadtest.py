@@ -0,0 +1,482 @@
+'''
+Load test driving the dashboard through the Dash callback protocol
+
+Virtual users replay sessions against the server the way the browser does: they
+load a page, its Dash layout and dependencies, then send the callbacks their
+selector changes trigger to /_dash-update-component, follow the callbacks those
+outputs trigger in turn, and poll background callbacks until their result is ready.
+Sessions are either the scripts in SCRIPTS or traces recorded from real users (see
+utils/traces.py).
+
+For each number of users the test runs for --duration seconds, starting the users
+evenly over --ramp-up seconds, and reports throughput, error rates and latency
+percentiles for every callback ID (the callback's output, as Dash names it) and
+request. Running it for a growing number of users shows where latency degrades.
+
+usage (from src/):
+    python loadtest.py --users 1,4,16 --duration 30
+    python loadtest.py --url http://localhost:8050 --users 8,16,32,64 --ramp-up 10
+    TRACE_DIR=traces python serve.py ...      # record real sessions, then
+    python loadtest.py --trace traces --think-scale 0.5 --output load.json
+
+Without --url the users run in this process against app.server, which shows the
+cost of the application code rather than of a server deployment. Clientside
+callbacks are not run: none of their outputs are inputs of server-side callbacks.
+'''
+import argparse
+import glob
+import http.cookiejar
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+CHARACTERISTICS_FILE = "ks2_national_pupil_characteristics_2016_to_2022_provisional.csv"
+
+# sessions as steps: ("open", page path) loads a page, {"id.property": value} are the
+# changes a user makes, each followed by the think time
+SCRIPTS = {
+    "student-characteristic": [
+        ("open", "/categoricalvisualizer"),
+        {"file-selector.value": CHARACTERISTICS_FILE},
+        {"year-selector.value": "all"},
+        {"category-selector.value": ["All pupils", "Disadvantage status"]},
+        {"sub-category-selector.value": ["Total", "Disadvantaged", "Not known to be disadvantaged"]},
+        {"metric-selector.value": "pt_mat_met_expected_standard"},
+        {"gender-selector.value": "Boys"},
+        {"chart-type-selector.value": "line"},
+        {"gender-selector.value": "Girls"},
+        {"year-selector.value": 202122},
+    ],
+    "scaled-scores": [
+        ("open", "/scaledscores"),
+        {"score-subject.value": "Reading"},
+        {"score-gender.value": ["Total", "Boys", "Girls"]},
+        {"score-threshold.value": 100},
+    ],
+    "overview-regional": [
+        ("open", "/"),
+        ("open", "/pg2"),
+    ],
+}
+THINK_TIME = 1.0
+
+# longest wait for a background callback's result
+JOB_TIMEOUT = 60
+PERCENTILES = (50, 90, 95, 99)
+
+
+#--------------------------------------------------------------------------------------------------------
+# Clients
+#--------------------------------------------------------------------------------------------------------
+class LocalClient:
+    '''
+    requests to app.server in this process
+    '''
+
+    def __init__(self, server):
+        self.client = server.test_client()
+
+    def request(self, method, path, query=None, body=None):
+        response = self.client.open(path, method=method, query_string=query, json=body)
+        return response.status_code, response.get_data()
+
+
+class HttpClient:
+    '''
+    requests to a running server, keeping cookies like a browser (with the standard
+    library only, so each request opens its own connection)
+    '''
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, method, path, query=None, body=None):
+        url = self.url + path + ("?" + urllib.parse.urlencode(query) if query else "")
+        data = None if body is None else json.dumps(body).encode()
+        request = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+        try:
+            with self.opener.open(request, timeout=JOB_TIMEOUT) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as error:
+            return error.code, error.read()
+
+
+#--------------------------------------------------------------------------------------------------------
+# Sessions
+#--------------------------------------------------------------------------------------------------------
+class Recorder:
+    '''
+    latencies and errors of every request and callback, shared by the users
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.requests = 0
+        self.sessions = 0
+
+    def add(self, label, ms, ok):
+        with self.lock:
+            self.latencies[label].append(ms)
+            if not ok:
+                self.errors[label] += 1
+
+    def count_request(self):
+        with self.lock:
+            self.requests += 1
+
+
+def _layout_props(node, props):
+    '''
+    collect {"id.property": value} of every component with an id in a layout
+    '''
+    if isinstance(node, list):
+        for child in node:
+            _layout_props(child, props)
+    elif isinstance(node, dict):
+        if "props" in node and "type" in node:
+            component = node["props"]
+            if isinstance(component.get("id"), str):
+                for name, value in component.items():
+                    props[f"{component['id']}.{name}"] = value
+            for value in component.values():
+                _layout_props(value, props)
+
+
+class Session:
+    '''
+    one user's page state: the component properties the user and the server set,
+    and the callbacks they trigger
+    '''
+
+    def __init__(self, client, recorder, dependencies, think_scale):
+        self.client = client
+        self.recorder = recorder
+        self.think_scale = think_scale
+        self.props = {}
+        # running background job of each callback, superseded like the browser does
+        self.jobs = {}
+        self.callbacks = [spec for spec in dependencies if not spec.get("clientside_function")]
+
+    def send(self, label, method, path, query=None, body=None):
+        start = time.perf_counter()
+        try:
+            status, data = self.client.request(method, path, query, body)
+        except Exception:
+            status, data = None, b""
+        ms = (time.perf_counter() - start) * 1000
+        self.recorder.count_request()
+        self.recorder.add(label, ms, status is not None and status < 400)
+        return status, data
+
+    def think(self, seconds):
+        if seconds > 0 and self.think_scale > 0:
+            time.sleep(seconds * self.think_scale * random.uniform(0.5, 1.5))
+
+    def call(self, spec, changed):
+        '''
+        send a callback with the current property values, then follow its outputs
+        '''
+        outputs = [
+            {"id": output.split(".")[0], "property": output.split(".")[1]}
+            for output in spec["output"].strip(".").split("...")
+            ]
+        values = lambda items: [dict(item, value=self.props.get(f"{item['id']}.{item['property']}")) for item in items]
+        body = {
+            "output": spec["output"],
+            "outputs": outputs if spec["output"].startswith("..") else outputs[0],
+            "inputs": values(spec["inputs"]),
+            "state": values(spec["state"]),
+            "changedPropIds": changed,
+            }
+        self.dispatch(spec["output"], body, follow=True)
+
+    def dispatch(self, label, body, follow):
+        '''
+        POST a callback, wait for it if it runs in the background and apply its outputs
+        '''
+        start = time.perf_counter()
+        query = {"oldJob": self.jobs.pop(label)} if label in self.jobs else None
+        status, data = self.send(label, "POST", "/_dash-update-component", query, body)
+        result = json.loads(data) if status == 200 else {}
+        if "cacheKey" in result:
+            self.jobs[label] = result["job"]
+            # polls answer {} or the job's progress until the result is ready, and 204
+            # when the job ended without one
+            query = {"cacheKey": result["cacheKey"], "job": result["job"]}
+            result = {}
+            while status == 200 and "response" not in result:
+                if time.perf_counter() - start > JOB_TIMEOUT:
+                    status = None
+                    break
+                time.sleep(0.05)
+                status, data = self.send(f"{label} (poll)", "POST", "/_dash-update-component", query, body)
+                result = json.loads(data) if status == 200 else {}
+            if status is not None:
+                # a job given up on keeps running until the next call supersedes it
+                self.jobs.pop(label, None)
+            self.recorder.add(f"{label} (job)", (time.perf_counter() - start) * 1000, status in (200, 204))
+
+        changed = []
+        for component, properties in result.get("response", {}).items():
+            for name, value in properties.items():
+                self.props[f"{component}.{name}"] = value
+                changed.append(f"{component}.{name}")
+        if follow:
+            self.trigger(changed)
+
+    def trigger(self, changed, initial=False):
+        '''
+        send the server-side callbacks that the changed properties are inputs of
+
+        :param initial: changed holds newly rendered components, so send their
+            callbacks that do not set prevent_initial_call
+        '''
+        for spec in self.callbacks:
+            inputs = [f"{item['id']}.{item['property']}" for item in spec["inputs"]]
+            if initial:
+                ids = {prop.split(".")[0] for prop in changed}
+                if spec.get("prevent_initial_call") or not all(prop.split(".")[0] in ids for prop in inputs):
+                    continue
+            elif not set(inputs) & set(changed):
+                continue
+            self.call(spec, [prop for prop in inputs if prop in changed] or inputs[:1])
+
+    def open(self, path):
+        '''
+        load a page: its HTML, layout and dependencies, the page content and the
+        figures its stores list, then the initial callbacks of its components
+        '''
+        self.send("GET page", "GET", path)
+        status, data = self.send("GET /_dash-layout", "GET", "/_dash-layout")
+        self.props = {}
+        if status == 200:
+            _layout_props(json.loads(data), self.props)
+        self.send("GET /_dash-dependencies", "GET", "/_dash-dependencies")
+
+        before = set(self.props)
+        self.props["_pages_location.pathname"] = path
+        self.props["_pages_location.search"] = ""
+        self.trigger(["_pages_location.pathname", "_pages_location.search"])
+        content = self.props.get("_pages_content.children")
+        _layout_props(content, self.props)
+        for prop, urls in list(self.props.items()):
+            if prop.endswith("figure-urls.data") and urls:
+                # None for a figure the server cannot build, e.g. the map without its boundary file
+                for url in filter(None, urls):
+                    self.send("GET /_figures", "GET", urllib.parse.urlsplit(url).path)
+        self.trigger(sorted(set(self.props) - before), initial=True)
+
+    def run_script(self, steps):
+        for step in steps:
+            if isinstance(step, tuple):
+                self.open(step[1])
+            else:
+                self.props.update(step)
+                self.trigger(list(step))
+            self.think(THINK_TIME)
+
+    def run_trace(self, entries):
+        '''
+        replay recorded requests with their recorded think times; callbacks take the
+        values the server returned in this replay, e.g. new background job ids
+        '''
+        previous = None
+        for entry in entries:
+            if previous is not None:
+                self.think(entry["t"] - previous)
+            previous = entry["t"]
+            if entry["method"] == "POST" and entry["path"] == "/_dash-update-component":
+                body = entry["body"]
+                for item in itertools.chain(body.get("inputs", []), body.get("state", [])):
+                    prop = f"{item.get('id')}.{item.get('property')}"
+                    if isinstance(item, dict) and prop in self.props:
+                        item["value"] = self.props[prop]
+                self.dispatch(body["output"], body, follow=False)
+            else:
+                label = "GET /_figures" if entry["path"].startswith("/_figures/") else f"{entry['method']} {entry['path']}"
+                self.send(label, entry["method"], entry["path"], entry.get("query"), entry.get("body"))
+
+
+def load_traces(path):
+    '''
+    recorded sessions from a trace file or a directory of them, in request order
+    '''
+    files = sorted(glob.glob(os.path.join(path, "*.jsonl"))) if os.path.isdir(path) else [path]
+    traces = []
+    for file in files:
+        with open(file, "r") as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        if entries:
+            traces.append(sorted(entries, key=lambda entry: entry["t"]))
+    return traces
+
+
+#--------------------------------------------------------------------------------------------------------
+# Load
+#--------------------------------------------------------------------------------------------------------
+def run_user(make_client, recorder, dependencies, workloads, think_scale, deadline):
+    client = make_client()
+    for _, kind, workload in itertools.cycle(workloads):
+        if time.perf_counter() >= deadline:
+            return
+        session = Session(client, recorder, dependencies, think_scale)
+        # each session replays its own copy, as replays fill in the values they got
+        workload = json.loads(json.dumps(workload)) if kind == "trace" else workload
+        session.run_trace(workload) if kind == "trace" else session.run_script(workload)
+        with recorder.lock:
+            recorder.sessions += 1
+
+
+def run_step(make_client, dependencies, workloads, users, ramp_up, duration, think_scale):
+    '''
+    run users concurrently for duration seconds, starting them over ramp_up seconds
+    '''
+    recorder = Recorder()
+    start = time.perf_counter()
+    deadline = start + duration
+    threads = []
+    for i in range(users):
+        # different users start at different points of the workload list
+        offset = i % len(workloads)
+        threads.append(threading.Thread(
+            target=run_user,
+            args=(make_client, recorder, dependencies, workloads[offset:] + workloads[:offset], think_scale, deadline),
+            daemon=True,
+            ))
+    for i, thread in enumerate(threads):
+        delay = start + ramp_up * i / users - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder, time.perf_counter() - start
+
+
+#--------------------------------------------------------------------------------------------------------
+# Report
+#--------------------------------------------------------------------------------------------------------
+def percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))]
+
+
+def summarize(recorder, elapsed, users):
+    labels = {}
+    for label, latencies in sorted(recorder.latencies.items()):
+        labels[label] = {
+            "count": len(latencies),
+            "errors": recorder.errors[label],
+            "error_rate": recorder.errors[label] / len(latencies),
+            "mean_ms": statistics.fmean(latencies),
+            **{f"p{p}_ms": percentile(latencies, p) for p in PERCENTILES},
+            "max_ms": max(latencies),
+        }
+    callbacks = [latency for label, latencies in recorder.latencies.items()
+                 if not label.startswith("GET ") and not label.endswith("(poll)") for latency in latencies]
+    errors = sum(recorder.errors.values())
+    return {
+        "users": users,
+        "elapsed_s": elapsed,
+        "sessions": recorder.sessions,
+        "requests": recorder.requests,
+        "throughput_rps": recorder.requests / elapsed,
+        "error_rate": errors / recorder.requests if recorder.requests else 0.0,
+        "callback_p50_ms": percentile(callbacks, 50) if callbacks else None,
+        "callback_p95_ms": percentile(callbacks, 95) if callbacks else None,
+        "callback_p99_ms": percentile(callbacks, 99) if callbacks else None,
+        "labels": labels,
+    }
+
+
+def print_step(summary):
+    print(f"\n{summary['users']} users: {summary['requests']} requests, {summary['sessions']} sessions "
+          f"in {summary['elapsed_s']:.1f} s, {summary['throughput_rps']:.1f} requests/s, "
+          f"{summary['error_rate']:.2%} errors")
+    print(f"  {'callback / request':<70} {'count':>6} {'err%':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for label, stats in summary["labels"].items():
+        print(f"  {label[:70]:<70} {stats['count']:>6} {stats['error_rate']:>6.1%} {stats['p50_ms']:>8.1f} "
+              f"{stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f} {stats['max_ms']:>8.1f}")
+
+
+def print_overview(steps):
+    print(f"\n{'users':>6} {'requests/s':>11} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  (callbacks)")
+    for summary in steps:
+        if summary["callback_p50_ms"] is None:
+            continue
+        print(f"{summary['users']:>6} {summary['throughput_rps']:>11.1f} {summary['error_rate']:>7.2%} "
+              f"{summary['callback_p50_ms']:>8.1f} {summary['callback_p95_ms']:>8.1f} {summary['callback_p99_ms']:>8.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the dashboard through the Dash callback protocol")
+    parser.add_argument("--url", help="server to test, e.g. http://localhost:8050 (default: app.server in process)")
+    parser.add_argument("--users", default="1,4,16", help="comma separated numbers of concurrent users, one step each")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="seconds over which the users of a step start")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds each step runs")
+    parser.add_argument("--script", action="append", choices=sorted(SCRIPTS),
+                        help="scripted session to run (default: all, unless --trace is given)")
+    parser.add_argument("--trace", help="recorded session file, or directory of them, to replay")
+    parser.add_argument("--think-scale", type=float, default=1.0,
+                        help="multiplier of the think times between user actions, 0 for none")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    if args.url:
+        make_client = lambda: HttpClient(args.url)
+    else:
+        import app  # registers the pages
+
+        make_client = lambda: LocalClient(app.server)
+
+    workloads = [(args.trace, "trace", trace) for trace in load_traces(args.trace)] if args.trace else []
+    if args.script or not args.trace:
+        workloads += [(name, "script", SCRIPTS[name]) for name in (args.script or sorted(SCRIPTS))]
+    if not workloads:
+        parser.error(f"no sessions found in {args.trace}")
+
+    client = make_client()
+    client.request("GET", "/")
+    status, data = client.request("GET", "/_dash-dependencies")
+    if status != 200:
+        parser.error(f"could not load the callback dependencies: HTTP {status}")
+    dependencies = json.loads(data)
+
+    steps = []
+    for users in (int(n) for n in args.users.split(",")):
+        recorder, elapsed = run_step(
+            make_client, dependencies, workloads, users, args.ramp_up, args.duration, args.think_scale)
+        steps.append(summarize(recorder, elapsed, users))
+        print_step(steps[-1])
+    print_overview(steps)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "meta": {
+                    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "target": args.url or "in-process",
+                    "workloads": [name for name, _, _ in workloads],
+                    "ramp_up_s": args.ramp_up,
+                    "duration_s": args.duration,
+                    "think_scale": args.think_scale,
+                },
+                "steps": steps,
+            }, f, indent=2)
+    return 1 if any(step["error_rate"] > 0 for step in steps) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,422 +1,508 @@
 import dash
-from dash import dcc, html, callback_context as ctx, callback
+from dash import dcc, html, clientside_callback, ClientsideFunction, no_update
 import plotly.express as px
-import pandas as pd
-from dash.dependencies import Input, Output
-import dash_bootstrap_components as dbc
 import json
+import uuid
+from dash.dependencies import Input, Output, State
+import dash_bootstrap_components as dbc
+from utils.catalog import catalog_entry, trim_dropdown_option
+from utils.data import current_snapshot, on_reload, per_snapshot
+from utils.figcache import FigureCache, figure_patch, normalize_key
+from utils import jobs
+from utils.engine import ALL, load_datasets
+from utils.lazy import warm_up
+from utils.metrics import callback, phase, register_collector
+from utils.rendering import decimate, render_mode
 
 dash.register_page(__name__, name='Student Characteristic')
 
-dataframes = {}
-dataframe_name = None
-guidance = json.loads(open("../data/data-guidance.json", "r").read())
+DEFAULT_FILE = "ks2_national_pupil_characteristics_2016_to_2022_provisional.csv"
+
+# figure shown until a complete selection is made
+DEFAULT_SELECTION = (
+    DEFAULT_FILE,
+    "all",
+    ['All pupils', 'Ethnic minor', 'First language'],
+    ['Total', 'Known or believed to be English'],
+    "pt_mat_met_higher_standard",
+    "Total",
+    "bar",
+    "Percentage met or exceeded Maths Standard"
+    )
+
+figure_cache = FigureCache()
+
+
+@register_collector
+def figure_cache_metrics():
+    stats = figure_cache.stats()
+    labels = {"page": "student_characteristic"}
+    return [
+        ("dash_figure_cache_hits_total", "counter", "Figure cache hits", labels, stats["hits"]),
+        ("dash_figure_cache_misses_total", "counter", "Figure cache misses", labels, stats["misses"]),
+        ("dash_figure_cache_evictions_total", "counter", "Figure cache evictions", labels, stats["evictions"]),
+        ("dash_figure_cache_bytes", "gauge", "Size of the cached figure JSON", labels, stats["bytes"]),
+    ]
 
 #--------------------------------------------------------------------------------------------------------
 # Functions
 #--------------------------------------------------------------------------------------------------------
-def trim_dropdown_option(input):
-    try: 
-        return input.replace(".csv", "")\
-            .replace("_", " ")\
-            .title() 
-    except:  
-        return input 
-
 # Load CSV names for data folder
 def load_csv_names():
-    import os
     csv_names = []
-    for file in os.listdir("../data"):
-        if file.endswith(".csv") and "pupil_characteristic" in file:
+    for file in sorted(load_datasets()):
+        if "pupil_characteristic" in file:
             csv_names.append({"label": trim_dropdown_option(file), "value": file})
     return csv_names
 
-# Top-level category handler is based on filename loaded
+# Top-level category handler is based on filename loaded (see utils.catalog)
 def get_category_options(filename):
-    match filename:
-        case "ks2_national_pupil_characteristics_2016_to_2022_provisional.csv":
-            return [
-                {"label": trim_dropdown_option(col), "value": col} 
-                for col in dataframes[
-                    "ks2_national_pupil_characteristics_2016_to_2022_provisional.csv"
-                    ]["characteristic_group"].unique()]
-        case _:
-            return []
-        
-# get sub category options based on filename and category
-def get_sub_category_options(filename, categories):
-    match filename:
-        case "ks2_national_pupil_characteristics_2016_to_2022_provisional.csv":
-            return [
-                {"label": trim_dropdown_option(col), "value": col} 
-                for col in dataframes[
-                    "ks2_national_pupil_characteristics_2016_to_2022_provisional.csv"
-                    ].query(
-                        f"characteristic_group in {categories}"
-                        )["characteristic"].unique()]
-            
-        case _:
-            return []
-        
-# figure handler
+    return catalog_entry(filename)["categories"]
+
+# figure handler, for any file whose guidance names a category and sub-category
+# column (see utils.engine); incomplete selections get the default figure
 def get_figure(file, year, categories, sub_categories, metric, gender, chart_type, description):
     
-     if None not in [file, year, categories, sub_categories, metric]:
-        match file:
-            case "ks2_national_pupil_characteristics_2016_to_2022_provisional.csv":
-                query = f"characteristic_group in {categories} \
-                        and characteristic in {sub_categories} \
-                        and gender=='{gender}' \
-                        and {metric}!='x'"
-                        
-                if year != "all":
-                    query += f" and time_period=={year}"
-                
-                
-                df = dataframes[
-                    "ks2_national_pupil_characteristics_2016_to_2022_provisional.csv"
-                    ].query(query)
-                chart_title = f"{description} by year" if year == "all" else f"{description} for Academic Year: {year}"
-                fig = None
-                if chart_type == 'bar': 
-                    fig = px.bar(
-                        df, 
-                        x="characteristic" if year!="all" else df.time_period.astype('string'),
-                        y=metric,
-                        barmode='group',
-                        title=chart_title,
-                        text_auto=True,
-                        color='characteristic'
-                    )
-                    fig.update_xaxes(title_text="Year" if year=="all" else "Characteristic",
-                                 type="category",
-                                 
-                                 )
-                    fig.update_layout(
-                        xaxis = dict(
-                            tickmode = 'array',
-                            tickvals = [201516, 201617, 201718, 201819, 201920, 202021, 202122],
-                            ticktext = ['2015-16','2016-17', '2017-18', '2018-19', '2019-20', '2020-21', '2021-22']
-                            )
-                    )
-                
-                elif chart_type == 'line' and year == "all":
-                    fig = px.line(
-                        df,
-                        x=df.time_period.astype('string'),
-                        y=metric,
-                        title=chart_title,
-                        color="characteristic"
-                        )
-                    fig.update_xaxes(title_text="Year")
-                    fig.update_layout(
-                        xaxis = dict(
-                            tickmode = 'array',
-                            tickvals = [201617, 201718, 201819, 201920, 202021, 202122],
-                            ticktext = ['2016-17', '2017-18', '2018-19', '2019-20', '2020-21', '2021-22']
-                            )
-                    )
+     dataset = load_data()["datasets"].get(file)
+     if None in [file, year, categories, sub_categories, metric] or dataset is None:
+        return get_figure(*DEFAULT_SELECTION)
 
-                else:
-                    fig = px.scatter(
-                        df,
-                        x="characteristic",
-                        y=metric,
-                        title=chart_title,
-                        text=metric,
-                        color="characteristic"
-                        )
-                    fig.update_traces(textposition='top center')
-                    fig.update_xaxes(title_text="Characteristic")
-                    
-                fig.update_yaxes(type="linear", autotypenumbers='convert types', visible=False)
-                return fig
-            case _:
-                return get_figure(
-                        "ks2_national_pupil_characteristics_2016_to_2022_provisional.csv",
-                        "all",
-                        ['All pupils', 'Ethnic minor', 'First language'],
-                        ['Total', 'Known or believed to be English'],
-                        "pt_mat_met_higher_standard", 
-                        "Total", 
-                        "bar"
+     category, sub_category = dataset.schema.categories[:2]
+     with phase("select"):
+        selection = {
+            category: categories,
+            sub_category: sub_categories,
+            "gender": gender,
+            "time_period": ALL if year == "all" else year,
+        }
+        df = dataset.select(selection, columns=[category, sub_category, "time_period", metric])
+        # rows the file marks as not available; other suppressed values are gaps
+        df = df[dataset.markers(metric, df) != 'x']
+        # one trace per sub-category, or per category and sub-category where a
+        # sub-category is under several selected categories (e.g. a score of each subject)
+        series = sub_category
+        if (df.groupby(sub_category, observed=True)[category].nunique() > 1).any():
+            series = f"{trim_dropdown_option(category)} / {trim_dropdown_option(sub_category)}"
+            df = df.assign(**{series: df[category].astype(str) + ": " + df[sub_category].astype(str)})
+
+     with phase("figure"):
+        chart_title = f"{description} by year" if year == "all" else f"{description} for Academic Year: {year}"
+        sub_category_title = trim_dropdown_option(sub_category)
+        fig = None
+        if chart_type == 'bar': 
+            fig = px.bar(
+                df, 
+                x=sub_category if year!="all" else df.time_period.astype('string'),
+                y=metric,
+                barmode='group',
+                title=chart_title,
+                text_auto=True,
+                color=series
+            )
+            fig.update_xaxes(title_text="Year" if year=="all" else sub_category_title,
+                         type="category",
+                     
+                         )
+            fig.update_layout(
+                xaxis = dict(
+                    tickmode = 'array',
+                    tickvals = [201516, 201617, 201718, 201819, 201920, 202021, 202122],
+                    ticktext = ['2015-16','2016-17', '2017-18', '2018-19', '2019-20', '2020-21', '2021-22']
                     )
-     else:
-        return get_figure(
-                        "ks2_national_pupil_characteristics_2016_to_2022_provisional.csv",
-                        "all",
-                        ['All pupils', 'Ethnic minor', 'First language'],
-                        ['Total', 'Known or believed to be English'],
-                        "pt_mat_met_higher_standard", 
-                        "Total", 
-                        "bar",
-                        "Percentage met or exceeded Maths Standard"
+            )
+    
+        elif chart_type == 'line' and year == "all":
+            df = decimate(df, "time_period", metric, by=series)
+            fig = px.line(
+                df,
+                x=df.time_period.astype('string'),
+                y=metric,
+                title=chart_title,
+                color=series,
+                render_mode=render_mode(len(df))
+                )
+            fig.update_xaxes(title_text="Year")
+            fig.update_layout(
+                xaxis = dict(
+                    tickmode = 'array',
+                    tickvals = [201617, 201718, 201819, 201920, 202021, 202122],
+                    ticktext = ['2016-17', '2017-18', '2018-19', '2019-20', '2020-21', '2021-22']
                     )
+            )
+
+        else:
+            fig = px.scatter(
+                df,
+                x=sub_category,
+                y=metric,
+                title=chart_title,
+                text=metric,
+                color=series,
+                render_mode=render_mode(len(df))
+                )
+            fig.update_traces(textposition='top center')
+            fig.update_xaxes(title_text=sub_category_title)
+        
+        fig.update_yaxes(type="linear", autotypenumbers='convert types', visible=False)
+     return fig
+
+# arguments of get_figure for a selection, with every incomplete selection mapped to
+# the default figure and the description looked up from the metric, so selections
+# that render the same figure get the same arguments
+def get_figure_args(file, year, categories, sub_categories, metric, gender, chart_type):
+    if None in [file, year, categories, sub_categories, metric] or file not in load_data()["datasets"]:
+        args = DEFAULT_SELECTION
+    else:
+        description = catalog_entry(file)["descriptions"].get(metric, "")
+        args = (file, year, categories, sub_categories, metric, gender, chart_type, description)
+    return normalize_key(*args)
 
 # get metric options from file
 def get_metric_options(filename):
-    match filename:
-        case "ks2_national_pupil_characteristics_2016_to_2022_provisional.csv":
-            return [
-                {"label": trim_dropdown_option(col), "value": col} 
-                for col in dataframes[
-                    "ks2_national_pupil_characteristics_2016_to_2022_provisional.csv"
-                    ].columns if (col.startswith("pt_") or col.startswith("t_"))]
-        case _:
-            return []
+    return catalog_entry(filename)["metrics"]
+
+# get year options from file
+def get_year_options(filename):
+    return catalog_entry(filename)["years"]
+
 #--------------------------------------------------------------------------------------------------------
 # Iniitalization
 #--------------------------------------------------------------------------------------------------------
 
-# Load CSV names
-filenames = load_csv_names()
+# Load the data frames on first use rather than at import (see utils.lazy), and again
+# for each new data snapshot (see utils.data.reload)
+@warm_up
+@per_snapshot
+def load_data(snapshot):
+    # Load CSV names
+    filenames = load_csv_names()
+
+    # Datasets (frames, schema and compiled selections) are shared with the other
+    # pages, see utils.engine
+    datasets = load_datasets()
+    return {"filenames": filenames, "datasets": {f["value"]: datasets[f["value"]] for f in filenames}}
+
 
-# Load data frames
-for filename in filenames:
-    dataframes[filename["value"]] = pd.read_csv("../data/" + filename["value"])
+# the cache key of the figure for get_figure_args; the file's hash is part of it, so
+# figures of a replaced release never match
+def figure_key(args):
+    return args + (current_snapshot().hashes.get(args[0]),)
+
+# the cache key of a figure from its JSON form in the 'graph-*' stores
+def stored_key(stored):
+    return tuple(tuple(part) if isinstance(part, list) else part for part in stored)
+
+# JSON of a built figure, from this worker's cache or from those built by background jobs
+def cached_figure(key):
+    text = figure_cache.get(key)
+    if text is None:
+        text = jobs.results.get(jobs.result_key(key))
+        if text is not None:
+            figure_cache.put(key, text)
+    return text
+
+# Every visitor first sees the default figure, so have it cached before they come
+@warm_up
+def build_default_figure():
+    args = normalize_key(*DEFAULT_SELECTION)
+    build_args = [list(arg) if isinstance(arg, tuple) else arg for arg in args]
+    figure_cache.get_figure(figure_key(args), lambda: get_figure(*build_args))
+
+# Drop the cached figures built from files that changed (the first part of their key,
+# see update_graph)
+@on_reload
+def invalidate_figures(changed):
+    figure_cache.invalidate(lambda key: key[0] in changed)
 
 #--------------------------------------------------------------------------------------------------------
 # layout
 #--------------------------------------------------------------------------------------------------------
 
-layout = dbc.Container([
-    html.Div([
-        dcc.Markdown('## Education Statistics by Student Characteristic'),
-        dcc.Graph(id='graph')]),
-    dbc.Row([
-        dbc.Col(
+def layout(**kwargs):
+    return dbc.Container([
+        html.Div([
+            dcc.Markdown('## Education Statistics by Student Characteristic'),
+            dbc.Progress(id='graph-progress', value=0, striped=True, animated=True, style={'display': 'none'}),
+            dcc.Graph(id='graph'),
+            # cache key of the figure the graph is showing; a figure not cached yet is
+            # built by a background job, and the id of a cancelled job, see update_graph
+            dcc.Store(id='graph-selection'),
+            dcc.Store(id='graph-wanted'),
+            dcc.Store(id='graph-job'),
+            dcc.Store(id='graph-rendered'),
+            # catalog entry of the selected file, see update_selector_options
+            dcc.Store(id='selector-options')]),
+        dbc.Row([
+            dbc.Col(
+                    dcc.Dropdown(
+                        id='file-selector',
+                        options=load_data()["filenames"],
+                        placeholder="Select a Data Set...",
+                        )
+            ),
+            dbc.Col(
+                    html.P(children="", id = 'file-selector-description')
+                )]),
+        dbc.Row([
+            dbc.Col(
                 dcc.Dropdown(
-                    id='file-selector',
-                    options=filenames,
-                    placeholder="Select a Data Set...",
-                    )
-        ),
-        dbc.Col(
-                html.P(children="", id = 'file-selector-description')
-            )]),
-    dbc.Row([
-        dbc.Col(
-            dcc.Dropdown(
-                id='year-selector' ,
-                placeholder='Select a Year...',
-                style={"display": "none"}
+                    id='year-selector' ,
+                    placeholder='Select a Year...',
+                    style={"display": "none"}
+                    ),
                 ),
+            dbc.Col(
+                    html.P(children="", id = 'year-description')
+                )
+            ]),
+        dbc.Row([
+            dbc.Col(
+                dcc.Dropdown(
+                    id='category-selector', 
+                    placeholder="Select a category...",
+                    style={'display': 'none'},
+                    multi=True
+                    )
             ),
-        dbc.Col(
-                html.P(children="", id = 'year-description')
-            )
-        ]),
-    dbc.Row([
-        dbc.Col(
-            dcc.Dropdown(
-                id='category-selector', 
-                placeholder="Select a category...",
-                style={'display': 'none'},
-                multi=True
+            dbc.Col(
+                    html.P(children="", id='category-selector-description')
                 )
-        ),
-        dbc.Col(
-                html.P(children="", id='category-selector-description')
-            )
  
-        ]),
-    dbc.Row([
-        dbc.Col(
-            dcc.Dropdown(
-                id='sub-category-selector',
-                placeholder="Select a sub-category...",
-                style={'display': 'none'},
-                multi=True
-            )
-        ),
-        dbc.Col(
-                html.P(id = "sub-category-description", children="")
-            )
-    ]),
-    dbc.Row([
-        dbc.Col(
-            dcc.Dropdown(
-                id='metric-selector',
-                placeholder="Select a metric...",
-                style={'display': 'none'}
+            ]),
+        dbc.Row([
+            dbc.Col(
+                dcc.Dropdown(
+                    id='sub-category-selector',
+                    placeholder="Select a sub-category...",
+                    style={'display': 'none'},
+                    multi=True
                 )
-        ),
-        dbc.Col(
-                html.P(id='metric-description', children ='')
-            )
-    ]),
-    dbc.Row([
-        dbc.Col([
-            html.P("Select gender: "),
-            dcc.Dropdown(
-                id='gender-selector',
-                options=[
-                    {'label': " All", 'value': "Total"},
-                    {'label': " Male", 'value': "Boys"},
-                    {'label': " Female", 'value': "Girls"},
-                    ],
-                value='Total'
+            ),
+            dbc.Col(
+                    html.P(id = "sub-category-description", children="")
                 )
         ]),
-        dbc.Col([
-            html.P("Select chart type:"),
-            dcc.Dropdown(
-                id='chart-type-selector',
-                options=[
-                    {'label': " Line Chart", 'value': "line"},
-                    {'label': " Bar Chart", 'value': "bar"},
-                    ],
-                value='bar'
-            )
-        ]),
-        dbc.Col(),
-        dbc.Col()
+        dbc.Row([
+            dbc.Col(
+                dcc.Dropdown(
+                    id='metric-selector',
+                    placeholder="Select a metric...",
+                    style={'display': 'none'}
+                    )
+            ),
+            dbc.Col(
+                    html.P(id='metric-description', children ='')
+                )
         ]),
-        html.P(),
-        html.P("Note: data was not widely collected during the 2019-20 and 2020-21 academic years due to covid"),
-    ])  
+        dbc.Row([
+            dbc.Col([
+                html.P("Select gender: "),
+                dcc.Dropdown(
+                    id='gender-selector',
+                    options=[
+                        {'label': " All", 'value': "Total"},
+                        {'label': " Male", 'value': "Boys"},
+                        {'label': " Female", 'value': "Girls"},
+                        ],
+                    value='Total'
+                    )
+            ]),
+            dbc.Col([
+                html.P("Select chart type:"),
+                dcc.Dropdown(
+                    id='chart-type-selector',
+                    options=[
+                        {'label': " Line Chart", 'value': "line"},
+                        {'label': " Bar Chart", 'value': "bar"},
+                        ],
+                    value='bar'
+                )
+            ]),
+            dbc.Col(),
+            dbc.Col()
+            ]),
+            html.P(),
+            html.P("Note: data was not widely collected during the 2019-20 and 2020-21 academic years due to covid"),
+        ])  
 
 
 #--------------------------------------------------------------------------------------------------------
 # callbacks
 #--------------------------------------------------------------------------------------------------------
 
-# Callback to show file description
+# The selector cascade runs clientside (assets/selectors.js) from the catalog entry of
+# the selected file in the 'selector-options' store, only that entry, the sub-category
+# options and the graph need the server
+
+# Callback to send the selected file's options and descriptions to the browser
 @callback(
-    Output('file-selector-description', 'children'), 
+    Output('selector-options', 'data'),
     Input('file-selector', 'value')
     )
-def populate_file_description(value):
-    if value == None:
-        return [""]
+def update_selector_options(file):
+    if file not in load_data()["datasets"]:
+        return None
+    return catalog_entry(file)
 
-    return [guidance[value]["summary"]]
+# Callback to show file description
+clientside_callback(
+    ClientsideFunction(namespace='selectors', function_name='populate_file_description'),
+    Output('file-selector-description', 'children'),
+    Input('selector-options', 'data')
+    )
 
 # Callback to populate category description
-@callback(
+clientside_callback(
+    ClientsideFunction(namespace='selectors', function_name='populate_category_description'),
     Output('category-selector-description', 'children'),
-     Input('year-selector', 'value')
+    Input('year-selector', 'value'),
+    State('selector-options', 'data')
     )
-def populate_category_description(file):
-    if file == None:
-        return ""
-    else:
-        return "The characteristic group(s) of children"
 
 # Callback to update the metric description
-@callback(
+clientside_callback(
+    ClientsideFunction(namespace='selectors', function_name='populate_metric_description'),
     Output('metric-description', 'children'),
     [Input('metric-selector', 'value'),
-     Input('file-selector', 'value')]
-    )
-def populate_metric_description(value, filename):
-    if value == None:
-        return ""
-    else:
-        return guidance[filename][value]
-# Callack to update the year selector visibility
-@callback(
-    [Output('year-selector', 'style'),
-    Output('year-description', 'children')],
-    Input('file-selector', 'value')
+     Input('selector-options', 'data')]
     )
-def update_year_selector_visibility(value):
-    if value is None:
-        return {"display": "none"}, ""
-    else:
-        return {"display": "block"}, "Academic year"
 
-# callback to update the year selector options
-@callback(
-    Output('year-selector', 'options'),
-    Input('file-selector', 'value')
-    )
-def update_year_selector_options(value):
-    if value is None:
-        return []
-    else:
-        return [{"label": "All available years", "value": "all"}] + [
-            {"label": str(year)[0:4] + "-" + str(year)[4:], "value": year} 
-            for year in dataframes[value]["time_period"].unique()]
-        
-# Callback to update the category options visibility
-@callback(
-    Output('category-selector', 'style'),
-    Input('year-selector', 'value')
+# Callback to update the year selector visibility and options
+clientside_callback(
+    ClientsideFunction(namespace='selectors', function_name='update_year_selector'),
+    [Output('year-selector', 'style'),
+     Output('year-description', 'children'),
+     Output('year-selector', 'options')],
+    Input('selector-options', 'data')
     )
-def update_category_visibility(value):
-    if value is None:
-        return {'display': 'none'}
-    return {'display': 'block'}
 
-# Callback to update the category options
-@callback(
-    Output('category-selector', 'options'),
-    Input('file-selector', 'value')
+# Callback to update the category options and their visibility
+clientside_callback(
+    ClientsideFunction(namespace='selectors', function_name='update_category_selector'),
+    [Output('category-selector', 'style'),
+     Output('category-selector', 'options')],
+    [Input('year-selector', 'value'),
+     Input('selector-options', 'data')]
     )
-def update_column_options(value):
-    if value is None:
-        return []
-    return get_category_options(value)
-
 
 # Callback to update the sub-category options visibility
-@callback(
+clientside_callback(
+    ClientsideFunction(namespace='selectors', function_name='update_sub_column_visibility'),
     [Output('sub-category-selector', 'style'),
      Output('sub-category-description', 'children')],
     Input('category-selector', 'value'),
+    State('selector-options', 'data')
     )
-def update_sub_column_visibility(value):
-    if value is None:
-        return {'display': 'none'}, ""
-    return {'display': 'block'}, "The Characteristic(s)"
 
 # Callback to update the sub-category options
-@callback(
+clientside_callback(
+    ClientsideFunction(namespace='selectors', function_name='update_sub_category_options'),
     Output('sub-category-selector', 'options'),
     [Input('category-selector', 'value'),
-     Input('file-selector', 'value')]
+     Input('selector-options', 'data')]
     )
-def update_sub_category_options(category, file):
-    if category is None:
-        return []
-    if 'file-selector' in ctx.triggered:
-        return []
-    
-    return get_sub_category_options(file, category)
 
 # Callback to update the metric selector visibility and options
-@callback(
+clientside_callback(
+    ClientsideFunction(namespace='selectors', function_name='update_metric_selector'),
     [Output('metric-selector', 'style'),
      Output('metric-selector', 'options')],
-     [Input('sub-category-selector', 'value'),
-      Input('file-selector', 'value')]
-     )
-def update_metric_selector(sub_category, file):
-    if sub_category is None:
-        return {'display': 'none'}, []
-    if 'file-selector' in ctx.triggered:
-        return {'display': 'none'}, []
-    
-    return {'display': 'block'}, get_metric_options(file)
-     
+    [Input('sub-category-selector', 'value'),
+     Input('selector-options', 'data')]
+    )
 
 
 # Callback to update the graph
+#
+# The metric description is looked up from the metric rather than being an input, so
+# picking a metric renders once instead of again when its description arrives. The
+# key of the figure being shown is kept in 'graph-selection': a cascade of selector
+# changes that ends on the same figure sends nothing, and a change that keeps the
+# traces (e.g. gender or metric) sends a Patch of the attributes that differ.
+#
+# Figures that are not cached yet are not built here: the selection goes to
+# 'graph-job' and render_graph builds it in a background job (see utils.jobs), so a
+# worker is not held up by a figure that the next selection may make useless. A newer
+# job replaces a running one; a selection shown without one (from the cache, or the
+# figure already shown) cancels it by writing its id to 'graph-wanted', and only then.
 @callback(
-    Output('graph', 'figure'),
+    [Output('graph', 'figure'),
+     Output('graph-selection', 'data'),
+     Output('graph-wanted', 'data'),
+     Output('graph-job', 'data')],
     [Input('file-selector', 'value'),
      Input('year-selector', 'value'),
      Input('category-selector', 'value'),
      Input('sub-category-selector', 'value'),
      Input('metric-selector', 'value'),
      Input('gender-selector', 'value'),
-     Input('chart-type-selector', 'value'),
-     Input('metric-description', 'children')
-    ]
+     Input('chart-type-selector', 'value')],
+    [State('graph-selection', 'data'),
+     State('graph-job', 'data'),
+     State('graph-wanted', 'data')]
     
     )
-def update_graph(file, year, categories, sub_categories, metric, gender, chart_type, description):
-    return get_figure(file, year, categories, sub_categories, metric, gender, chart_type, description)
+def update_graph(file, year, categories, sub_categories, metric, gender, chart_type, shown, job, cancelled):
+    key = figure_key(get_figure_args(file, year, categories, sub_categories, metric, gender, chart_type))
+    stored = json.loads(json.dumps(key))
+    # the job still building a figure other than the one shown, if any
+    running = job is not None and job["key"] != shown and job["id"] != cancelled
+    cancel = job["id"] if running else no_update
+    if shown == stored:
+        return no_update, no_update, cancel, no_update
+
+    text = cached_figure(key)
+    if text is None:
+        # a new id per job, so two sessions asking for the same figure get a job each
+        return no_update, no_update, no_update, {"key": stored, "id": uuid.uuid4().hex}
+    figure = json.loads(text)
+
+    if shown is not None:
+        previous = cached_figure(stored_key(shown))
+        if previous is not None:
+            with phase("patch"):
+                patch = figure_patch(json.loads(previous), figure)
+            if patch is not None:
+                return patch, stored, cancel, no_update
+    return figure, stored, cancel, no_update
+
+
+# Background job building a figure that update_graph did not have. A newer job
+# terminates this one, and so does a selection shown without a job ('graph-wanted'
+# changes); a result arriving after that is dropped by graphs.show_rendered.
+@callback(
+    Output('graph-rendered', 'data'),
+    Input('graph-job', 'data'),
+    background=True,
+    manager=jobs.manager,
+    interval=jobs.JOB_INTERVAL,
+    progress=[Output('graph-progress', 'value'),
+              Output('graph-progress', 'label')],
+    progress_default=[0, ""],
+    running=[(Output('graph-progress', 'style'), {}, {'display': 'none'})],
+    cancel=[Input('graph-wanted', 'data')],
+    prevent_initial_call=True
+    )
+def render_graph(set_progress, job):
+    stored = job["key"]
+    key = stored_key(stored)
+    build_args = list(stored[:-1])
+    set_progress((10, "Building chart"))
+    figure = get_figure(*build_args)
+    set_progress((70, "Sending chart"))
+    text = figure.to_json()
+    jobs.results.set(jobs.result_key(key), text)
+    set_progress((100, ""))
+    return {"key": stored, "id": job["id"], "figure": json.loads(text)}
+
 
+# Show a figure built by render_graph, unless its job was replaced or cancelled since
+clientside_callback(
+    ClientsideFunction(namespace='graphs', function_name='show_rendered'),
+    [Output('graph', 'figure', allow_duplicate=True),
+     Output('graph-selection', 'data', allow_duplicate=True)],
+    Input('graph-rendered', 'data'),
+    [State('graph-job', 'data'),
+     State('graph-wanted', 'data')],
+    prevent_initial_call=True
+    )
@@ -1,323 +1,143 @@
 import dash
-from dash import dcc, html, callback, Output, Input
-import plotly.express as px
+from dash import dcc, html, clientside_callback, ClientsideFunction, Output, Input, get_relative_path
 import dash_bootstrap_components as dbc
-import plotly.graph_objs as go
 import plotly.io as pio
-import pandas as pd
+from utils.artifacts import artifact_url, load_figure
+from utils.data import per_snapshot
+from utils.lazy import warm_up
 pio.templates.default = "simple_white"
 
 dash.register_page(__name__, path='/', name='Overview') # '/' is home page
 
-# chart one
-figchart1 = go.Figure(
-    data=[go.Scatter(y=[70, 75, 75, 79, 76.33, 73.66, 71], x=[2016, 2017, 2018, 2019, 2020, 2021, 2022])],
-    layout=go.Layout(
-        title=go.layout.Title(text="Percentage of pupils meeting expected standard in math")
-        )
-    )
-
-figchart1.update_layout(
-    xaxis_title="Data Source: Key stage 2 attainment: National headlines (England, all schools)",
-    height=530,
-    title={
-        'y':0.9,
-        'x':0.5,
-        'xanchor': 'center',
-        'yanchor': 'top',
-        'font_color': '#5E5E5E',
-        }
-    )
-
-dot_opacity= [1, 1, 1, 1, 0, 0, 1]
-
-figchart1.update_xaxes(title_font=dict(size=12, color='#A4A5A5'), linecolor='#7D7D7D', ticks="", color='#7D7D7D')
-figchart1.update_yaxes(linecolor='#7D7D7D', ticks="", color='#7D7D7D', range=[65, 85])
-figchart1.update_traces(line=dict(color="#356CB0", width=3), marker=dict(size=10, opacity=dot_opacity))
-
-
-# chart two
-figchart2 = go.Figure(
-    data=[go.Scatter(
-        y=[3.43, 3.23, 3.16, 3.15, 3.10, 3.03, 3.00, 2.90, 2.91, 3.01, 3.11, 3.21], 
-        x=[2011, 2012, 2013, 2014, 2015, 2016, 2017, 2018, 2019, 2020, 2021, 2022])
-        ],
-    layout=go.Layout(
-        title=go.layout.Title(text="Disadvantaged gap index")
-        )
-    )
-
-figchart2.update_layout(
-    xaxis_title="Data Source: Key stage 2 disadvantage gap index (England, state-funded schools)",
-    height=530,
-    title={
-        'y':0.9,
-        'x':0.5,
-        'xanchor': 'center',
-        'yanchor': 'top',
-        'font_color': "#5E5E5E",
-        }
+# prebuilt by build.py, see components/overview.py; the browser fetches them from
+# these URLs (see assets/figures.js) and caches them
+@warm_up
+@per_snapshot
+def load_figures(snapshot):
+    return (
+        artifact_url("overview-math"),
+        artifact_url("overview-subjects"),
+        artifact_url("overview-gap-index"),
+        artifact_url("overview-gender"),
     )
 
-dot_opacity= [1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 1]
-
-figchart2.update_xaxes(title_font=dict(size=12, color='#A4A5A5'), linecolor='#7D7D7D', ticks="", color='#7D7D7D')
-figchart2.update_yaxes(linecolor='#7D7D7D', ticks="", color='#7D7D7D', range=[2.6, 3.6])
-figchart2.update_traces(line=dict(color="#356CB0", width=3), marker=dict(size=10, opacity=dot_opacity))
 
-# chart three
+# tiles and footnotes computed from the data (see utils.headlines), read from the
+# persisted artifact once per data snapshot
+@warm_up
+@per_snapshot
+def load_headlines(snapshot):
+    return load_figure("overview-headlines")
 
-# science
-figchart3 = go.Figure(
-    data=[go.Scatter(
-        y=[81, 82, 82, 83, 81.7, 80.4, 79], 
-        x=[2016, 2017, 2018, 2019, 2020, 2021, 2022], 
-        name="Science", 
-        line=dict(color="#EE8636")
-        )
-    ],
-    layout=go.Layout(
-        title=go.layout.Title(text="Percentage of pupils meeting expected standard by subject")
-        )
-    )
 
-# math
-figchart3.add_trace(
-    go.Scatter(
-        y=[70, 75, 75, 79, 76.33, 73.66, 71], 
-        x=[2016, 2017, 2018, 2019, 2020, 2021, 2022], 
-        name="Math",
-        line=dict(color="#356CB0")
-        )
+def tile_box(tile, className):
+    return html.Div(
+        [
+            html.Div(tile["text"],
+            className="figure-text1"
+            ),
+            html.Div(tile["value"],
+            className="figure-text2"
+            )
+        ], className=className
     )
 
-# writing
-figchart3.add_trace(
-    go.Scatter(
-        y=[74, 76, 78, 78, 75, 72, 69], 
-        x=[2016, 2017, 2018, 2019, 2020, 2021, 2022], 
-        name="Writing",
-        line=dict(color="#529E3E")
-        )
-    )
 
-# grammar
-figchart3.add_trace(
-    go.Scatter(
-        y=[73, 77, 78, 78, 76, 74, 72], 
-        x=[2016, 2017, 2018, 2019, 2020, 2021, 2022], 
-        name="Grammar", 
-        line=dict(color="#7D7D7D"),
-        visible='legendonly'
+def tile_groups(tiles):
+    '''
+    the tiles in columns of two
+    '''
+    return [
+        html.Div(
+            [tile_box(tile, className) for tile, className in zip(tiles[i:i + 2], ["figures-box-top", "figures-box-bottom"])],
+            className="figures-group"
         )
-    )
-
-figchart3.update_layout(
-    xaxis_title="Data Source: Key stage 2 attainment: National headlines (England, all schools)",
-    height=530,
-    title={
-        'y':0.9,
-        'x':0.5,
-        'xanchor': 'center',
-        'yanchor': 'top',
-        'font_color': "#5E5E5E",
-        }
-    )
-
-figchart3.update_xaxes(title_font=dict(size=12, color='#A4A5A5'), linecolor='#7D7D7D', ticks="", color='#7D7D7D')
-figchart3.update_yaxes(linecolor='#7D7D7D', ticks="", color='#7D7D7D', range=[65, 85])
-figchart3.update_traces(line=dict(width=3), marker=dict(opacity=0))
+        for i in range(0, len(tiles), 2)
+    ]
 
-# chart four
 
-figchart4 = go.Figure(
-    data=[
-        go.Bar(
-            name='Boys', 
-            x=["Meeting Expected Standard", "Reaching Higher Standard", "Not Meeting Expected Standard"],
-            y=[-5.2, -3, 3.8],
-            text=['-5.2%', '-3%', '3.8%'],
-            textposition='auto',
-            marker_color="#356CB0"
+def footnotes(headlines):
+    notes = [f"* When compared to {headlines['baseline_year']} levels"]
+    if not all(tile["relative"] for tile in headlines["tiles"]):
+        notes.append("* pp: percentage points, the difference between two percentages")
+    if headlines["missing_years"]:
+        years = " or ".join(str(year) for year in headlines["missing_years"])
+        notes.append(f"* No assessments were conducted in {years} (due to school closures)")
+    return [html.Div(note, className="text3") for note in notes]
+
+
+def layout(**kwargs):
+    urls = [get_relative_path(url) for url in load_figures()]
+    headlines = load_headlines()
+    return html.Div(
+        [
+            dcc.Store(id='overview-figure-urls', data=urls),
+            dbc.Row(
+                [
+                    html.Div(
+                        [
+                            html.Div('Education Statistics Overview', 
+                            className="title"),
+                            *tile_groups(headlines["tiles"]),
+                            *footnotes(headlines)
+                        ]
+                    )
+                ]
             ),
-        go.Bar(
-            name='Girls', 
-            x=["Meeting Expected Standard", "Reaching Higher Standard", "Not Meeting Expected Standard"],
-            y=[-8.1, -3.3, 6.6],
-            text=['-8.1%', '-3.3%', '6.6%'],
-            textposition='auto',
-            marker_color="#529E3E"
+            dbc.Row(
+                [
+                    html.Div(
+                        [
+                            html.Div(
+                                [
+                                    dcc.Graph(
+                                        id='g1'
+                                    )
+                                ], className="chart"
+                            ),
+                            html.Div(
+                                [
+                                    dcc.Graph(
+                                        id='g2'
+                                    ),
+                                ], className="chart"
+                            ),
+                        ], className="charts"
+                    )
+                ]
+            ),
+            dbc.Row(
+                [
+                    html.Div(
+                        [
+                            html.Div(
+                                [
+                                    dcc.Graph(
+                                        id='g3'
+                                    )
+                                ], className="chart"
+                            ),
+                            html.Div(
+                                [
+                                    dcc.Graph(
+                                        id='g4'
+                                    )
+                                ], className="bar-graph"
+                            ),
+                        ],
+                    )
+                ]
             )
-        ],
-    layout=go.Layout(
-        title=go.layout.Title(text="Percentage Change in Math Scores by Gender")
-        )
+        ]
     )
 
-figchart4.update_layout(
-    xaxis_title="Data Source: Key stage 2 attainment by pupil characteristics (England, all schools)",
-    height=516,
-    barmode='group',
-    title={
-        'y':0.9,
-        'x':0.5,
-        'xanchor': 'center',
-        'yanchor': 'top',
-        'font_color': '#5E5E5E',
-        }
-    )
 
-figchart4.update_xaxes(
-    title_font=dict(size=12, 
-    color='#A4A5A5'), 
-    linecolor='#7D7D7D', 
-    ticks="", 
-    color='#7D7D7D',
-    tickmode='array',
-    tickvals=[0,1,2,3],
-    ticktext=["Meeting Expected</br></br>Standard", "Reaching Higher</br></br>Standard", "Not Meeting</br></br>Expected Standard"]
+# Fetch the prebuilt figures
+clientside_callback(
+    ClientsideFunction(namespace='figures', function_name='fetch_all'),
+    [Output('g1', 'figure'),
+     Output('g2', 'figure'),
+     Output('g3', 'figure'),
+     Output('g4', 'figure')],
+    Input('overview-figure-urls', 'data')
     )
-figchart4.update_yaxes(linecolor='#7D7D7D', ticks="", ticksuffix = "%", color='#7D7D7D', range=[-9, 7])
-
-
-layout = html.Div(
-    [
-        dbc.Row(
-            [
-                html.Div(
-                    [
-                        html.Div('Education Statistics Overview', 
-                        className="title"),
-                        html.Div(
-                            [
-                                html.Div(
-                                    [
-                                        html.Div("Percentage of pupils meeting expected standards in math is down",
-                                        className="figure-text1"
-                                        ),
-                                        html.Div("-8%",
-                                        className="figure-text2"
-                                        )
-                                    ], className="figures-box-top"
-                                ),
-                            html.Div(
-                                    [
-                                        html.Div("Percentage of boys not reaching expected standards in math is up",
-                                        className="figure-text1"
-                                        ),
-                                        html.Div("+3.8%",
-                                        className="figure-text2"
-                                        )
-                                    ], className="figures-box-bottom"
-                                )
-                            ], className="figures-group"
-                        ),
-                        html.Div(
-                            [
-                                html.Div(
-                                    [
-                                        html.Div("Percentage of boys meeting expected standards in math is down",
-                                        className="figure-text1"
-                                        ),
-                                        html.Div("-5.2%",
-                                        className="figure-text2"
-                                        )
-                                    ], className="figures-box-top"
-                                ),
-                            html.Div(
-                                    [
-                                        html.Div("Percentage of girls not reaching expected standards in math is up",
-                                        className="figure-text1"
-                                        ),
-                                        html.Div("+6.6%",
-                                        className="figure-text2"
-                                        )
-                                    ], className="figures-box-bottom"
-                                )
-                            ], className="figures-group"
-                        ),
-                        html.Div(
-                            [
-                                html.Div(
-                                    [
-                                        html.Div("Percentage of girls meeting expected standards in math is down",
-                                        className="figure-text1"
-                                        ),
-                                        html.Div("-8.1%",
-                                        className="figure-text2"
-                                        )
-                                    ], className="figures-box-top"
-                                ),
-                            html.Div(
-                                    [
-                                        html.Div("Disadvantage gap index is up compared to non-disadvantaged pupils",
-                                        className="figure-text1"
-                                        ),
-                                        html.Div("+10%",
-                                        className="figure-text2"
-                                        )
-                                    ], className="figures-box-bottom"
-                                )
-                            ], className="figures-group"
-                        ),
-                        html.Div("* When compared to 2019 levels",
-                        className="text3"
-                        ),
-                        html.Div("* No assessments were conducted in 2020 or 2021 (due to school closures)",
-                        className="text3"
-                        )
-                    ]
-                )
-            ]
-        ),
-        dbc.Row(
-            [
-                html.Div(
-                    [
-                        html.Div(
-                            [
-                                dcc.Graph(
-                                    id='g1', 
-                                    figure=figchart1
-                                )
-                            ], className="chart"
-                        ),
-                        html.Div(
-                            [
-                                dcc.Graph(
-                                    id='g2', 
-                                    figure=figchart3
-                                ),
-                            ], className="chart"
-                        ),
-                    ], className="charts"
-                )
-            ]
-        ),
-        dbc.Row(
-            [
-                html.Div(
-                    [
-                        html.Div(
-                            [
-                                dcc.Graph(
-                                    id='g3', 
-                                    figure=figchart2
-                                )
-                            ], className="chart"
-                        ),
-                        html.Div(
-                            [
-                                dcc.Graph(
-                                    id='g4', 
-                                    figure=figchart4
-                                )
-                            ], className="bar-graph"
-                        ),
-                    ],
-                )
-            ]
-        )
-    ]
-)
-
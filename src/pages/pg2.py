@@ -1,105 +1,134 @@
 import dash
-from dash import dcc, html, callback, Output, Input
-import plotly.express as px
-import dash_bootstrap_components as dbc
-import json
-import pandas as pd
-import pickle
+from dash import dcc, html, clientside_callback, ClientsideFunction, Output, Input, State, get_relative_path
+from components.regional import AUTHORITIES_FILE, REGIONAL_FILE, region_names
+from utils.artifacts import artifact_url, load_figure, region_artifact
+from utils.data import get_dataframe, per_snapshot
+from utils.lazy import warm_up
 
 
 dash.register_page(__name__, name='Regional Data')
 
-# page 2 data
-df = px.data.tips()
-
-layout = html.Div(
-    [
-        dcc.Markdown('## UK Education System Heatmap')
-    ]
-)
-
-
-
-def horizontal_total_students(df):
-    '''
-    Plot a horizontal bar chart of the number of students who achieved expected standard in maths in each local authority
-    '''
-    df = df[df["geographic_level"] == "Local authority"]
-    df = df[df["pt_mat_met_expected_standard"] != "c"]
-    df = df[df["pt_mat_met_expected_standard"] != "x"]
-    df = df[df["gender"] == "Total"]
-    df["pt_mat_met_expected_standard"] = df["pt_mat_met_expected_standard"].astype(float)
-    df = df.sort_values(by=["time_period", "pt_mat_met_expected_standard"], ascending=True)
-    fig = px.bar(df,
-    x="pt_mat_met_expected_standard", 
-    y="la_name", 
-    orientation='h', 
-    title=None, 
-    width=400, 
-    height=600, 
-    labels={"pt_mat_met_expected_standard":"% Passing", "la_name": "Local Authority"}, 
-    color= "pt_mat_met_expected_standard", 
-    color_continuous_scale="Hot_r", 
-    range_color=[55,90], 
-    animation_frame="time_period")
-    fig.update(layout_coloraxis_showscale=False)
-    fig.update_yaxes(visible=False, showticklabels=False)
-    fig.update_xaxes(range=[0,100])
-    fig.layout.updatemenus[0].buttons[0].args[1]["frame"]["duration"] = 1000
-
-    return fig
-
-
-def plot_animation_map(df, authorities, column):
-    '''
-    generate an animation of the UK with a colour scale based on the values in the column
-
-    :param df: dataframe containing the data to be plotted
-    :param authorities: geojson containing the boundaries of the local authorities
-    :param column: the column in the dataframe to be plotted
-    :param title: the title of the plot
-    :return: None
-
-    '''
-
-    df = df[df["geographic_level"] == "Local authority"]
-    df = df[df["geographic_level"] == "Local authority"]
-    df = df[df["gender"] == "Total"]
-    df = df[df[column] != "c"]
-    df = df[df[column] != "x"]
-    df[column] = df[column].astype(float)
-    df["% Passing"] = df[column]
-
-    fig = px.choropleth_mapbox(
-    df,
-    geojson=authorities,
-    locations='la_name',
-    featureidkey="properties.CTYUA21NM",
-    color_continuous_scale="Hot_r",
-    mapbox_style="carto-positron",
-    center={"lat": 53, "lon": -1.5},
-    zoom=4.5,
-    range_color=(55,90),
-    labels=None,
-    opacity=0.5,
-    title=None,
-    color="% Passing",
-    animation_frame="time_period",
-    width=800,
-    height=550)
-    fig.layout.updatemenus[0].buttons[0].args[1]["frame"]["duration"] = 1000
-    return fig
-
-with open(r'assets\fig.pickle', 'rb') as f:
-    fig1 = pickle.load(f)
-
-df = pd.read_csv(r'..\data\ks2_regional_and_local_authority_2016_to_2022_provisional.csv', dtype={'la_name': str})
-fig2 = horizontal_total_students(df)
-
-layout = html.Div(className='row', children=[
-    html.H1("Educational Progress Based on Location over Time"),
-    html.Div(children=[
-        dcc.Graph(id="graph1", style={'display': 'inline-block'}, figure=fig1),
-        dcc.Graph(id="graph2", style={'display': 'inline-block'}, figure=fig2),
+
+# Build the prebuilt figures (see build.py) on first visit or in the warm-up thread;
+# the browser fetches the figures themselves from their URLs
+@warm_up
+@per_snapshot
+def build_figures(snapshot):
+    return artifact_url("regional-bar-race"), load_figure("regional-years")
+
+
+# the maps: England's regions, and those of a region's local authorities, fetched
+# only when the region is clicked
+@per_snapshot
+def build_maps(snapshot):
+    regions = {
+        name: artifact_url(region_artifact(code))
+        for code, name in region_names(get_dataframe(REGIONAL_FILE)).items()
+    }
+    return artifact_url("regional-map"), regions
+
+
+# no maps without the boundary file, the page then shows the bar race alone; it is
+# looked for again on every visit
+@warm_up
+def load_maps():
+    try:
+        return build_maps()
+    except FileNotFoundError:
+        return None, {}
+
+
+def layout(**kwargs):
+    url2, years = build_figures()
+    url1, regions = load_maps()
+    return html.Div(className='row', children=[
+        html.H1("Educational Progress Based on Location over Time"),
+        # values of every year, swapped into both charts client-side (see assets/regional.js)
+        dcc.Store(id="regional-years", data=years),
+        dcc.Store(id="regional-figure-urls", data=[url1 and get_relative_path(url1), get_relative_path(url2)]),
+        # England's values, restored when going back from a region
+        dcc.Store(id="regional-national-years", data=years),
+        dcc.Store(id="regional-region-urls", data={name: get_relative_path(url) for name, url in regions.items()}),
+        # name of the region shown, None for England
+        dcc.Store(id="regional-region", data=None),
+        html.Div(children=[
+            html.Button("Back to England", id="regional-back", n_clicks=0, style={'display': 'none'}),
+            html.Button("Play", id="regional-play", n_clicks=0, style={'display': 'inline-block'}),
+            html.Div(
+                dcc.Slider(
+                    id="regional-year",
+                    min=years["years"][0],
+                    max=years["years"][-1],
+                    step=None,
+                    value=years["years"][0],
+                    marks=dict(zip(years["years"], years["labels"])),
+                    ),
+                style={'display': 'inline-block', 'width': '1100px', 'verticalAlign': 'middle'}
+            ),
+            dcc.Interval(id="regional-timer", interval=1000, disabled=True),
+        ]),
+        html.Div(children=[
+            html.P(f"Boundary file not installed: add data/{AUTHORITIES_FILE} to show the map.",
+                   style={'display': 'none' if url1 else 'block'}),
+            dcc.Graph(id="graph1", style={'display': 'inline-block' if url1 else 'none'}),
+            dcc.Graph(id="graph2", style={'display': 'inline-block'}),
+        ])
     ])
-])
\ No newline at end of file
+
+
+#--------------------------------------------------------------------------------------------------------
+# callbacks
+#--------------------------------------------------------------------------------------------------------
+
+# Fetch the prebuilt figures (see assets/figures.js)
+clientside_callback(
+    ClientsideFunction(namespace='figures', function_name='fetch_all'),
+    Output('graph1', 'figure', allow_duplicate=True),
+    Output('graph2', 'figure', allow_duplicate=True),
+    Input('regional-figure-urls', 'data'),
+    prevent_initial_call='initial_duplicate'
+    )
+
+# Show the selected year in both charts
+clientside_callback(
+    ClientsideFunction(namespace='regional', function_name='show_year'),
+    Output('graph1', 'figure'),
+    Output('graph2', 'figure'),
+    Input('regional-year', 'value'),
+    State('regional-years', 'data'),
+    State('graph1', 'figure'),
+    State('graph2', 'figure'),
+    prevent_initial_call=True
+    )
+
+# Drill down into the clicked region, or back to England
+clientside_callback(
+    ClientsideFunction(namespace='regional', function_name='select_region'),
+    Output('graph1', 'figure', allow_duplicate=True),
+    Output('graph2', 'figure', allow_duplicate=True),
+    Output('regional-years', 'data'),
+    Output('regional-region', 'data'),
+    Output('regional-back', 'style'),
+    Input('graph1', 'clickData'),
+    Input('regional-back', 'n_clicks'),
+    State('regional-region', 'data'),
+    State('regional-region-urls', 'data'),
+    State('regional-figure-urls', 'data'),
+    State('regional-national-years', 'data'),
+    State('regional-year', 'value'),
+    prevent_initial_call=True
+    )
+
+# Play / pause: step the slider once per timer tick, stopping at the last year
+clientside_callback(
+    ClientsideFunction(namespace='regional', function_name='play'),
+    Output('regional-year', 'value'),
+    Output('regional-timer', 'disabled'),
+    Output('regional-play', 'children'),
+    Input('regional-play', 'n_clicks'),
+    Input('regional-timer', 'n_intervals'),
+    State('regional-year', 'value'),
+    State('regional-timer', 'disabled'),
+    State('regional-years', 'data'),
+    prevent_initial_call=True
+    )
@@ -0,0 +1,176 @@
+import dash
+from dash import dcc, html
+import plotly.graph_objects as go
+from dash.dependencies import Input, Output
+import dash_bootstrap_components as dbc
+from utils.lazy import warm_up
+from utils.metrics import callback, phase
+from utils.scores import (
+    EXPECTED_STANDARD,
+    HIGHER_STANDARD,
+    NO_SCORE,
+    load_distributions,
+    percent_at_least,
+    percent_of_pupils,
+    percentile,
+)
+
+dash.register_page(__name__, name='Scaled Scores')
+
+GENDERS = {"Total": "All", "Boys": "Male", "Girls": "Female"}
+PERCENTILES = (10, 25, 50, 75, 90)
+COLOURS = {"Total": "#636efa", "Boys": "#00cc96", "Girls": "#ef553b"}
+
+#--------------------------------------------------------------------------------------------------------
+# Functions
+#--------------------------------------------------------------------------------------------------------
+
+# selector options: the values of each key of the distribution tables
+@warm_up
+def get_options():
+    keys = list(load_distributions())
+    year, subject, gender, group = (sorted(set(values)) for values in zip(*keys))
+    return {
+        "years": [{"label": str(y)[0:4] + "-" + str(y)[4:], "value": y} for y in year],
+        "subjects": subject,
+        "genders": [{"label": GENDERS.get(g, g), "value": g} for g in gender],
+        "groups": group,
+    }
+
+
+def get_distribution_figure(distributions, threshold):
+    '''
+    share of pupils at each scaled score, one trace per gender
+
+    :param distributions: {gender: ScoreDistribution}
+    :param threshold: score marked with a vertical line
+    '''
+    fig = go.Figure()
+    for gender, distribution in distributions.items():
+        fig.add_trace(go.Bar(
+            x=distribution.scores,
+            y=percent_of_pupils(distribution),
+            name=GENDERS.get(gender, gender),
+            marker_color=COLOURS.get(gender),
+            customdata=distribution.published,
+            hovertemplate="Score %{x}: %{y:.1f}% of pupils<br>%{customdata:.0f}% at or below<extra></extra>",
+            ))
+    fig.add_vline(x=threshold - 0.5, line_dash="dash", annotation_text=f"≥ {threshold}")
+    fig.update_layout(barmode="group", legend_title_text="Gender")
+    fig.update_xaxes(title_text="Scaled score")
+    fig.update_yaxes(title_text="% of pupils")
+    return fig
+
+
+def get_summary_table(distributions, threshold):
+    '''
+    percentiles and % scoring at least the expected, higher and chosen standard
+    '''
+    header = html.Thead(html.Tr(
+        [html.Th("")] + [html.Th(GENDERS.get(gender, gender)) for gender in distributions]))
+    rows = [
+        html.Tr([html.Td(f"{p}th percentile")] + [
+            html.Td("No score" if (score := percentile(d, p)) == NO_SCORE else score)
+            for d in distributions.values()])
+        for p in PERCENTILES
+    ]
+    thresholds = sorted({EXPECTED_STANDARD, HIGHER_STANDARD, threshold})
+    rows += [
+        html.Tr([html.Td(f"% scoring {score} or more")] + [
+            html.Td(f"{percent_at_least(d, score):.1f}%") for d in distributions.values()])
+        for score in thresholds
+    ]
+    rows.append(html.Tr([html.Td("Pupils with no scaled score")] + [
+        html.Td(f"{d.no_score:,} ({100 * d.no_score / d.total:.1f}%)" if d.total else "-")
+        for d in distributions.values()]))
+    return dbc.Table([header, html.Tbody(rows)], bordered=True, size="sm")
+
+#--------------------------------------------------------------------------------------------------------
+# layout
+#--------------------------------------------------------------------------------------------------------
+
+def layout(**kwargs):
+    options = get_options()
+    return dbc.Container([
+        html.Div([
+            dcc.Markdown('## Scaled Score Distributions'),
+            dcc.Graph(id='score-graph'),
+            html.Div(id='score-summary')]),
+        dbc.Row([
+            dbc.Col([
+                html.P("Subject:"),
+                dcc.Dropdown(
+                    id='score-subject',
+                    options=options["subjects"],
+                    value="Maths" if "Maths" in options["subjects"] else options["subjects"][0],
+                    clearable=False
+                    )
+            ]),
+            dbc.Col([
+                html.P("Academic year:"),
+                dcc.Dropdown(
+                    id='score-year',
+                    options=options["years"],
+                    value=options["years"][-1]["value"],
+                    clearable=False
+                    )
+            ]),
+            dbc.Col([
+                html.P("Characteristic:"),
+                dcc.Dropdown(
+                    id='score-group',
+                    options=options["groups"],
+                    value=options["groups"][0],
+                    clearable=False
+                    )
+            ]),
+            dbc.Col([
+                html.P("Gender:"),
+                dcc.Dropdown(
+                    id='score-gender',
+                    options=options["genders"],
+                    value=["Total"],
+                    multi=True
+                    )
+            ]),
+        ]),
+        dbc.Row([
+            dbc.Col([
+                html.P("Show % scoring at least:"),
+                dcc.Slider(
+                    id='score-threshold',
+                    min=80,
+                    max=120,
+                    step=1,
+                    value=HIGHER_STANDARD,
+                    marks={score: str(score) for score in range(80, 121, 5)}
+                    )
+            ])
+        ])
+    ])
+
+#--------------------------------------------------------------------------------------------------------
+# callbacks
+#--------------------------------------------------------------------------------------------------------
+
+# Callback to update the distribution chart and its summary
+@callback(
+    [Output('score-graph', 'figure'),
+     Output('score-summary', 'children')],
+    [Input('score-subject', 'value'),
+     Input('score-year', 'value'),
+     Input('score-group', 'value'),
+     Input('score-gender', 'value'),
+     Input('score-threshold', 'value')]
+    )
+def update_scores(subject, year, group, genders, threshold):
+    with phase("select"):
+        tables = load_distributions()
+        distributions = {
+            gender: tables[(year, subject, gender, group)]
+            for gender in GENDERS if gender in (genders or []) and (year, subject, gender, group) in tables
+        }
+    if not distributions:
+        return go.Figure(), html.P("No data for this selection.")
+    with phase("figure"):
+        return get_distribution_figure(distributions, threshold), get_summary_table(distributions, threshold)
@@ -0,0 +1,121 @@
+'''
+Production entry point: a preforking gunicorn server for the dashboard
+
+Every dataset and prebuilt figure is loaded once in the master process, then the
+workers are forked from it and share those pages copy-on-write instead of each
+loading a private copy. gc.freeze() keeps the garbage collector from touching (and
+so copying) the shared objects in the workers.
+
+usage (from src/, after python build.py):
+    python serve.py --workers 4 --threads 4 --bind 0.0.0.0:8050
+
+The worker and thread counts default to the WEB_CONCURRENCY and THREADS environment
+variables. Workers are threaded (gthread): without THREADS each gets CALLBACK_THREADS
+threads besides its EXPORT_SLOTS export threads (see utils.export), so streaming
+downloads never hold every thread that serves callbacks, and --threads must leave
+at least one. The WSGI application is also exposed as app:server for other servers,
+e.g. gunicorn --preload app:server
+
+New data releases dropped into the data folder are picked up without a restart (see
+utils.watcher), and still shared: the master watches the data folder and, when it
+changes, sends itself SIGHUP. gunicorn then calls reload_data, which re-ingests the
+changed files in the master, and replaces the workers with new ones forked from it;
+the old workers finish their requests on the previous snapshot. kill -HUP <master
+pid> does the same by hand.
+'''
+import argparse
+import gc
+import logging
+import multiprocessing
+import os
+import signal
+
+from gunicorn.app.base import BaseApplication
+
+from app import server
+from utils import data
+from utils.export import EXPORT_SLOTS
+from utils.lazy import run_warm_ups
+from utils.watcher import start_watcher
+
+logger = logging.getLogger(__name__)
+
+# threads per worker for everything but exports
+CALLBACK_THREADS = 2
+
+
+class DashboardApplication(BaseApplication):
+    '''
+    gunicorn application serving an already loaded WSGI app
+    '''
+
+    def __init__(self, application, options):
+        self.application = application
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+def share_data():
+    '''
+    load everything the workers use and freeze it, so forked workers share it
+    '''
+    run_warm_ups()
+    gc.unfreeze()
+    gc.collect()
+    gc.freeze()
+
+
+def when_ready(server):
+    # the watcher only signals the master: the reload itself runs in its main thread,
+    # between forks, see reload_data
+    master = os.getpid()
+    start_watcher(on_change=lambda: os.kill(master, signal.SIGHUP))
+
+
+def reload_data(server):
+    # called by gunicorn on SIGHUP, before it forks the new workers
+    try:
+        data.reload()
+    except Exception:
+        # e.g. a file caught half-written; its last write is another change
+        logger.exception("data reload failed")
+    share_data()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the dashboard with gunicorn")
+    parser.add_argument("--bind", default=os.environ.get("BIND", "0.0.0.0:8050"))
+    parser.add_argument("--workers", type=int,
+                        default=int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count())))
+    parser.add_argument("--threads", type=int,
+                        default=int(os.environ.get("THREADS", EXPORT_SLOTS + CALLBACK_THREADS)))
+    parser.add_argument("--timeout", type=int, default=int(os.environ.get("TIMEOUT", 60)))
+    args = parser.parse_args(argv)
+    if args.threads <= EXPORT_SLOTS:
+        parser.error(f"--threads must be more than EXPORT_SLOTS ({EXPORT_SLOTS}) to leave threads for callbacks")
+
+    # load everything before forking so the workers share it
+    share_data()
+
+    options = {
+        "bind": args.bind,
+        "workers": args.workers,
+        "threads": args.threads,
+        "worker_class": "gthread" if args.threads > 1 else "sync",
+        "timeout": args.timeout,
+        "preload_app": True,
+        "when_ready": when_ready,
+        "on_reload": reload_data,
+    }
+    DashboardApplication(server, options).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+'''
+Weighted rollups of the KS2 count columns
+
+The KS2 files carry raw counts (t_*) next to rounded percentages (pt_*) and average
+scaled scores (avg_*). Averaging the pt_ columns across rows gives the wrong answer
+for any rollup, so aggregate() sums the counts in one grouped pass and derives the
+percentages and averages from the sums:
+
+    pt_<subject>_<measure> = 100 * t_<subject>_<measure> / t_<subject>_eligible_pupils
+    avg_<subject>_scaled_score = t_<subject>_sum_scaled_scores / t_<subject>_avg_scaled_score_eligible_pupils
+
+Suppressed counts ("c", "x", "z", "low"), NaN in the frames of utils.data, are
+treated as missing. A derived value only uses the rows where both its numerator and
+denominator are known, so suppression in one row does not skew the ratio for the
+rest of the group.
+
+The Overview headlines (utils.headlines) and the pooled "Other" bar of the Regional
+page (components.regional) are computed with it.
+
+example: maths expected standard for two pooled groups of LAs over 2018-19 and 2021-22
+    aggregate(
+        df,
+        by=["la_name", "gender"],
+        where={"geographic_level": "Local authority", "time_period": [201819, 202122]},
+        rollups={"la_name": {"Leeds": "West Yorkshire", "Bradford": "West Yorkshire",
+                             "Sheffield": "South Yorkshire"}},
+        measures=["pt_mat_met_expected_standard", "avg_mat_scaled_score"])
+'''
+import numpy as np
+import pandas as pd
+
+COUNT_PREFIX = "t_"
+ELIGIBLE_SUFFIX = "_eligible_pupils"
+SUM_SCALED_SUFFIX = "_sum_scaled_scores"
+SCALED_ELIGIBLE_SUFFIX = "_avg_scaled_score_eligible_pupils"
+
+
+#--------------------------------------------------------------------------------------------------------
+# Functions
+#--------------------------------------------------------------------------------------------------------
+def count_columns(df):
+    return [column for column in df.columns if column.startswith(COUNT_PREFIX)]
+
+
+def _subject(count_column):
+    return count_column[len(COUNT_PREFIX):].split("_", 1)[0]
+
+
+def derived_measures(counts):
+    '''
+    the percentages and averages that can be derived from a set of count columns
+
+    :param counts: t_ column names
+    :return: {output column: (numerator column, denominator column, scale)}
+    '''
+    counts = set(counts)
+    measures = {}
+    for column in sorted(counts):
+        subject = _subject(column)
+        name = column[len(COUNT_PREFIX):]
+        if column.endswith(SUM_SCALED_SUFFIX):
+            denominator = f"{COUNT_PREFIX}{subject}{SCALED_ELIGIBLE_SUFFIX}"
+            if denominator in counts:
+                measures[f"avg_{subject}_scaled_score"] = (column, denominator, 1.0)
+        elif not column.endswith(ELIGIBLE_SUFFIX):
+            denominator = f"{COUNT_PREFIX}{subject}{ELIGIBLE_SUFFIX}"
+            if denominator in counts:
+                measures[f"pt_{name}"] = (column, denominator, 100.0)
+    return measures
+
+
+def numeric_counts(df, columns, mask=None):
+    '''
+    float64 matrix of the count columns for the rows in mask, suppression markers as NaN
+    '''
+    rows = np.flatnonzero(mask) if mask is not None else np.arange(len(df))
+    matrix = np.empty((len(rows), len(columns)), dtype=np.float64)
+    for i, column in enumerate(columns):
+        matrix[:, i] = pd.to_numeric(df[column], errors="coerce").to_numpy(dtype=np.float64)[rows]
+    return matrix
+
+
+def _row_mask(df, where):
+    mask = np.ones(len(df), dtype=bool)
+    for column, values in (where or {}).items():
+        if isinstance(values, (list, tuple, set)):
+            mask &= df[column].isin(values).to_numpy()
+        else:
+            mask &= (df[column] == values).to_numpy()
+    return mask
+
+
+def aggregate(df, by, where=None, rollups=None, measures=None):
+    '''
+    sum the count columns over arbitrary dimensions and derive weighted pt_/avg_ values
+
+    :param df: a KS2 dataframe (regional, pupil or school characteristics)
+    :param by: dimension columns to group by, e.g. ["region_name", "time_period"]
+    :param where: {column: value or list of values} filter applied before grouping
+    :param rollups: {column: {value: group label}} relabels values of a column in by
+                    before grouping, e.g. to pool LAs or years; rows whose value is not
+                    mapped are dropped
+    :param measures: derived pt_/avg_ columns to compute (default: all of them)
+    :return: dataframe indexed by the dimensions with the summed t_ counts, the
+             derived measures and a "rows" column with the number of rows pooled
+    '''
+    mask = _row_mask(df, where)
+    keys = {column: df[column].to_numpy()[mask] for column in by}
+    for column, mapping in (rollups or {}).items():
+        if column not in keys:
+            raise ValueError(f"rollup column {column} is not in by")
+        keys[column] = pd.Series(keys[column]).map(mapping).to_numpy()
+        mapped = pd.notna(keys[column])
+        if not mapped.all():
+            keys = {name: values[mapped] for name, values in keys.items()}
+            mask[np.flatnonzero(mask)[~mapped]] = False
+
+    counts = count_columns(df)
+    definitions = derived_measures(counts)
+    if measures is not None:
+        definitions = {name: definitions[name] for name in measures}
+
+    matrix = numeric_counts(df, counts, mask)
+    position = {column: i for i, column in enumerate(counts)}
+
+    # numerators and denominators restricted to rows where both are known
+    numerators = matrix[:, [position[num] for num, _, _ in definitions.values()]]
+    denominators = matrix[:, [position[den] for _, den, _ in definitions.values()]]
+    known = ~(np.isnan(numerators) | np.isnan(denominators))
+    numerators = np.where(known, numerators, 0.0)
+    denominators = np.where(known, denominators, 0.0)
+
+    names = list(definitions)
+    frame = pd.DataFrame(
+        np.hstack([matrix, numerators, denominators, np.ones((len(matrix), 1))]),
+        columns=counts + [f"{n}:num" for n in names] + [f"{n}:den" for n in names] + ["rows"],
+        )
+    for column, values in keys.items():
+        frame[column] = values
+    summed = frame.groupby(list(keys), sort=True, dropna=False).sum(min_count=1)
+
+    result = summed[counts + ["rows"]].copy()
+    scales = np.array([scale for _, _, scale in definitions.values()])
+    num = summed[[f"{n}:num" for n in names]].to_numpy()
+    den = summed[[f"{n}:den" for n in names]].to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        derived = np.where(den > 0, scales * num / den, np.nan)
+    result[names] = derived
+    result["rows"] = result["rows"].astype(np.int64)
+    return result
@@ -0,0 +1,193 @@
+'''
+Prebuilt static figures
+
+Every figure that does not depend on user input (and any data shipped with it to the
+browser) is built once and written as plain JSON to
+data/.cache/figures/<name>-<key>.json. The key hashes the source data files, the
+source of the code that builds the figure and the plotly version, so an artifact is
+rebuilt only when one of those changes. build.py builds them at deploy time;
+load_figure() builds a missing or stale one on demand, from the data snapshot its
+key was taken from.
+
+Artifacts of other keys are left in place when one is written: a worker still on an
+older snapshot may be serving them, or be the one writing. build.py removes them
+(see remove_stale), as at deploy time only the current ones are wanted.
+
+Artifacts never change once written, so each is also written brotli and gzip
+compressed next to the JSON, and utils.http serves them from their content-addressed
+file name (see artifact_url) with long-lived caching.
+'''
+import functools
+import gzip
+import hashlib
+import inspect
+import json
+import os
+import re
+from collections import namedtuple
+
+import brotli
+import plotly
+import plotly.io as pio
+
+from components import overview, regional
+from utils import aggregate, geometry, headlines, rendering
+from utils.data import CACHE_DIR, current_snapshot, data_path, file_hash, pinned
+
+ARTIFACT_DIR = os.path.join(CACHE_DIR, "figures")
+
+# precompressed variants written next to each artifact, by Content-Encoding
+ENCODINGS = {
+    "br": (".br", lambda data: brotli.compress(data, quality=11)),
+    "gzip": (".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0)),
+}
+
+# the app renders with this template (set in pages/pg1.py), so build with it too
+TEMPLATE = "simple_white"
+
+FigureSpec = namedtuple("FigureSpec", ["build", "sources", "modules"])
+
+OVERVIEW_SOURCES = (headlines.NATIONAL_FILE, headlines.GAP_INDEX_FILE)
+
+
+def region_artifact(code):
+    '''
+    name of the artifact with a region's local authorities, e.g. regional-e12000001
+    '''
+    return f"regional-{code.lower()}"
+
+
+FIGURES = {
+    "overview-math": FigureSpec(overview.math_expected_standard, OVERVIEW_SOURCES, (overview, headlines, aggregate)),
+    "overview-gap-index": FigureSpec(overview.disadvantage_gap_index, OVERVIEW_SOURCES, (overview, headlines, aggregate)),
+    "overview-subjects": FigureSpec(overview.subject_expected_standard, OVERVIEW_SOURCES, (overview, headlines, aggregate)),
+    "overview-gender": FigureSpec(overview.math_change_by_gender, OVERVIEW_SOURCES, (overview, headlines, aggregate)),
+    # not a figure: the Overview page's tiles and the series behind its charts
+    "overview-headlines": FigureSpec(headlines.build_headlines, OVERVIEW_SOURCES, (headlines, aggregate)),
+    # England by region, see components/regional.py
+    "regional-map": FigureSpec(
+        regional.build_map,
+        (regional.REGIONAL_FILE, regional.AUTHORITIES_FILE),
+        (regional, geometry)
+        ),
+    "regional-bar-race": FigureSpec(regional.build_bar_race, (regional.REGIONAL_FILE,), (regional, rendering, aggregate)),
+    # not a figure: the per-year values the regional page swaps in client-side
+    "regional-years": FigureSpec(regional.build_regional_year_values, (regional.REGIONAL_FILE,), (regional, aggregate)),
+    # the local authorities of each region, fetched when the region is clicked
+    **{
+        region_artifact(code): FigureSpec(
+            functools.partial(regional.build_region, code),
+            (regional.REGIONAL_FILE, regional.AUTHORITIES_FILE),
+            (regional, geometry, rendering, aggregate)
+            )
+        for code in regional.REGION_CODES
+    },
+}
+
+
+#--------------------------------------------------------------------------------------------------------
+# Functions
+#--------------------------------------------------------------------------------------------------------
+def figure_key(name, snapshot):
+    '''
+    content hash of everything the figure is built from
+
+    :param snapshot: the data snapshot it is built from; sources that are not part of
+        it (e.g. the boundaries) are hashed on disk
+    '''
+    spec = FIGURES[name]
+    digest = hashlib.sha256(name.encode())
+    digest.update(plotly.__version__.encode())
+    digest.update(TEMPLATE.encode())
+    digest.update(repr(sorted(rendering.SETTINGS.items())).encode())
+    for source in spec.sources:
+        digest.update((snapshot.hashes.get(source) or file_hash(data_path(source))).encode())
+    for module in spec.modules:
+        digest.update(inspect.getsource(module).encode())
+    return digest.hexdigest()[:16]
+
+
+def artifact_path(name, key):
+    return os.path.join(ARTIFACT_DIR, f"{name}-{key}.json")
+
+
+def _write_file(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _write_artifact(name, path, text):
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
+    data = text.encode()
+    # compressed variants first, so they exist whenever the JSON does
+    for suffix, compress in ENCODINGS.values():
+        _write_file(path + suffix, compress(data))
+    _write_file(path, data)
+
+
+def remove_stale(name, path):
+    '''
+    remove the artifacts of a figure other than the one at path, with their variants
+
+    :return: the number of files removed
+    '''
+    pattern = re.compile(re.escape(name) + r"-[0-9a-f]{16}\.json(\.br|\.gz)?")
+    keep = {path} | {path + suffix for suffix, _ in ENCODINGS.values()}
+    removed = 0
+    for entry in os.listdir(ARTIFACT_DIR):
+        stale = os.path.join(ARTIFACT_DIR, entry)
+        if pattern.fullmatch(entry) and stale not in keep:
+            try:
+                os.remove(stale)
+                removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+def build_figure(name, force=False):
+    '''
+    build the artifact for a figure if it is missing or stale
+
+    :param name: key in FIGURES
+    :param force: rebuild even if an up to date artifact exists
+    :return: (path of the artifact, whether it was rebuilt)
+    '''
+    # the key and the figure both from this snapshot, even if the data is reloaded
+    # meanwhile, so no artifact holds data other than its key says
+    snapshot = current_snapshot()
+    path = artifact_path(name, figure_key(name, snapshot))
+    variants = [path] + [path + suffix for suffix, _ in ENCODINGS.values()]
+    if all(os.path.exists(variant) for variant in variants) and not force:
+        return path, False
+
+    previous = pio.templates.default
+    pio.templates.default = TEMPLATE
+    try:
+        with pinned(snapshot):
+            fig = FIGURES[name].build()
+    finally:
+        pio.templates.default = previous
+    # plain data (e.g. regional-years) is written as is
+    text = fig.to_json() if hasattr(fig, "to_json") else json.dumps(fig, separators=(",", ":"))
+    _write_artifact(name, path, text)
+    return path, True
+
+
+def load_figure(name):
+    '''
+    the prebuilt figure as a dict, ready to pass to dcc.Graph
+    '''
+    path, _ = build_figure(name)
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def artifact_url(name):
+    '''
+    URL of the prebuilt figure, served by utils.http; it changes whenever the figure does
+    '''
+    path, _ = build_figure(name)
+    return f"/_figures/{os.path.basename(path)}"
@@ -0,0 +1,109 @@
+'''
+Catalog of the datasets in data/, built once per data snapshot
+
+For every CSV the catalog holds what the selectors offer, as ready to use dropdown
+options: its years, the values of its category column and the sub-categories of each
+(the hierarchy of its valid_categories, see utils.engine) and the labels of those two
+columns, its metric columns and their descriptions from data-guidance.json, and its
+dimension columns. Callbacks look options up here
+instead of scanning the frames, and the Student Characteristic page sends the
+entry of the selected file to the browser.
+'''
+import pandas as pd
+
+from utils.data import per_snapshot
+from utils.engine import Dataset, load_datasets
+
+
+#--------------------------------------------------------------------------------------------------------
+# Functions
+#--------------------------------------------------------------------------------------------------------
+def trim_dropdown_option(input):
+    try:
+        return input.replace(".csv", "")\
+            .replace("_", " ")\
+            .title()
+    except AttributeError:
+        # not text, e.g. a numeric category value
+        return input
+
+
+def dropdown_option(value):
+    return {"label": trim_dropdown_option(value), "value": value}
+
+
+def year_label(year):
+    '''
+    201617 -> 2016-17
+    '''
+    return str(year)[0:4] + "-" + str(year)[4:]
+
+
+def build_entry(dataset, guidance):
+    '''
+    catalog entry of one file, see utils.engine.Dataset
+
+    Values are listed in order of first appearance in the file, among the rows the
+    file's default filters keep.
+    '''
+    schema = dataset.schema
+    descriptions = guidance.get(schema.filename, {})
+
+    years = []
+    if "time_period" in schema.dimensions:
+        years = [{"label": "All available years", "value": "all"}] + [
+            {"label": year_label(year), "value": year} for year in dataset.level_values("time_period")]
+
+    hierarchy = {}
+    if len(schema.categories) >= 2:
+        category, sub_category = schema.categories[:2]
+        pairs = dataset.select({})[[category, sub_category]].dropna().drop_duplicates()
+        for group, value in zip(pairs[category], pairs[sub_category]):
+            hierarchy.setdefault(group, []).append(dropdown_option(value))
+    elif schema.categories:
+        hierarchy = {value: [] for value in dataset.level_values(schema.categories[0])}
+
+    # the selectors' labels: the columns' descriptions, or their names
+    category_labels = [descriptions.get(column) or trim_dropdown_option(column) for column in schema.categories[:2]]
+
+    return {
+        "label": trim_dropdown_option(schema.filename),
+        "summary": descriptions.get("summary", ""),
+        "dimensions": list(schema.dimensions),
+        "category_columns": list(schema.categories),
+        "category_labels": category_labels,
+        "years": years,
+        "categories": [dropdown_option(group) for group in hierarchy],
+        "hierarchy": hierarchy,
+        "metrics": [dropdown_option(column) for column in schema.metrics],
+        "descriptions": {column: descriptions[column] for column in schema.metrics if column in descriptions},
+    }
+
+
+EMPTY_ENTRY = build_entry(Dataset("", pd.DataFrame(), {}), {})
+
+
+@per_snapshot
+def load_catalog(snapshot):
+    return {
+        filename: build_entry(dataset, snapshot.guidance)
+        for filename, dataset in sorted(load_datasets().items())
+    }
+
+
+def catalog_entry(filename):
+    '''
+    catalog entry of a file, or an entry without any options for an unknown file
+    '''
+    return load_catalog().get(filename, EMPTY_ENTRY)
+
+
+def sub_category_options(entry, categories):
+    '''
+    characteristics of the selected groups, without repeats
+    '''
+    options = {}
+    for category in categories:
+        for option in entry["hierarchy"].get(category, []):
+            options.setdefault(option["value"], option)
+    return list(options.values())
@@ -0,0 +1,354 @@
+'''
+Shared data layer for the KS2 datasets in data/
+
+Every CSV is parsed once and written to a Feather (Arrow IPC) cache in data/.cache,
+keyed by the SHA-256 of the source file. Later starts memory-map the cache instead of
+re-parsing the CSV, and every page gets the same frame from get_dataframe().
+
+The loaded files form an immutable Snapshot. reload() (run periodically by
+utils.watcher) re-ingests only the files whose hash changed, builds a new snapshot
+that reuses the unchanged frames and swaps it in with a single assignment, so a
+request holding a snapshot never sees a partly loaded one. Code that derives data
+from a snapshot uses @per_snapshot, and on_reload() listeners are told which files
+changed (e.g. to drop cached figures).
+
+At ingest every value column is stored as numbers (see compact): float32 where the
+values are whole numbers it holds exactly, float64 otherwise, with suppressed values
+as NaN. Why a value is missing is kept apart as one uint8 reason code per row (see
+SUPPRESSION_MARKERS and suppression_markers). The other text columns become
+categoricals.
+
+Frames handed out by this module are shared between pages and must be treated as
+read-only: filter or copy them, never assign into them.
+'''
+import contextvars
+import functools
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from types import MappingProxyType
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "..", "data"))
+CACHE_DIR = os.path.join(DATA_DIR, ".cache")
+GUIDANCE_FILE = "data-guidance.json"
+
+# bump when the parsing below changes so stale caches are not reused
+CACHE_VERSION = 2
+
+# DfE symbols for values that are not published; a reason code is the position of
+# its marker here plus one, 0 meaning the value was published
+#   c   confidential          x   not available         z   not applicable
+#   low rounds to zero        u   low reliability       :   not available (older releases)
+SUPPRESSION_MARKERS = ("c", "x", "z", "low", "u", ":")
+# reason code columns are stored next to their value column in the Feather cache
+REASON_SUFFIX = ":reason"
+# largest magnitude up to which float32 holds every whole number
+FLOAT32_EXACT = 2 ** 24
+
+# frames: {filename: dataframe}; reasons: {filename: uint8 dataframe with a column of
+# reason codes for each value column that has suppressed values}
+Snapshot = namedtuple("Snapshot", ["version", "frames", "hashes", "guidance", "reasons"])
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+# snapshot that current_snapshot returns in this thread instead, see pinned
+_pinned = contextvars.ContextVar("pinned_snapshot", default=None)
+_listeners = []
+
+
+#--------------------------------------------------------------------------------------------------------
+# Functions
+#--------------------------------------------------------------------------------------------------------
+def data_path(filename):
+    return os.path.join(DATA_DIR, filename)
+
+
+def list_csv_names():
+    '''
+    list the CSV files in the data folder, sorted so every caller sees the same order
+    '''
+    return sorted(file for file in os.listdir(DATA_DIR) if file.endswith(".csv"))
+
+
+def file_hash(path):
+    '''
+    SHA-256 hex digest of a file, read in chunks
+    '''
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_path(filename, digest):
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(CACHE_DIR, f"{stem}-v{CACHE_VERSION}-{digest[:16]}.feather")
+
+
+def read_source_csv(path):
+    '''
+    parse a KS2 CSV the same way for every page
+
+    low_memory=False keeps the type inference consistent across the whole file, so a
+    column with suppression markers ("c", "x", "z") is always read as strings, which
+    compact then turns into numbers.
+    '''
+    return pd.read_csv(path, dtype={"la_name": str}, low_memory=False)
+
+
+def _as_numbers(column):
+    '''
+    (values, reason codes) of a text column whose only non-numeric values are
+    suppression markers, or None for any other column
+
+    Only the distinct values are parsed, the rows then look theirs up.
+    '''
+    rows, uniques = pd.factorize(column, use_na_sentinel=True)
+    uniques = pd.Series(uniques, dtype=object)
+    numbers = pd.to_numeric(uniques, errors="coerce").to_numpy(dtype=np.float64)
+    text = uniques[np.isnan(numbers)]
+    if not text.isin(SUPPRESSION_MARKERS).all():
+        return None
+    # reason code of each distinct value, 0 for numbers; a last slot for missing values
+    reasons = np.zeros(len(uniques) + 1, dtype=np.uint8)
+    reasons[text.index] = [SUPPRESSION_MARKERS.index(marker) + 1 for marker in text]
+    finite = numbers[np.isfinite(numbers)]
+    exact = (finite == np.round(finite)).all() and (np.abs(finite) < FLOAT32_EXACT).all()
+    numbers = np.append(numbers, np.nan).astype(np.float32 if exact else np.float64)
+    return numbers[rows], reasons[rows]
+
+
+def compact(df):
+    '''
+    numeric value columns and categorical dimensions for a parsed CSV
+
+    Text columns whose other values are all numbers become float columns with NaN
+    for the suppression markers, the remaining text columns become categoricals.
+
+    :return: (frame, reasons), reasons holding the reason codes of the value columns
+        that have suppressed values
+    '''
+    columns, reasons = {}, {}
+    for name, column in df.items():
+        if column.dtype.kind in "biufcmM":
+            columns[name] = column
+            continue
+        numbers = _as_numbers(column)
+        if numbers is None:
+            columns[name] = column.astype("category")
+            continue
+        columns[name], codes = numbers
+        if codes.any():
+            reasons[name] = codes
+    return pd.DataFrame(columns, index=df.index), pd.DataFrame(reasons, index=df.index)
+
+
+def _split(table):
+    '''
+    (frame, reasons) from a cached table holding both
+    '''
+    reason_columns = [column for column in table.columns if column.endswith(REASON_SUFFIX)]
+    reasons = table[reason_columns]
+    reasons.columns = [column[:-len(REASON_SUFFIX)] for column in reason_columns]
+    return table.drop(columns=reason_columns), reasons
+
+
+def suppression_markers(reasons, column):
+    '''
+    the suppression marker of each row of a value column ("c", "x", ...), NaN where
+    the value was published
+
+    :param reasons: the file's reason codes, see compact
+    '''
+    if column not in reasons:
+        codes = np.zeros(len(reasons), dtype=np.int8)
+    else:
+        codes = reasons[column].to_numpy().astype(np.int8)
+    return pd.Series(pd.Categorical.from_codes(codes - 1, categories=SUPPRESSION_MARKERS), index=reasons.index)
+
+
+def _write_cache(df, filename, path):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    # uncompressed so the cache can be memory-mapped
+    feather.write_feather(df, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+
+    # drop caches of older versions of the same file
+    prefix = os.path.splitext(filename)[0] + "-v"
+    for entry in os.listdir(CACHE_DIR):
+        stale = os.path.join(CACHE_DIR, entry)
+        if entry.startswith(prefix) and entry.endswith(".feather") and stale != path:
+            os.remove(stale)
+
+
+def load_dataframe(filename, digest=None):
+    '''
+    load a CSV from the data folder through the Feather cache, converting it on first use
+
+    :param filename: name of the CSV file in the data folder
+    :param digest: file_hash of the CSV, if already known
+    :return: (frame, reasons), see compact
+    '''
+    source = data_path(filename)
+    cached = cache_path(filename, digest or file_hash(source))
+    if os.path.exists(cached):
+        return _split(feather.read_table(cached, memory_map=True).to_pandas())
+
+    df, reasons = compact(read_source_csv(source))
+    _write_cache(pd.concat([df, reasons.add_suffix(REASON_SUFFIX)], axis="columns"), filename, cached)
+    return df, reasons
+
+
+def _ingest(previous):
+    '''
+    build a snapshot of the data folder, reusing the unchanged frames of previous
+    '''
+    frames, hashes, reasons = {}, {}, {}
+    for filename in list_csv_names():
+        digest = file_hash(data_path(filename))
+        hashes[filename] = digest
+        if previous is not None and previous.hashes.get(filename) == digest:
+            frames[filename], reasons[filename] = previous.frames[filename], previous.reasons[filename]
+        else:
+            frames[filename], reasons[filename] = load_dataframe(filename, digest)
+
+    hashes[GUIDANCE_FILE] = file_hash(data_path(GUIDANCE_FILE))
+    if previous is not None and previous.hashes.get(GUIDANCE_FILE) == hashes[GUIDANCE_FILE]:
+        guidance = previous.guidance
+    else:
+        with open(data_path(GUIDANCE_FILE), "r") as f:
+            guidance = json.load(f)
+
+    version = previous.version + 1 if previous is not None else 1
+    return Snapshot(version, MappingProxyType(frames), MappingProxyType(hashes), guidance, MappingProxyType(reasons))
+
+
+def current_snapshot():
+    '''
+    the current data snapshot, loading it on first use
+
+    Take it once per request and read everything from it for a consistent view.
+    '''
+    global _snapshot
+    pinned_snapshot = _pinned.get()
+    if pinned_snapshot is not None:
+        return pinned_snapshot
+    if _snapshot is None:
+        with _snapshot_lock:
+            if _snapshot is None:
+                _snapshot = _ingest(None)
+    return _snapshot
+
+
+@contextmanager
+def pinned(snapshot):
+    '''
+    make current_snapshot return snapshot in this thread, even after a reload
+
+    For derived data that is stored under the snapshot's hashes, e.g. the prebuilt
+    figures of utils.artifacts: everything it reads comes from the snapshot it is
+    keyed by.
+    '''
+    token = _pinned.set(snapshot)
+    try:
+        yield snapshot
+    finally:
+        _pinned.reset(token)
+
+
+def changed_files(old, new):
+    return {
+        filename for filename in set(old.hashes) | set(new.hashes)
+        if old.hashes.get(filename) != new.hashes.get(filename)
+    }
+
+
+def reload():
+    '''
+    re-ingest the files that changed on disk and swap in a new snapshot
+
+    :return: the set of changed file names (empty if nothing changed)
+    '''
+    global _snapshot
+    with _snapshot_lock:
+        if _snapshot is None:
+            _snapshot = _ingest(None)
+            return set()
+        old = _snapshot
+        new = _ingest(old)
+        changed = changed_files(old, new)
+        if not changed:
+            return set()
+        _snapshot = new
+
+    logger.info("data snapshot %d: reloaded %s", new.version, ", ".join(sorted(changed)))
+    for listener in _listeners:
+        try:
+            listener(changed)
+        except Exception:
+            logger.exception("reload listener %s failed", listener.__qualname__)
+    return changed
+
+
+def on_reload(func):
+    '''
+    register func(changed file names) to be called after a new snapshot is swapped in
+    '''
+    _listeners.append(func)
+    return func
+
+
+def per_snapshot(func):
+    '''
+    cache func(snapshot) for the current snapshot, recomputing it after a reload
+
+    The decorated function takes no arguments and is thread-safe.
+    '''
+    lock = threading.Lock()
+    state = [(None, None)]
+
+    @functools.wraps(func)
+    def wrapper():
+        snapshot = current_snapshot()
+        cached_snapshot, result = state[0]
+        if cached_snapshot is snapshot:
+            return result
+        with lock:
+            if state[0][0] is not snapshot:
+                state[0] = (snapshot, func(snapshot))
+            return state[0][1]
+
+    return wrapper
+
+
+def get_dataframe(filename):
+    '''
+    return the shared, read-only dataframe for a CSV in the data folder
+    '''
+    return current_snapshot().frames[filename]
+
+
+def get_reasons(filename):
+    '''
+    return the suppression reason codes of a CSV in the data folder, see compact
+    '''
+    return current_snapshot().reasons[filename]
+
+
+def load_guidance():
+    '''
+    return the parsed data-guidance.json, shared between pages
+    '''
+    return current_snapshot().guidance
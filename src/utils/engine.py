@@ -0,0 +1,205 @@
+'''
+Schema-driven selection engine for the KS2 files
+
+Each file's schema comes from its data-guidance.json entry:
+
+    valid_categories    the category columns users pick from, outermost first; the
+                        selectors offer the first as categories and the second as
+                        the sub-categories of each
+    default_filters     {column: value} applied unless a selection overrides it, e.g.
+                        only the "Local authority" rows of the regional file
+    metrics             the metric columns, for files whose columns do not follow
+                        the t_/pt_ naming (e.g. the gap index file)
+
+plus the column names: by default t_/pt_ columns are metrics, and columns that do not
+hold values (see MEASURE_PREFIXES) are dimensions. A new file therefore
+needs a guidance entry, not code.
+
+A selection is a {dimension: value, list of values or ALL} mapping. Dimensions are
+factorized into integer codes when a Dataset is built, and a selection is answered
+by a MaskPlan: one vectorized comparison per selected column over the code arrays.
+Plans depend only on the selection's shape (which columns, one value or many), so
+they are compiled once per shape and reused for every selection of that shape.
+'''
+import threading
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from utils.data import per_snapshot, suppression_markers
+
+# count and percentage columns, offered as metrics
+METRIC_PREFIXES = ("pt_", "t_")
+# columns holding values rather than describing the row; the rest are dimensions
+MEASURE_PREFIXES = METRIC_PREFIXES + ("avg_", "no_")
+
+# marker for "every value of this column"
+ALL = object()
+
+Schema = namedtuple("Schema", ["filename", "categories", "dimensions", "metrics", "defaults"])
+
+# reuse Datasets of unchanged files across snapshots: {filename: (file hash, guidance entry, Dataset)}
+_datasets = {}
+
+
+#--------------------------------------------------------------------------------------------------------
+# Functions
+#--------------------------------------------------------------------------------------------------------
+def build_schema(filename, df, guidance):
+    '''
+    schema of a file from its columns and its data-guidance.json entry
+    '''
+    entry = guidance.get(filename, {})
+    if "metrics" in entry:
+        metrics = tuple(column for column in entry["metrics"] if column in df.columns)
+    else:
+        metrics = tuple(column for column in df.columns if column.startswith(METRIC_PREFIXES))
+    dimensions = tuple(
+        column for column in df.columns if not column.startswith(MEASURE_PREFIXES) and column not in metrics)
+    categories = tuple(column for column in entry.get("valid_categories", ()) if column in dimensions)
+    return Schema(
+        filename=filename,
+        categories=categories,
+        dimensions=dimensions,
+        metrics=metrics,
+        defaults={column: value for column, value in entry.get("default_filters", {}).items() if column in dimensions},
+        )
+
+
+def selection_shape(selection):
+    '''
+    (column, whether several values are selected) for every column the selection
+    filters on, in a canonical order
+    '''
+    return tuple(sorted(
+        (column, isinstance(value, (list, tuple, set)))
+        for column, value in selection.items() if value is not ALL
+        ))
+
+
+class MaskPlan:
+    '''
+    compiled filter for one selection shape of a Dataset
+    '''
+
+    def __init__(self, dataset, shape):
+        self.shape = shape
+        self.size = len(dataset.df)
+        # (column, codes, {value: code}, many); most distinct values first, as they
+        # rule out the most rows
+        self.steps = sorted(
+            ((column,) + dataset.codes(column) + (many,) for column, many in shape),
+            key=lambda step: -len(step[2]),
+            )
+
+    def mask(self, selection):
+        mask = np.ones(self.size, dtype=bool)
+        for column, codes, lookup, many in self.steps:
+            value = selection[column]
+            if many:
+                # one extra slot for the -1 code of missing values, never selected
+                wanted = np.zeros(len(lookup) + 1, dtype=bool)
+                wanted[[lookup[v] for v in value if v in lookup]] = True
+                mask &= wanted[codes]
+            else:
+                mask &= codes == lookup.get(value, -2)
+        return mask
+
+    def positions(self, selection):
+        '''
+        row positions matching the selection, in table order
+        '''
+        return np.flatnonzero(self.mask(selection))
+
+
+class Dataset:
+    '''
+    a file's frame with its schema, dimension codes and compiled plans
+
+    Treat it as read-only, like the frames of utils.data.
+    '''
+
+    def __init__(self, filename, df, guidance, reasons=None):
+        self.df = df
+        self.reasons = pd.DataFrame(index=df.index) if reasons is None else reasons
+        self.schema = build_schema(filename, df, guidance)
+        self._codes = {}
+        self._plans = {}
+        self._lock = threading.Lock()
+        for column in self.schema.dimensions:
+            self.codes(column)
+
+    def codes(self, column):
+        '''
+        (integer code of each row, {value: code}) for a dimension; missing values are -1
+        '''
+        codes = self._codes.get(column)
+        if codes is None:
+            values, uniques = pd.factorize(self.df[column], use_na_sentinel=True)
+            codes = self._codes[column] = (values.astype(np.intp), {v: i for i, v in enumerate(uniques.tolist())})
+        return codes
+
+    def plan(self, shape):
+        plan = self._plans.get(shape)
+        if plan is None:
+            with self._lock:
+                plan = self._plans.get(shape)
+                if plan is None:
+                    plan = self._plans[shape] = MaskPlan(self, shape)
+        return plan
+
+    def resolve(self, selection):
+        '''
+        the selection with the schema's default filters added and unknown columns dropped
+        '''
+        resolved = dict(self.schema.defaults)
+        resolved.update((column, value) for column, value in selection.items() if column in self.schema.dimensions)
+        return resolved
+
+    def positions(self, selection):
+        selection = self.resolve(selection)
+        return self.plan(selection_shape(selection)).positions(selection)
+
+    def select(self, selection, columns=None):
+        '''
+        rows matching a {dimension: value, [values] or ALL} selection, in table order
+
+        :param columns: only take these columns, which is much cheaper on the wide files
+        '''
+        df = self.df if columns is None else self.df[list(dict.fromkeys(columns))]
+        return df.take(self.positions(selection))
+
+    def markers(self, column, rows):
+        '''
+        suppression markers of a value column for rows selected from the frame, see
+        utils.data.suppression_markers
+        '''
+        return suppression_markers(self.reasons, column).reindex(rows.index)
+
+    def level_values(self, column, selection=None):
+        '''
+        distinct values of column among the rows of selection, in order of first appearance
+        '''
+        rows = self.df[column].take(self.positions(selection or {}))
+        return rows.dropna().unique().tolist()
+
+
+# Built for each data snapshot, reusing the Datasets of files whose data and guidance
+# entry did not change
+@per_snapshot
+def load_datasets(snapshot):
+    datasets = {}
+    for filename, df in snapshot.frames.items():
+        entry = snapshot.guidance.get(filename, {})
+        digest = snapshot.hashes[filename]
+        cached = _datasets.get(filename)
+        if cached is None or cached[0] != digest or cached[1] != entry:
+            cached = _datasets[filename] = (
+                digest, entry, Dataset(filename, df, snapshot.guidance, snapshot.reasons[filename]))
+        datasets[filename] = cached[2]
+    return datasets
+
+
+def get_dataset(filename):
+    return load_datasets()[filename]
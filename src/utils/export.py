@@ -0,0 +1,217 @@
+'''
+Export of the rows behind the charts as CSV or Arrow
+
+install(server) adds
+
+    /_export/<file>?year=...&category=...&sub_category=...&metric=...&gender=...
+
+which takes the selection of the Student Characteristic page (see
+pages/categoricalVisualizer.get_figure) and streams the matching rows of the file.
+category and sub_category filter the file's first two valid_categories, year is a
+time_period or "all", and category, sub_category and metric may be repeated. Any
+other dimension of the file filters it too, e.g. for the regional file:
+
+    /_export/ks2_regional_and_local_authority_2016_to_2022_provisional.csv
+        ?region_code=E12000007&metric=pt_mat_met_expected_standard&format=arrow
+
+Files keep their default filters (the regional file's local authority rows) unless
+the query overrides them, e.g. with geographic_level=Regional. Without metric every
+column is exported, otherwise the dimensions and the metrics asked for.
+
+format=csv (the default) writes suppressed values as their published markers ("c",
+"x", ...), like the source file. format=arrow writes an Arrow IPC stream with the
+values as stored, suppressed values null, and a "<column>:reason" column with the
+marker of each value column that has suppressed values.
+
+Rows are read from the shared in-memory Dataset (see utils.engine) EXPORT_CHUNK_ROWS
+at a time and sent as they are encoded, so an export holds one chunk in memory
+whatever its size. At most EXPORT_SLOTS exports stream at once per worker; more get a
+503 with Retry-After, and serve.py gives every worker more threads than that, so
+long downloads cannot occupy every thread that serves callbacks.
+'''
+import os
+import threading
+
+import flask
+import numpy as np
+import pyarrow as pa
+
+from utils.data import REASON_SUFFIX, SUPPRESSION_MARKERS, suppression_markers
+from utils.engine import ALL, load_datasets
+
+EXPORT_CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", 10000))
+EXPORT_SLOTS = int(os.environ.get("EXPORT_SLOTS", 1))
+
+FORMATS = {
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+# parameters that are not dimensions of the file
+SELECTION_PARAMETERS = ("category", "sub_category", "year", "metric", "format")
+
+_slots = threading.BoundedSemaphore(EXPORT_SLOTS)
+
+
+#--------------------------------------------------------------------------------------------------------
+# Functions
+#--------------------------------------------------------------------------------------------------------
+def parse_selection(dataset, args):
+    '''
+    (selection, columns) of an export request
+
+    :param args: the request's query arguments
+    :raises ValueError: for parameters that are not dimensions or metrics of the file
+    '''
+    schema = dataset.schema
+    unknown = [key for key in args if key not in SELECTION_PARAMETERS and key not in schema.dimensions]
+    if unknown:
+        raise ValueError(f"not a dimension of {schema.filename}: {', '.join(unknown)}")
+
+    requested = {}
+    for parameter, column in zip(("category", "sub_category"), schema.categories[:2]):
+        if parameter in args:
+            requested[column] = args.getlist(parameter)
+    year = args.get("year")
+    if year is not None and "time_period" in schema.dimensions:
+        requested["time_period"] = ALL if year == "all" else year
+    for column in schema.dimensions:
+        if column in args:
+            values = args.getlist(column)
+            requested[column] = values[0] if len(values) == 1 else values
+
+    # query values are text; the file's values may be numbers, e.g. time_period
+    selection = {}
+    for column, value in requested.items():
+        if value is ALL:
+            selection[column] = ALL
+            continue
+        lookup = {str(known): known for known in dataset.codes(column)[1]}
+        selection[column] = [lookup.get(v, v) for v in value] if isinstance(value, list) else lookup.get(value, value)
+
+    metrics = args.getlist("metric")
+    missing = [metric for metric in metrics if metric not in schema.metrics]
+    if missing:
+        raise ValueError(f"not a metric of {schema.filename}: {', '.join(missing)}")
+    columns = list(dataset.df.columns) if not metrics else list(schema.dimensions) + metrics
+    return selection, columns
+
+
+def chunks(dataset, selection, columns):
+    '''
+    the selected rows EXPORT_CHUNK_ROWS at a time, with the suppression reason codes of
+    their value columns (see utils.data.compact): (rows, reasons)
+    '''
+    positions = dataset.positions(selection)
+    indices = dataset.df.columns.get_indexer(columns)
+    reason_indices = dataset.reasons.columns.get_indexer([column for column in columns if column in dataset.reasons])
+    for start in range(0, max(len(positions), 1), EXPORT_CHUNK_ROWS):
+        chunk = positions[start:start + EXPORT_CHUNK_ROWS]
+        # copies only this chunk's cells
+        yield dataset.df.iloc[chunk, indices], dataset.reasons.iloc[chunk, reason_indices]
+
+
+def csv_chunks(dataset, selection, columns):
+    markers = np.array(SUPPRESSION_MARKERS, dtype=object)
+    # columns of whole numbers, written as the source wrote them, 70 rather than 70.0;
+    # decided over the whole file so every chunk writes a column the same way
+    whole = {
+        column for column in columns
+        if dataset.df[column].dtype.kind == "f" and (dataset.df[column].dropna() % 1 == 0).all()
+    }
+    header = True
+    for rows, reasons in chunks(dataset, selection, columns):
+        for column in rows.columns:
+            values = rows[column]
+            if column in whole:
+                values = rows[column] = values.astype("Int64")
+            codes = reasons[column].to_numpy() if column in reasons else None
+            if codes is not None and codes.any():
+                text = values.to_numpy(dtype=object)
+                text[codes > 0] = markers[codes[codes > 0] - 1]
+                rows[column] = text
+        yield rows.to_csv(index=False, header=header)
+        header = False
+
+
+class _Buffer:
+    '''
+    file-like sink the Arrow writer writes into, emptied after every batch
+    '''
+
+    def __init__(self):
+        self.parts = []
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def arrow_chunks(dataset, selection, columns):
+    buffer = _Buffer()
+    writer = None
+    for rows, reasons in chunks(dataset, selection, columns):
+        for column in reasons.columns:
+            rows[column + REASON_SUFFIX] = suppression_markers(reasons, column)
+        batch = pa.RecordBatch.from_pandas(rows, preserve_index=False)
+        if writer is None:
+            writer = pa.ipc.new_stream(buffer, batch.schema)
+        writer.write_batch(batch)
+        yield buffer.take()
+    writer.close()
+    yield buffer.take()
+
+
+def _release(response):
+    released = []
+
+    def release():
+        if not released:
+            released.append(True)
+            _slots.release()
+    response.call_on_close(release)
+    return response
+
+
+def send_export(filename):
+    dataset = load_datasets().get(filename)
+    if dataset is None:
+        flask.abort(404)
+    args = flask.request.args
+    export_format = args.get("format", "csv")
+    if export_format not in FORMATS:
+        return flask.Response(f"format must be one of {', '.join(FORMATS)}\n", status=400, mimetype="text/plain")
+    try:
+        selection, columns = parse_selection(dataset, args)
+    except ValueError as e:
+        return flask.Response(f"{e}\n", status=400, mimetype="text/plain")
+
+    if not _slots.acquire(blocking=False):
+        response = flask.Response("too many exports in progress\n", status=503, mimetype="text/plain")
+        response.headers["Retry-After"] = "1"
+        return response
+
+    generate = csv_chunks if export_format == "csv" else arrow_chunks
+    name = os.path.splitext(filename)[0]
+    response = flask.Response(generate(dataset, selection, columns), mimetype=FORMATS[export_format])
+    response.headers["Content-Disposition"] = f'attachment; filename="{name}.{export_format}"'
+    response.headers["Cache-Control"] = "no-store"
+    return _release(response)
+
+
+def install(server):
+    '''
+    add the /_export route to the Flask server
+    '''
+    server.add_url_rule("/_export/<filename>", "export", send_export)
@@ -0,0 +1,140 @@
+'''
+Bounded LRU cache of rendered figures
+
+Figures are stored as their serialized JSON, keyed on the normalized arguments that
+produced them, and evicted least-recently-used first once the total size of the
+stored JSON goes over max_bytes.
+
+figure_patch() diffs two figures into a dash.Patch, so a callback whose inputs only
+changed part of the figure can send that part instead of the whole figure.
+'''
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from dash import Patch
+
+from utils.metrics import phase
+
+DEFAULT_MAX_BYTES = int(os.environ.get("FIGURE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+
+def normalize_key(*args):
+    '''
+    hashable cache key for callback arguments; lists are sorted so their order is ignored
+    '''
+    key = []
+    for arg in args:
+        if isinstance(arg, (list, tuple, set)):
+            arg = tuple(sorted(arg, key=repr))
+        key.append(arg)
+    return tuple(key)
+
+
+class FigureCache:
+    '''
+    thread-safe LRU of figure JSON strings bounded by their total size in bytes
+    '''
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        '''
+        cached JSON for key, or None
+        '''
+        with self._lock:
+            text = self._entries.get(key)
+            if text is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return text
+
+    def put(self, key, text):
+        size = len(text)
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= len(self._entries.pop(key))
+            if size > self.max_bytes:
+                return
+            self._entries[key] = text
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def get_figure(self, key, build):
+        '''
+        return the cached figure for key as a dict, calling build() to make it on a miss
+
+        :param key: cache key, see normalize_key
+        :param build: function returning a plotly figure
+        :return: the figure as a plain dict, ready to be returned from a callback
+        '''
+        text = self.get(key)
+        if text is None:
+            fig = build()
+            with phase("serialize"):
+                text = fig.to_json()
+            self.put(key, text)
+        return json.loads(text)
+
+    def invalidate(self, predicate):
+        '''
+        drop the entries whose key matches predicate(key)
+        '''
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                self._bytes -= len(self._entries.pop(key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+def _patch_dict(patch, old, new):
+    for key in old.keys() - new.keys():
+        del patch[key]
+    for key, value in new.items():
+        if old.get(key) != value:
+            patch[key] = value
+
+
+def figure_patch(old, new):
+    '''
+    dash.Patch turning figure dict old into new, replacing only the trace attributes
+    and top level layout entries that differ
+
+    :return: the Patch, or None if the traces differ in number or type (send new instead)
+    '''
+    old_traces, new_traces = old.get("data", []), new.get("data", [])
+    if len(old_traces) != len(new_traces) or any(
+            a.get("type") != b.get("type") for a, b in zip(old_traces, new_traces)):
+        return None
+    patch = Patch()
+    for i, (a, b) in enumerate(zip(old_traces, new_traces)):
+        _patch_dict(patch["data"][i], a, b)
+    _patch_dict(patch["layout"], old.get("layout", {}), new.get("layout", {}))
+    return patch
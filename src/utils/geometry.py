@@ -0,0 +1,488 @@
+'''
+Build-time simplification of the local authority boundaries used by the choropleth
+
+The pipeline quantizes every coordinate to an integer grid over the bounding box,
+cuts the polygon rings into arcs at the points where neighbouring boundaries meet,
+stores each shared arc once and simplifies it with Douglas-Peucker. Because a shared
+border is simplified once and reused by both authorities, neighbours still meet
+exactly afterwards (no slivers or overlaps). Only the properties in keep_properties
+survive.
+
+The result can be written back out as GeoJSON for plotly, or as a TopoJSON-style
+topology with delta-encoded shared arcs, which is smaller again. Groups of
+authorities (e.g. regions) can be dissolved into one geometry each by dropping the
+arcs between members, so the merged outlines reuse the simplified borders as well.
+
+usage (from src/):
+    python -m utils.geometry <input.geojson> <output.json> [--tolerance 0.002]
+        [--quantization 100000] [--topojson]
+'''
+import argparse
+import json
+import math
+from collections import Counter, defaultdict
+
+import numpy as np
+
+AUTHORITY_NAME = "CTYUA21NM"
+DEFAULT_TOLERANCE = 0.002
+DEFAULT_QUANTIZATION = 100000
+
+
+#--------------------------------------------------------------------------------------------------------
+# Quantization
+#--------------------------------------------------------------------------------------------------------
+def _polygons(geometry):
+    '''
+    list of polygons (each a list of rings) for a Polygon or MultiPolygon geometry
+    '''
+    if geometry is None:
+        return []
+    if geometry["type"] == "Polygon":
+        return [geometry["coordinates"]]
+    if geometry["type"] == "MultiPolygon":
+        return geometry["coordinates"]
+    raise ValueError(f"unsupported geometry type {geometry['type']}")
+
+
+def bounding_box(geojson):
+    xs, ys = [], []
+    for feature in geojson["features"]:
+        for polygon in _polygons(feature["geometry"]):
+            for ring in polygon:
+                points = np.asarray(ring, dtype=float)
+                xs.extend((points[:, 0].min(), points[:, 0].max()))
+                ys.extend((points[:, 1].min(), points[:, 1].max()))
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def make_transform(bbox, quantization):
+    x0, y0, x1, y1 = bbox
+    kx = (x1 - x0) / (quantization - 1) if x1 > x0 else 1
+    ky = (y1 - y0) / (quantization - 1) if y1 > y0 else 1
+    return {"scale": [kx, ky], "translate": [x0, y0]}
+
+
+def _quantize_ring(ring, transform):
+    (kx, ky), (x0, y0) = transform["scale"], transform["translate"]
+    points = np.asarray(ring, dtype=float)[:, :2]
+    grid = np.empty((len(points), 2), dtype=np.int64)
+    grid[:, 0] = np.round((points[:, 0] - x0) / kx)
+    grid[:, 1] = np.round((points[:, 1] - y0) / ky)
+
+    # snapping can merge neighbouring vertices
+    keep = np.ones(len(grid), dtype=bool)
+    keep[1:] = np.any(grid[1:] != grid[:-1], axis=1)
+    ring = [tuple(point) for point in grid[keep].tolist()]
+    if ring[0] != ring[-1]:
+        ring.append(ring[0])
+    return ring if len(ring) >= 4 else None
+
+
+#--------------------------------------------------------------------------------------------------------
+# Arcs
+#--------------------------------------------------------------------------------------------------------
+def _find_junctions(rings):
+    '''
+    points where boundaries meet or part: seen more than once with different neighbours
+    '''
+    neighbours = {}
+    junctions = set()
+    for ring in rings:
+        points = ring[:-1]
+        n = len(points)
+        for i, point in enumerate(points):
+            pair = frozenset((points[i - 1], points[(i + 1) % n]))
+            seen = neighbours.setdefault(point, pair)
+            if seen != pair:
+                junctions.add(point)
+    return junctions
+
+
+def _cut_ring(ring, junctions):
+    '''
+    split a closed ring into arcs that start and end at junctions
+
+    A ring without junctions becomes a single closed arc.
+    '''
+    points = ring[:-1]
+    cuts = [i for i, point in enumerate(points) if point in junctions]
+    if not cuts:
+        return [ring]
+    start = cuts[0]
+    rotated = points[start:] + points[:start] + [points[start]]
+    arcs = []
+    begin = 0
+    for i in range(1, len(rotated)):
+        if rotated[i] in junctions:
+            arcs.append(rotated[begin:i + 1])
+            begin = i
+    return arcs
+
+
+def _canonical(arc):
+    '''
+    key identifying an arc regardless of its direction (and rotation, when closed)
+    '''
+    if arc[0] == arc[-1]:
+        points = arc[:-1]
+        i = points.index(min(points))
+        forward = points[i:] + points[:i]
+        backward = forward[:1] + forward[:0:-1]
+        return tuple(min(forward, backward)), None
+    forward, backward = tuple(arc), tuple(arc[::-1])
+    if forward <= backward:
+        return forward, False
+    return backward, True
+
+
+def _douglas_peucker(points, tolerance):
+    '''
+    indices of the points kept by Douglas-Peucker
+
+    The endpoints are always kept, and so is the point furthest from the chord even
+    when it is within tolerance, so an arc never collapses to a straight line and a
+    ring never collapses below a triangle.
+    '''
+    n = len(points)
+    if n <= 2:
+        return list(range(n))
+    xy = np.asarray(points, dtype=float)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1, True)]
+    while stack:
+        first, last, force = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = xy[first], xy[last]
+        segment = xy[first + 1:last]
+        dx, dy = end - start
+        length = math.hypot(dx, dy)
+        if length == 0:
+            distances = np.hypot(*(segment - start).T)
+        else:
+            distances = np.abs(dx * (segment[:, 1] - start[1]) - dy * (segment[:, 0] - start[0])) / length
+        i = int(np.argmax(distances))
+        if force or distances[i] > tolerance:
+            keep[first + 1 + i] = True
+            stack.append((first, first + 1 + i, False))
+            stack.append((first + 1 + i, last, False))
+    return np.flatnonzero(keep).tolist()
+
+
+def _simplify_arc(arc, tolerance):
+    if arc[0] == arc[-1] and len(arc) > 4:
+        # closed ring: split at the point furthest from the start so it keeps an area
+        xy = np.asarray(arc, dtype=float)
+        far = int(np.argmax(np.hypot(*(xy - xy[0]).T)))
+        head = [arc[i] for i in _douglas_peucker(arc[:far + 1], tolerance)]
+        tail = [arc[far + i] for i in _douglas_peucker(arc[far:], tolerance)]
+        return head + tail[1:]
+    return [arc[i] for i in _douglas_peucker(arc, tolerance)]
+
+
+#--------------------------------------------------------------------------------------------------------
+# Topology
+#--------------------------------------------------------------------------------------------------------
+def build_topology(geojson, tolerance=DEFAULT_TOLERANCE, quantization=DEFAULT_QUANTIZATION,
+                   keep_properties=(AUTHORITY_NAME,)):
+    '''
+    quantize, cut into shared arcs and simplify a polygon FeatureCollection
+
+    :param geojson: FeatureCollection of Polygon / MultiPolygon features
+    :param tolerance: simplification tolerance in the units of the input (degrees)
+    :param quantization: number of grid steps across the bounding box on each axis
+    :param keep_properties: feature properties to keep, everything else is dropped
+    :return: a TopoJSON-style topology with absolute (not yet delta-encoded) arcs
+    '''
+    transform = make_transform(bounding_box(geojson), quantization)
+    grid_tolerance = tolerance / min(transform["scale"])
+
+    features = []
+    for feature in geojson["features"]:
+        polygons = []
+        for polygon in _polygons(feature["geometry"]):
+            rings = [_quantize_ring(ring, transform) for ring in polygon]
+            # a polygon whose exterior snapped away is dropped, holes that did are skipped
+            if rings and rings[0] is not None:
+                polygons.append([ring for ring in rings if ring is not None])
+        properties = feature.get("properties") or {}
+        features.append(({key: properties.get(key) for key in keep_properties}, polygons))
+
+    junctions = _find_junctions(ring for _, polygons in features for polygon in polygons for ring in polygon)
+
+    arcs = []
+    arc_ids = {}
+    geometries = []
+    for properties, polygons in features:
+        encoded = []
+        for polygon in polygons:
+            encoded_polygon = []
+            for ring in polygon:
+                encoded_ring = []
+                for arc in _cut_ring(ring, junctions):
+                    key, reversed_ = _canonical(arc)
+                    if key not in arc_ids:
+                        arc_ids[key] = len(arcs)
+                        arcs.append(_simplify_arc(list(key) + ([key[0]] if reversed_ is None else []), grid_tolerance))
+                    index = arc_ids[key]
+                    if reversed_ is None:
+                        # closed arcs are shared by rotation, keep the ring's own direction
+                        reversed_ = _signed_area(arc) * _signed_area(arcs[index]) < 0
+                    encoded_ring.append(~index if reversed_ else index)
+                encoded_polygon.append(encoded_ring)
+            encoded.append(encoded_polygon)
+        geometry = {"type": "MultiPolygon", "arcs": encoded} if len(encoded) != 1 \
+            else {"type": "Polygon", "arcs": encoded[0]}
+        geometry["properties"] = properties
+        geometries.append(geometry)
+
+    return {
+        "type": "Topology",
+        "transform": transform,
+        "objects": {"authorities": {"type": "GeometryCollection", "geometries": geometries}},
+        "arcs": arcs,
+    }
+
+
+def _signed_area(ring):
+    xy = np.asarray(ring, dtype=float)
+    return float(np.sum(xy[:-1, 0] * xy[1:, 1] - xy[1:, 0] * xy[:-1, 1]))
+
+
+#--------------------------------------------------------------------------------------------------------
+# Dissolve
+#--------------------------------------------------------------------------------------------------------
+def _arc_index(index):
+    return ~index if index < 0 else index
+
+
+def _endpoints(index, arcs):
+    arc = arcs[_arc_index(index)]
+    return (arc[-1], arc[0]) if index < 0 else (arc[0], arc[-1])
+
+
+def _ring_points(ring, arcs):
+    points = []
+    for index in ring:
+        arc = arcs[~index][::-1] if index < 0 else arcs[index]
+        points.extend(arc if not points else arc[1:])
+    return np.asarray(points, dtype=float)
+
+
+def _reverse(ring):
+    return [~index for index in reversed(ring)]
+
+
+def _stitch(boundary, arcs):
+    '''
+    join the outline arcs of a group into closed rings
+
+    Arcs are followed from endpoint to endpoint whatever the direction their authority
+    used them in; a run that cannot be closed is dropped.
+    '''
+    touching = defaultdict(list)
+    for index in boundary:
+        start, end = _endpoints(index, arcs)
+        touching[start].append(index)
+        touching[end].append(index)
+
+    remaining = dict.fromkeys(boundary)
+    rings = []
+    while remaining:
+        index = next(iter(remaining))
+        del remaining[index]
+        origin, point = _endpoints(index, arcs)
+        ring = [index]
+        while point != origin:
+            following = next((i for i in touching[point] if i in remaining), None)
+            if following is None:
+                break
+            del remaining[following]
+            if _endpoints(following, arcs)[0] != point:
+                following = ~following
+            ring.append(following)
+            point = _endpoints(following, arcs)[1]
+        if point == origin:
+            rings.append(ring)
+    return rings
+
+
+def _inside(points, ring):
+    '''
+    whether each point is inside the closed ring of points (even-odd rule)
+    '''
+    x, y = points[:, :1], points[:, 1:]
+    x0, y0, x1, y1 = ring[:-1, 0], ring[:-1, 1], ring[1:, 0], ring[1:, 1]
+    crosses = (y0 > y) != (y1 > y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        at = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+    return np.count_nonzero(crosses & (x < at), axis=1) % 2 == 1
+
+
+def _nest(rings, arcs, samples=16):
+    '''
+    sort rings into polygons: a ring inside an odd number of others is a hole of the
+    smallest of them; exteriors are counterclockwise and holes clockwise, as in GeoJSON
+    '''
+    points = [_ring_points(ring, arcs) for ring in rings]
+    areas = [_signed_area(ring) for ring in points]
+    polygons = []
+    placed = []
+    for i in sorted(range(len(rings)), key=lambda i: -abs(areas[i])):
+        # most of a ring's vertices, rather than one, as rings touch at junctions
+        sample = points[i][:-1][::max(1, len(points[i]) // samples)]
+        containing = [(j, polygon) for j, polygon in placed if np.mean(_inside(sample, points[j])) > 0.5]
+        ring = rings[i]
+        if len(containing) % 2 == 0:
+            polygons.append([ring if areas[i] > 0 else _reverse(ring)])
+            placed.append((i, len(polygons) - 1))
+        else:
+            _, polygon = min(containing, key=lambda item: abs(areas[item[0]]))
+            polygons[polygon].append(ring if areas[i] < 0 else _reverse(ring))
+            placed.append((i, polygon))
+    return polygons
+
+
+def dissolve(topology, group_of, group_properties):
+    '''
+    merge the authorities of each group into one geometry along their shared borders
+
+    An arc used once among a group's members is on its outline, one used twice is an
+    inner border and is dropped.
+
+    :param topology: a topology from build_topology
+    :param group_of: function from an authority's properties to its group, None to leave
+        the authority out
+    :param group_properties: {group: properties of its merged geometry}
+    :return: the topology with the merged geometries as objects["groups"], sharing its arcs
+    '''
+    members = defaultdict(list)
+    for geometry in topology["objects"]["authorities"]["geometries"]:
+        group = group_of(geometry["properties"])
+        if group is None:
+            continue
+        polygons = [geometry["arcs"]] if geometry["type"] == "Polygon" else geometry["arcs"]
+        members[group].extend(ring for polygon in polygons for ring in polygon)
+
+    geometries = []
+    for group, rings in members.items():
+        uses = Counter(_arc_index(index) for ring in rings for index in ring)
+        boundary = [index for ring in rings for index in ring if uses[_arc_index(index)] == 1]
+        polygons = _nest(_stitch(boundary, topology["arcs"]), topology["arcs"])
+        geometries.append({"type": "MultiPolygon", "arcs": polygons, "properties": group_properties[group]})
+
+    dissolved = dict(topology)
+    dissolved["objects"] = dict(topology["objects"], groups={"type": "GeometryCollection", "geometries": geometries})
+    return dissolved
+
+
+def delta_encode(topology):
+    '''
+    TopoJSON encoding of the arcs: first point absolute, then differences
+    '''
+    encoded = dict(topology)
+    encoded["arcs"] = [
+        [list(arc[0])] + np.diff(np.asarray(arc), axis=0).tolist()
+        for arc in topology["arcs"]
+    ]
+    return encoded
+
+
+def delta_decode(topology):
+    decoded = dict(topology)
+    decoded["arcs"] = [
+        [tuple(point) for point in np.cumsum(np.asarray(arc), axis=0).tolist()]
+        for arc in topology["arcs"]
+    ]
+    return decoded
+
+
+def _decimals(transform):
+    '''
+    decimal places needed to represent one grid step
+    '''
+    return max(0, math.ceil(-math.log10(min(transform["scale"])))) + 1
+
+
+def topology_to_geojson(topology, id_property=None, name="authorities", keep=None):
+    '''
+    turn a topology from build_topology (or a delta-decoded TopoJSON) back into GeoJSON
+
+    :param id_property: if given, copy this property to each feature's id
+    :param name: the object to convert, "groups" for the geometries of dissolve
+    :param keep: if given, only convert the geometries for which keep(properties) is true
+    '''
+    (kx, ky), (x0, y0) = topology["transform"]["scale"], topology["transform"]["translate"]
+    decimals = _decimals(topology["transform"])
+    arcs = [
+        np.round(np.asarray(arc, dtype=float) * (kx, ky) + (x0, y0), decimals).tolist()
+        for arc in topology["arcs"]
+    ]
+
+    def ring(indices):
+        points = []
+        for index in indices:
+            arc = arcs[~index][::-1] if index < 0 else arcs[index]
+            points.extend(arc if not points else arc[1:])
+        return points
+
+    features = []
+    for geometry in topology["objects"][name]["geometries"]:
+        if keep is not None and not keep(geometry["properties"]):
+            continue
+        if geometry["type"] == "Polygon":
+            coordinates = [ring(r) for r in geometry["arcs"]]
+        else:
+            coordinates = [[ring(r) for r in polygon] for polygon in geometry["arcs"]]
+        feature = {
+            "type": "Feature",
+            "properties": geometry["properties"],
+            "geometry": {"type": geometry["type"], "coordinates": coordinates},
+        }
+        if id_property is not None:
+            feature["id"] = geometry["properties"][id_property]
+        features.append(feature)
+    return {"type": "FeatureCollection", "features": features}
+
+
+def simplify_geojson(geojson, tolerance=DEFAULT_TOLERANCE, quantization=DEFAULT_QUANTIZATION,
+                     keep_properties=(AUTHORITY_NAME,)):
+    '''
+    GeoJSON in, simplified and quantized GeoJSON out, see build_topology
+    '''
+    return topology_to_geojson(build_topology(geojson, tolerance, quantization, keep_properties))
+
+
+def load_geojson(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def write_json(data, path):
+    with open(path, "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simplify and quantize a boundary GeoJSON file")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="simplification tolerance in degrees (default %(default)s)")
+    parser.add_argument("--quantization", type=int, default=DEFAULT_QUANTIZATION,
+                        help="grid steps across the bounding box (default %(default)s)")
+    parser.add_argument("--topojson", action="store_true",
+                        help="write a delta-encoded TopoJSON topology instead of GeoJSON")
+    args = parser.parse_args(argv)
+
+    topology = build_topology(load_geojson(args.input), args.tolerance, args.quantization)
+    if args.topojson:
+        write_json(delta_encode(topology), args.output)
+    else:
+        write_json(topology_to_geojson(topology), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+'''
+Headline metrics of the Overview page, computed from the data
+
+One pass over the "All pupils" rows of the national file gives the published
+percentage of every subject for every year and gender, and, from the pupil counts
+(see utils.aggregate), the unrounded percentages the "vs BASELINE_YEAR" changes are
+taken from; the gap index file gives the disadvantage gap index series. Years without assessments
+(suppressed in every column) are interpolated in the series, as gaps in a line chart,
+and flagged as not measured.
+
+Computed once per data snapshot. The Overview figures are built from it, and
+utils.artifacts persists it in the figure cache as the "overview-headlines"
+artifact, keyed by the hashes of both files, which the page reads at request time.
+'''
+import numpy as np
+
+from utils.aggregate import aggregate
+from utils.data import per_snapshot
+from utils.engine import get_dataset
+
+NATIONAL_FILE = "ks2_national_pupil_characteristics_2016_to_2022_provisional.csv"
+GAP_INDEX_FILE = "ks2_2022_provisional_gapindex_ud.csv"
+
+# the last year before the pandemic, which the changes compare against
+BASELINE_YEAR = 201819
+
+# series names by the subject part of the column names, in legend order
+SUBJECTS = {"scita": "Science", "mat": "Math", "writta": "Writing", "gps": "Grammar"}
+GENDERS = ["Boys", "Girls", "Total"]
+# maths outcomes, each a share of t_mat_eligible_pupils
+OUTCOMES = {
+    "met_expected_standard": "Meeting Expected Standard",
+    "met_higher_standard": "Reaching Higher Standard",
+    "not_achieved_expected_standard": "Not Meeting Expected Standard",
+}
+
+# the Overview page's tiles: (text when the value went down, text when it went up,
+# gender, outcome); the last tile is the gap index
+TILES = [
+    ("Percentage of pupils meeting expected standards in math is down",
+     "Percentage of pupils meeting expected standards in math is up", "Total", "met_expected_standard"),
+    ("Percentage of boys not reaching expected standards in math is down",
+     "Percentage of boys not reaching expected standards in math is up", "Boys", "not_achieved_expected_standard"),
+    ("Percentage of boys meeting expected standards in math is down",
+     "Percentage of boys meeting expected standards in math is up", "Boys", "met_expected_standard"),
+    ("Percentage of girls not reaching expected standards in math is down",
+     "Percentage of girls not reaching expected standards in math is up", "Girls", "not_achieved_expected_standard"),
+    ("Percentage of girls meeting expected standards in math is down",
+     "Percentage of girls meeting expected standards in math is up", "Girls", "met_expected_standard"),
+]
+GAP_TILE = (
+    "Disadvantage gap index is down compared to non-disadvantaged pupils",
+    "Disadvantage gap index is up compared to non-disadvantaged pupils",
+    )
+
+
+#--------------------------------------------------------------------------------------------------------
+# Functions
+#--------------------------------------------------------------------------------------------------------
+def end_year(time_period):
+    '''
+    201819 -> 2019, the calendar year of the assessments
+    '''
+    return int(time_period) // 100 + 1
+
+
+def series(values):
+    '''
+    a yearly series as chart data, interpolating the years without values
+
+    :param values: float Series indexed by time_period, NaN for years without data
+    :return: {"years", "values", "measured"} with one entry per year
+    '''
+    values = values.sort_index()
+    filled = values.interpolate(limit_area="inside")
+    return {
+        "years": [end_year(year) for year in values.index],
+        "values": [None if np.isnan(value) else round(float(value), 2) for value in filled],
+        "measured": values.notna().tolist(),
+    }
+
+
+def tile(texts, change, relative=False):
+    '''
+    an Overview tile: the (down, up) text for the direction of change and the change
+
+    :param relative: the change is in % of the baseline value, otherwise a difference
+        of percentages, in percentage points
+    '''
+    change = float(change)
+    return {
+        "text": texts[change > 0],
+        "value": f"{change:+.1f}%" if relative else f"{change:+.1f} pp",
+        "change": round(change, 2),
+        "relative": relative,
+    }
+
+
+def compute_headlines(national, gap_index):
+    '''
+    headline series and changes since BASELINE_YEAR
+
+    :param national: Dataset of NATIONAL_FILE, see utils.engine
+    :param gap_index: Dataset of GAP_INDEX_FILE
+    :return: plain data, see the module docstring
+    '''
+    published = [f"pt_{subject}_met_expected_standard" for subject in SUBJECTS]
+    counts = [f"t_mat_{outcome}" for outcome in OUTCOMES]
+    rows = national.select(
+        {"characteristic_group": "All pupils", "characteristic": "Total", "gender": GENDERS},
+        columns=["time_period", "gender"] + published + counts + ["t_mat_eligible_pupils"],
+        ).set_index(["time_period", "gender"])
+
+    totals = rows.xs("Total", level="gender")[published]
+    years = range(totals.index.min() // 100, totals.index.max() // 100 + 1)
+    totals = totals.reindex([year * 100 + (year + 1) % 100 for year in years])
+    measured = totals.notna().any(axis="columns")
+    latest = totals.index[measured].max()
+
+    # every outcome as an unrounded percentage of the eligible pupils at once
+    measures = [f"pt_mat_{outcome}" for outcome in OUTCOMES]
+    shares = aggregate(rows.reset_index(), by=["time_period", "gender"], measures=measures)[measures]
+    changes = shares.xs(latest, level="time_period") - shares.xs(BASELINE_YEAR, level="time_period")
+    changes.columns = list(OUTCOMES)
+
+    gaps = gap_index.select({}, columns=["time_period", "disadvantage_gap_index"])
+    gaps = gaps.set_index("time_period")["disadvantage_gap_index"].astype(np.float64)
+    gap_change = 100 * (gaps.iloc[-1] / gaps[BASELINE_YEAR] - 1) if BASELINE_YEAR in gaps.index else np.nan
+
+    return {
+        "baseline_year": end_year(BASELINE_YEAR),
+        "latest_year": end_year(latest),
+        "missing_years": [end_year(year) for year in totals.index[~measured]],
+        "subjects": {
+            name: series(totals[f"pt_{subject}_met_expected_standard"].astype(np.float64))
+            for subject, name in SUBJECTS.items()
+            },
+        "gap_index": series(gaps),
+        "changes": {
+            gender: {outcome: round(float(changes.at[gender, outcome]), 2) for outcome in OUTCOMES}
+            for gender in GENDERS if gender in changes.index
+            },
+        "tiles": [tile((down, up), changes.at[gender, outcome]) for down, up, gender, outcome in TILES]
+            + [tile(GAP_TILE, gap_change, relative=True)],
+    }
+
+
+@per_snapshot
+def build_headlines(snapshot):
+    return compute_headlines(get_dataset(NATIONAL_FILE), get_dataset(GAP_INDEX_FILE))
@@ -0,0 +1,102 @@
+'''
+Compression and conditional caching for the dashboard's HTTP responses
+
+install(server) sets up:
+
+    flask-compress      brotli or gzip for HTML, JS, CSS and JSON responses,
+                        including Dash layouts and callback outputs
+    ETags               on the Dash layout and dependency responses; a GET whose
+                        If-None-Match matches gets an empty 304. Callback POSTs
+                        are not tagged: browsers never send them conditionally
+    /_figures/<file>    the prebuilt figures of utils.artifacts, sent precompressed
+                        as stored at build time and cacheable forever, since their
+                        file name changes whenever their content does
+'''
+import os
+import re
+
+import flask
+from flask_compress import Compress
+
+from utils.artifacts import ARTIFACT_DIR, ENCODINGS
+
+CONDITIONAL_PATHS = ("/_dash-layout", "/_dash-dependencies")
+ARTIFACT_NAME = re.compile(r"[a-z0-9-]+-[0-9a-f]{16}\.json")
+
+# a year, the longest lifetime caches honour
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def _matches(tag):
+    # flask-compress appends the encoding to the tag, e.g. "<tag>:br"
+    return any(match.split(":")[0] == tag for match in flask.request.if_none_match.as_set())
+
+
+def _not_modified(tag, cache_control):
+    response = flask.Response(status=304)
+    response.set_etag(tag)
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+
+def _conditional(response):
+    '''
+    tag Dash JSON responses to GETs with a hash of their body and answer 304 when it matches
+    '''
+    if (
+        flask.request.method != "GET"
+        or response.status_code != 200
+        or response.is_streamed
+        or not flask.request.path.endswith(CONDITIONAL_PATHS)
+    ):
+        return response
+    response.add_etag()
+    # the browser may keep them, but must check they are still current
+    response.headers["Cache-Control"] = "no-cache"
+    tag, _ = response.get_etag()
+    if _matches(tag):
+        return _not_modified(tag, "no-cache")
+    return response
+
+
+def send_artifact(filename):
+    '''
+    a prebuilt figure, in the best precompressed encoding the client accepts
+    '''
+    if not ARTIFACT_NAME.fullmatch(filename):
+        flask.abort(404)
+    tag = filename.rsplit(".", 1)[0]
+    accepted = flask.request.accept_encodings
+    encoding = next((encoding for encoding in ENCODINGS if accepted[encoding]), None)
+    tag = f"{tag}:{encoding}" if encoding else tag
+    if _matches(tag.split(":")[0]):
+        return _not_modified(tag, IMMUTABLE)
+
+    path = os.path.join(ARTIFACT_DIR, filename)
+    if encoding:
+        path += ENCODINGS[encoding][0]
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        flask.abort(404)
+
+    response = flask.Response(data, mimetype="application/json")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = IMMUTABLE
+    response.set_etag(tag)
+    return response
+
+
+def install(server):
+    '''
+    add compression, ETags and the /_figures route to the Flask server
+    '''
+    server.config.setdefault("COMPRESS_ALGORITHM", ["br", "gzip"])
+    server.config.setdefault("COMPRESS_BR_LEVEL", 5)
+    Compress(server)
+    # registered after Compress so it runs first and tags the uncompressed body
+    server.after_request(_conditional)
+    server.add_url_rule("/_figures/<filename>", "figures", send_artifact)
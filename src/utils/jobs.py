@@ -0,0 +1,93 @@
+'''
+Background jobs for figure builds too slow to hold a server worker for
+
+Jobs run as Dash background callbacks through a DiskcacheManager: each job is a
+process forked from the server worker, so it sees the worker's data snapshot, and
+its progress and result come back through a diskcache.Cache in data/.cache/jobs
+that every worker shares. The browser polls for them every JOB_INTERVAL ms while
+the server worker is free for other requests.
+
+A job is terminated when its callback is triggered again (a newer selection from
+the same page supersedes it) or when one of its cancel inputs changes, so stale
+renders do not keep running.
+
+The callback metrics a job records (see utils.metrics) go back to the server worker
+with its result, through the same cache, and are added to the worker's /metrics
+when the result is picked up.
+
+Figures built by jobs are also kept in results, under result_key of their
+utils.figcache key and bounded to FIGURE_CACHE_MAX_BYTES, where the request side
+picks them up instead of building them again.
+'''
+import functools
+import json
+import os
+
+import diskcache
+from dash import DiskcacheManager
+
+from utils import metrics
+from utils.data import CACHE_DIR
+from utils.figcache import DEFAULT_MAX_BYTES
+
+# shared by the workers of a server; benchmark.py runs with a directory of its own
+JOB_DIR = os.environ.get("FIGURE_JOB_DIR") or os.path.join(CACHE_DIR, "jobs")
+
+# ms between the browser's polls for a job's progress and result
+JOB_INTERVAL = int(os.environ.get("FIGURE_JOB_INTERVAL", 250))
+
+# how long a finished job's metrics wait for its result to be picked up, in seconds
+METRICS_EXPIRE = 3600
+
+
+class JobManager(DiskcacheManager):
+    '''
+    DiskcacheManager that hands the metrics recorded in a job back to the server worker
+    '''
+
+    def measured(self, func):
+        '''
+        wrap a background callback function so its metrics are recorded for the worker
+        '''
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with metrics.recording() as collected:
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    # stored before Dash stores the result, so both are there when
+                    # the worker sees the result
+                    self.handle.set(self._metrics_key(os.getpid()), collected, expire=METRICS_EXPIRE)
+
+        return wrapper
+
+    def get_result(self, key, job):
+        result = super().get_result(key, job)
+        if result is not self.UNDEFINED and job:
+            collected = self.handle.pop(self._metrics_key(job), None)
+            if collected is not None:
+                metrics.replay(collected)
+        return result
+
+    @staticmethod
+    def _metrics_key(job):
+        return f"metrics-{job}"
+
+
+manager = JobManager(diskcache.Cache(os.path.join(JOB_DIR, "callbacks")))
+results = diskcache.Cache(
+    os.path.join(JOB_DIR, "figures"),
+    size_limit=DEFAULT_MAX_BYTES,
+    eviction_policy="least-recently-used",
+    )
+
+
+def result_key(key):
+    '''
+    the key of a figure in results: the JSON of its figure cache key
+
+    diskcache compares keys by their pickle, which differs between equal tuples whose
+    strings are shared differently, e.g. a key built from a selection and one read back
+    from a 'graph-*' store.
+    '''
+    return json.dumps(key)
@@ -0,0 +1,46 @@
+'''
+Deferred page initialisation
+
+Pages load their data and build their figures on first use instead of at import
+(through utils.data.per_snapshot, which also redoes it for a new data snapshot), which
+keeps app start-up to the cost of importing the modules. Functions registered with
+@warm_up are also run by start_warm_up() in a background thread, so the first
+visitor usually finds everything built already.
+'''
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+_warm_ups = []
+
+
+def warm_up(func):
+    '''
+    register a no-argument function to be run by start_warm_up()
+    '''
+    _warm_ups.append(func)
+    return func
+
+
+def run_warm_ups():
+    for func in _warm_ups:
+        try:
+            func()
+        except Exception:
+            # the page will retry, and report the error, on first visit
+            logger.exception("warm-up of %s.%s failed", func.__module__, func.__qualname__)
+
+
+def start_warm_up():
+    '''
+    run the registered warm-up functions in a daemon thread
+
+    Set LAZY_WARMUP=0 to only build things when a page is first visited.
+    '''
+    if os.environ.get("LAZY_WARMUP", "1") == "0":
+        return None
+    thread = threading.Thread(target=run_warm_ups, name="page-warm-up", daemon=True)
+    thread.start()
+    return thread
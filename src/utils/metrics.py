@@ -0,0 +1,270 @@
+'''
+Per-callback latency and payload metrics in the Prometheus text format
+
+Pages register their callbacks with utils.metrics.callback instead of dash.callback.
+It is a drop-in replacement that also records, per callback:
+
+    dash_callback_duration_seconds   wall time histogram
+    dash_callback_phase_seconds      time spent in named phases, e.g. the data
+                                     selection versus building the plotly figure
+    dash_callback_response_bytes     size of the /_dash-update-component response
+    dash_callback_errors_total       callbacks that raised
+
+Code running inside a callback marks a phase with `with phase("select"):`.
+install(server) adds the /metrics route and the response size hook.
+
+Metrics are kept per process; with several gunicorn workers each scrape of
+/metrics describes the worker that answered it. Background callbacks run in a
+process forked for the job: what they record is collected there (see recording)
+and replayed in the worker when it picks up the job's result (see utils.jobs).
+'''
+import bisect
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+import dash
+import flask
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+_current_callback = contextvars.ContextVar("current_callback", default=None)
+# Recording collecting the metrics of this context instead of this process, see recording
+_recording = contextvars.ContextVar("recording", default=None)
+_lock = threading.Lock()
+_histograms = {}
+_errors = {}
+_collectors = []
+
+
+class Histogram:
+    '''
+    cumulative-bucket histogram, as Prometheus expects it
+    '''
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        '''
+        yield (le, cumulative count) including +Inf
+        '''
+        total = 0
+        for le, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            total += count
+            yield le, total
+
+
+class Recording:
+    '''
+    metrics recorded in a process that does not serve /metrics, as plain data that
+    can be pickled to the process that does (see replay)
+    '''
+
+    def __init__(self):
+        self.observations = []
+        self.errors = []
+
+
+#--------------------------------------------------------------------------------------------------------
+# Recording
+#--------------------------------------------------------------------------------------------------------
+def observe(metric, labels, value, buckets=DURATION_BUCKETS):
+    recording = _recording.get()
+    if recording is not None:
+        recording.observations.append((metric, labels, value, buckets))
+        return
+    key = (metric, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+
+def count_error(name):
+    recording = _recording.get()
+    if recording is not None:
+        recording.errors.append(name)
+        return
+    with _lock:
+        _errors[name] = _errors.get(name, 0) + 1
+
+
+@contextmanager
+def recording():
+    '''
+    collect the metrics recorded in the block in a Recording instead of this process
+    '''
+    collected = Recording()
+    token = _recording.set(collected)
+    try:
+        yield collected
+    finally:
+        _recording.reset(token)
+
+
+def replay(collected):
+    '''
+    add the metrics of a Recording to this process
+    '''
+    for metric, labels, value, buckets in collected.observations:
+        observe(metric, labels, value, buckets)
+    for name in collected.errors:
+        count_error(name)
+
+
+@contextmanager
+def phase(name):
+    '''
+    time a block of code as a phase of the callback that is running it
+    '''
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        callback_name = _current_callback.get()
+        if callback_name is not None:
+            observe("dash_callback_phase_seconds", {"callback": callback_name, "phase": name},
+                    time.perf_counter() - start)
+
+
+def instrument(func):
+    '''
+    wrap a callback function so its calls are counted and timed
+    '''
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _current_callback.set(name)
+        if flask.has_request_context():
+            flask.g.dash_callback = name
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except dash.exceptions.PreventUpdate:
+            raise
+        except Exception:
+            count_error(name)
+            raise
+        finally:
+            observe("dash_callback_duration_seconds", {"callback": name}, time.perf_counter() - start)
+            _current_callback.reset(token)
+
+    return wrapper
+
+
+def callback(*args, **kwargs):
+    '''
+    dash.callback, with the decorated function instrumented
+
+    Background callbacks whose manager can hand a job's metrics back to the server
+    worker (see utils.jobs.JobManager) record theirs for it.
+    '''
+    register = dash.callback(*args, **kwargs)
+    manager = kwargs.get("manager")
+
+    def decorator(func):
+        instrumented = instrument(func)
+        if kwargs.get("background") and hasattr(manager, "measured"):
+            instrumented = manager.measured(instrumented)
+        register(instrumented)
+        return func
+
+    return decorator
+
+
+def register_collector(func):
+    '''
+    add a function returning [(metric name, type, help, {labels}, value)] to /metrics
+
+    Used for values owned elsewhere, e.g. the figure cache counters.
+    '''
+    _collectors.append(func)
+    return func
+
+
+#--------------------------------------------------------------------------------------------------------
+# Exposition
+#--------------------------------------------------------------------------------------------------------
+HELP = {
+    "dash_callback_duration_seconds": "Wall time of Dash callbacks",
+    "dash_callback_phase_seconds": "Time spent in named phases of Dash callbacks",
+    "dash_callback_response_bytes": "Size of Dash callback responses",
+}
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        f'{key}="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for key, value in labels
+        )
+    return "{" + ",".join(escaped) + "}"
+
+
+def render():
+    '''
+    all metrics in the Prometheus text exposition format
+    '''
+    with _lock:
+        histograms = sorted(_histograms.items())
+        errors = sorted(_errors.items())
+        snapshots = [(key, list(h.samples()), h.sum, h.count) for key, h in histograms]
+
+    lines = []
+    seen = set()
+    for (metric, labels), samples, total, count in snapshots:
+        if metric not in seen:
+            seen.add(metric)
+            lines.append(f"# HELP {metric} {HELP.get(metric, metric)}")
+            lines.append(f"# TYPE {metric} histogram")
+        for le, cumulative in samples:
+            lines.append(f"{metric}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+        lines.append(f"{metric}_sum{_labels(labels)} {total}")
+        lines.append(f"{metric}_count{_labels(labels)} {count}")
+
+    lines.append("# HELP dash_callback_errors_total Dash callbacks that raised an exception")
+    lines.append("# TYPE dash_callback_errors_total counter")
+    for name, count in errors:
+        lines.append(f"dash_callback_errors_total{_labels((('callback', name),))} {count}")
+
+    for collector in _collectors:
+        for metric, kind, help_text, labels, value in collector():
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            lines.append(f"{metric}{_labels(tuple(sorted(labels.items())))} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def _record_response_size(response):
+    name = flask.g.get("dash_callback")
+    if name is not None and flask.request.path.endswith("/_dash-update-component"):
+        observe("dash_callback_response_bytes", {"callback": name},
+                response.calculate_content_length() or 0, BYTES_BUCKETS)
+    return response
+
+
+def install(server, path="/metrics"):
+    '''
+    expose /metrics on the Flask server and record callback response sizes
+    '''
+    server.after_request(_record_response_size)
+    server.add_url_rule(
+        path,
+        "metrics",
+        lambda: flask.Response(render(), content_type="text/plain; version=0.0.4; charset=utf-8"),
+        )
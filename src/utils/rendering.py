@@ -0,0 +1,93 @@
+'''
+Rendering mode and data reduction for charts that grow with the data
+
+Above RENDER_WEBGL_POINTS points a scatter or line chart is drawn with WebGL
+(scattergl) instead of SVG. Bar charts cannot use WebGL, so above RENDER_MAX_BARS
+bars only the RENDER_TOP_N_BARS highest are drawn and the rest are merged into one
+"Other" bar. Line series longer than RENDER_MAX_LINE_POINTS are decimated, keeping
+the minimum and maximum of each bucket so peaks survive.
+'''
+import os
+
+import numpy as np
+import pandas as pd
+
+SETTINGS = {
+    "webgl_points": int(os.environ.get("RENDER_WEBGL_POINTS", 1000)),
+    "max_bars": int(os.environ.get("RENDER_MAX_BARS", 200)),
+    "top_n_bars": int(os.environ.get("RENDER_TOP_N_BARS", 50)),
+    "max_line_points": int(os.environ.get("RENDER_MAX_LINE_POINTS", 2000)),
+}
+
+
+def render_mode(points):
+    '''
+    render_mode argument for px.scatter / px.line drawing this many points
+    '''
+    return "webgl" if points > SETTINGS["webgl_points"] else "svg"
+
+
+def top_n(df, label, value, n=None, limit=None, other="Other", merge=None):
+    '''
+    keep the n rows with the highest value and merge the others into one row
+
+    Nothing is merged unless df has more than limit rows. The merged row is labelled
+    "Other (<count>)" and holds merge(merged rows), by default the mean of their values;
+    percentages should be pooled from their counts instead (see utils.aggregate).
+
+    :param df: one row per bar
+    :param label: column with the bar labels
+    :param value: numeric column with the bar lengths
+    :return: the reduced dataframe, in the order of df
+    '''
+    n = SETTINGS["top_n_bars"] if n is None else n
+    limit = SETTINGS["max_bars"] if limit is None else limit
+    if len(df) <= limit:
+        return df
+    keep = df[value].rank(method="first", ascending=False) <= n
+    rest = df[~keep]
+    merged_value = rest[value].mean() if merge is None else merge(rest)
+    merged = pd.DataFrame({label: [f"{other} ({len(rest)})"], value: [merged_value]})
+    return pd.concat([merged, df[keep]], ignore_index=True)
+
+
+def minmax_indices(y, max_points):
+    '''
+    positions of the points to keep so a series of len(y) draws with at most max_points
+
+    The series is cut into max_points // 2 buckets and the minimum and maximum of each
+    are kept, in their original order.
+    '''
+    y = np.asarray(y, dtype=np.float64)
+    if len(y) <= max_points:
+        return np.arange(len(y))
+    edges = np.linspace(0, len(y), max(max_points // 2, 1) + 1).astype(np.intp)
+    keep = []
+    for start, stop in zip(edges[:-1], edges[1:]):
+        if stop <= start:
+            continue
+        bucket = y[start:stop]
+        if np.isnan(bucket).all():
+            keep.append(start)
+            continue
+        keep.extend((start + np.nanargmin(bucket), start + np.nanargmax(bucket)))
+    return np.unique(keep)
+
+
+def decimate(df, x, y, by=None, max_points=None):
+    '''
+    min-max decimate each series of df (one per value of by) to at most max_points
+
+    :param x: column the series are ordered by
+    :param y: column with the values; non-numeric values count as gaps
+    '''
+    max_points = SETTINGS["max_line_points"] if max_points is None else max_points
+    groups = [df] if by is None else [group for _, group in df.groupby(by, sort=False)]
+    if all(len(group) <= max_points for group in groups):
+        return df
+    parts = []
+    for group in groups:
+        group = group.sort_values(x)
+        values = pd.to_numeric(group[y], errors="coerce")
+        parts.append(group.iloc[minmax_indices(values, max_points)])
+    return pd.concat(parts)
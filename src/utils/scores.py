@@ -0,0 +1,108 @@
+'''
+Cumulative scaled-score tables for the KS2 scaled-score distributions
+
+Each (year, subject, gender, characteristic group) of the scaled-score file becomes
+a ScoreDistribution of numpy arrays, built once per data snapshot. Pupils with the
+"N" score (no scaled score awarded) rank below the lowest score, as in the published
+pt_cumulative column. Percentiles and "% scoring at least x" are then binary
+searches over the cumulative counts instead of a groupby per request.
+'''
+from collections import namedtuple
+
+import numpy as np
+
+from utils.data import per_snapshot
+
+SCORES_FILE = "ks2_national_scaledscores_2019_to_2022_provisional.csv"
+
+# pupils who did not achieve a scaled score
+NO_SCORE = "N"
+
+# the expected standard is a scaled score of 100, the higher standard 110
+EXPECTED_STANDARD = 100
+HIGHER_STANDARD = 110
+
+DISTRIBUTION_KEYS = ("time_period", "subject", "gender", "characteristic_group")
+
+# scores: sorted scaled scores; counts: pupils with each score; cumulative: pupils below
+# scores[i] at position i (so cumulative[0] == no_score and cumulative[-1] == total);
+# published: the file's pt_cumulative for each score
+ScoreDistribution = namedtuple(
+    "ScoreDistribution",
+    ["scores", "counts", "cumulative", "no_score", "total", "published"]
+    )
+
+
+#--------------------------------------------------------------------------------------------------------
+# Functions
+#--------------------------------------------------------------------------------------------------------
+def build_distributions(df):
+    '''
+    cumulative count tables for every combination of DISTRIBUTION_KEYS
+
+    :param df: the scaled-score dataframe
+    :return: {(time_period, subject, gender, characteristic_group): ScoreDistribution}
+    '''
+    distributions = {}
+    for key, group in df.groupby(list(DISTRIBUTION_KEYS), sort=False):
+        no_score = group["scaled_scores"] == NO_SCORE
+        scored = group[~no_score]
+        # a categorical of text scores, see utils.data.compact
+        scores = scored["scaled_scores"].astype(str).astype(np.int64).to_numpy()
+        order = np.argsort(scores, kind="stable")
+        counts = scored["t_eligible_pupils"].to_numpy(dtype=np.int64)[order]
+        missing = int(group.loc[no_score, "t_eligible_pupils"].sum())
+        cumulative = missing + np.concatenate(([0], np.cumsum(counts)))
+        distributions[key] = ScoreDistribution(
+            scores=scores[order],
+            counts=counts,
+            cumulative=cumulative,
+            no_score=missing,
+            total=int(cumulative[-1]),
+            published=scored["pt_cumulative"].to_numpy(dtype=np.float64)[order],
+            )
+    return distributions
+
+
+def pupils_below(distribution, score):
+    '''
+    number of pupils scoring below score, counting "N" as below every score
+    '''
+    return int(distribution.cumulative[np.searchsorted(distribution.scores, score, side="left")])
+
+
+def percent_at_least(distribution, score):
+    '''
+    percentage of pupils scoring score or more, e.g. percent_at_least(d, 110)
+    '''
+    if distribution.total == 0:
+        return float("nan")
+    return 100 * (distribution.total - pupils_below(distribution, score)) / distribution.total
+
+
+def percentile(distribution, percent):
+    '''
+    lowest score at or below which at least percent % of pupils scored
+
+    :return: the scaled score, or NO_SCORE if that many pupils have no scaled score
+    '''
+    target = percent / 100 * distribution.total
+    position = int(np.searchsorted(distribution.cumulative, target, side="left"))
+    if position == 0:
+        return NO_SCORE
+    return int(distribution.scores[min(position, len(distribution.scores)) - 1])
+
+
+def percent_of_pupils(distribution):
+    '''
+    share of pupils at each score, in %
+    '''
+    if distribution.total == 0:
+        return distribution.counts.astype(np.float64)
+    return 100 * distribution.counts / distribution.total
+
+
+# Built once per data snapshot (see utils.data.per_snapshot), on first use
+@per_snapshot
+def load_distributions(snapshot):
+    return build_distributions(snapshot.frames[SCORES_FILE])
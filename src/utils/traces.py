@@ -0,0 +1,70 @@
+'''
+Recording of real browser sessions, replayed by loadtest.py
+
+With TRACE_DIR set, install(server) gives every browser a session cookie and appends
+each request it makes to the dashboard to <TRACE_DIR>/<session>.jsonl, one JSON
+object per line:
+
+    {"t": unix time, "method": "POST", "path": "/_dash-update-component",
+     "query": {...}, "body": {...}, "status": 200, "ms": 12.3}
+
+Static files (assets, component bundles) are not recorded, and neither are the
+polls for background callback results or the per-page-load handles in the query
+string, which the replay makes afresh.
+'''
+import json
+import os
+import threading
+import time
+import uuid
+
+import flask
+
+TRACE_DIR = os.environ.get("TRACE_DIR")
+COOKIE = "dashboard_trace"
+
+IGNORED_PREFIXES = ("/assets/", "/_dash-component-suites/", "/_favicon", "/_reload-hash", "/metrics")
+# query parameters only valid for the page load they were issued to
+SESSION_PARAMETERS = ("endId", "cacheKey", "job", "oldJob", "cancelJob")
+
+_lock = threading.Lock()
+
+
+def _start():
+    flask.g.trace_start = time.perf_counter()
+
+
+def _record(response, directory):
+    request = flask.request
+    if request.path.startswith(IGNORED_PREFIXES) or "cacheKey" in request.args:
+        return response
+    session = request.cookies.get(COOKIE)
+    if session is None:
+        session = uuid.uuid4().hex
+        response.set_cookie(COOKIE, session, httponly=True, samesite="Lax")
+
+    entry = {
+        "t": time.time(),
+        "method": request.method,
+        "path": request.path,
+        "query": {key: value for key, value in request.args.items() if key not in SESSION_PARAMETERS},
+        "body": request.get_json(silent=True) if request.method == "POST" else None,
+        "status": response.status_code,
+        "ms": round((time.perf_counter() - flask.g.get("trace_start", time.perf_counter())) * 1000, 3),
+    }
+    line = json.dumps(entry, separators=(",", ":")) + "\n"
+    with _lock:
+        with open(os.path.join(directory, f"{session}.jsonl"), "a") as f:
+            f.write(line)
+    return response
+
+
+def install(server, directory=TRACE_DIR):
+    '''
+    record the sessions of the Flask server's users to directory, if one is set
+    '''
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    server.before_request(_start)
+    server.after_request(lambda response: _record(response, directory))
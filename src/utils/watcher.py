@@ -0,0 +1,62 @@
+'''
+Background watcher that picks up new data releases without a restart
+
+Every DATA_WATCH_INTERVAL seconds (default 30, 0 disables) the data folder is
+checked for CSVs or data-guidance.json whose size or modification time changed.
+When something did, utils.data.reload() hashes the files, re-ingests only the ones
+whose content changed and atomically swaps in the new snapshot; a server whose
+workers are forked from a master that holds the data reloads it there instead (see
+serve.py).
+'''
+import logging
+import os
+import threading
+
+from utils import data
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = float(os.environ.get("DATA_WATCH_INTERVAL", 30))
+
+
+def _signature():
+    '''
+    cheap fingerprint of the data folder: (name, size, mtime) of each watched file
+    '''
+    names = data.list_csv_names() + [data.GUIDANCE_FILE]
+    signature = []
+    for name in names:
+        try:
+            stat = os.stat(data.data_path(name))
+        except FileNotFoundError:
+            continue
+        signature.append((name, stat.st_size, stat.st_mtime_ns))
+    return tuple(signature)
+
+
+def watch(interval, stop, on_change=data.reload):
+    signature = _signature()
+    while not stop.wait(interval):
+        try:
+            current = _signature()
+            if current != signature:
+                on_change()
+                signature = current
+        except Exception:
+            # e.g. a file caught half-written; try again on the next tick
+            logger.exception("data reload failed")
+
+
+def start_watcher(interval=DEFAULT_INTERVAL, on_change=data.reload):
+    '''
+    start watching the data folder in a daemon thread
+
+    :param on_change: called from the thread when the data folder changed
+    :return: an Event that stops the watcher when set, or None if disabled
+    '''
+    if interval <= 0:
+        return None
+    stop = threading.Event()
+    thread = threading.Thread(target=watch, args=(interval, stop, on_change), name="data-watcher", daemon=True)
+    thread.start()
+    return stop
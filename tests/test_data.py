@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+from utils.data import SUPPRESSION_MARKERS, compact, suppression_markers
+
+
+def raw_frame():
+    return pd.DataFrame({
+        "time_period": [201819, 201819, 202122, 202122],
+        "gender": ["Total", "Boys", "Total", "Boys"],
+        "t_mat_eligible_pupils": ["100", "c", "80", None],
+        "pt_mat_met_expected_standard": ["70", "low", "65.5", "x"],
+        "t_mat_met_expected_standard": ["70", "z", "52", "40"],
+    })
+
+
+def test_compact_values_and_reason_codes():
+    frame, reasons = compact(raw_frame())
+    assert frame["gender"].dtype == "category"
+    assert frame["time_period"].tolist() == [201819, 201819, 202122, 202122]
+
+    values = frame["pt_mat_met_expected_standard"]
+    assert values.dtype == np.float64
+    assert values.iloc[[0, 2]].tolist() == [70.0, 65.5]
+    assert values.iloc[[1, 3]].isna().all()
+    # whole numbers fit float32 exactly
+    assert frame["t_mat_met_expected_standard"].dtype == np.float32
+
+    # code = position in SUPPRESSION_MARKERS + 1, 0 for published and missing values
+    assert reasons["pt_mat_met_expected_standard"].tolist() == [
+        0, SUPPRESSION_MARKERS.index("low") + 1, 0, SUPPRESSION_MARKERS.index("x") + 1]
+    assert reasons["t_mat_eligible_pupils"].tolist() == [0, SUPPRESSION_MARKERS.index("c") + 1, 0, 0]
+
+
+def test_compact_keeps_text_columns_with_other_words():
+    frame, reasons = compact(pd.DataFrame({"characteristic": ["Total", "c"], "pt_x": ["1", "2"]}))
+    assert frame["characteristic"].dtype == "category"
+    assert frame["pt_x"].tolist() == [1.0, 2.0]
+    assert reasons.columns.empty
+
+
+def test_suppression_markers_round_trip():
+    raw = raw_frame()
+    _, reasons = compact(raw)
+    for column in ["pt_mat_met_expected_standard", "t_mat_met_expected_standard"]:
+        markers = suppression_markers(reasons, column)
+        suppressed = raw[column].isin(SUPPRESSION_MARKERS)
+        assert markers[suppressed].tolist() == raw.loc[suppressed, column].tolist()
+        assert markers[~suppressed].isna().all()
+
+
+def test_suppression_markers_of_a_column_without_suppression():
+    _, reasons = compact(raw_frame())
+    assert suppression_markers(reasons, "time_period").isna().all()
@@ -0,0 +1,71 @@
+import pandas as pd
+import pytest
+
+from utils.data import compact
+from utils.engine import ALL, Dataset, selection_shape
+
+FILENAME = "test.csv"
+GUIDANCE = {FILENAME: {
+    "valid_categories": ["characteristic_group", "characteristic"],
+    "default_filters": {"gender": "Total"},
+}}
+
+
+@pytest.fixture
+def dataset():
+    frame, reasons = compact(pd.DataFrame({
+        "time_period": [201819, 201819, 201819, 202122, 202122, 202122],
+        "gender": ["Total", "Boys", "Total", "Total", "Girls", "Total"],
+        "characteristic_group": ["All pupils", "All pupils", "Sex", "All pupils", "Sex", "Sex"],
+        "characteristic": ["Total", "Total", "Boys", "Total", "Girls", "Girls"],
+        "pt_mat_met_expected_standard": ["70", "68", "c", "65", "66", "67"],
+    }))
+    return Dataset(FILENAME, frame, GUIDANCE, reasons)
+
+
+def test_schema(dataset):
+    schema = dataset.schema
+    assert schema.categories == ("characteristic_group", "characteristic")
+    assert schema.metrics == ("pt_mat_met_expected_standard",)
+    assert "pt_mat_met_expected_standard" not in schema.dimensions
+    assert schema.defaults == {"gender": "Total"}
+
+
+def test_select_applies_default_filters(dataset):
+    rows = dataset.select({"characteristic_group": "All pupils"})
+    assert rows.index.tolist() == [0, 3]
+    # a selection overrides the default
+    rows = dataset.select({"characteristic_group": "All pupils", "gender": ALL})
+    assert rows.index.tolist() == [0, 1, 3]
+
+
+def test_select_many_values_and_columns(dataset):
+    rows = dataset.select({"time_period": [202122], "characteristic": ["Total", "Girls", "unknown"]},
+                          columns=["characteristic", "pt_mat_met_expected_standard"])
+    assert rows.index.tolist() == [3, 5]
+    assert rows.columns.tolist() == ["characteristic", "pt_mat_met_expected_standard"]
+
+
+def test_empty_selections(dataset):
+    assert dataset.select({"characteristic": "unknown"}).empty
+    assert dataset.select({"characteristic": []}).empty
+    assert dataset.positions({"time_period": 190001}).size == 0
+
+
+def test_plans_are_shared_by_selection_shape(dataset):
+    one = selection_shape(dataset.resolve({"time_period": 201819}))
+    other = selection_shape(dataset.resolve({"time_period": 202122}))
+    assert one == other
+    assert dataset.plan(one) is dataset.plan(other)
+    many = selection_shape(dataset.resolve({"time_period": [201819]}))
+    assert many != one
+    assert dataset.plan(many) is not dataset.plan(one)
+    # ALL does not filter, so it is not part of the shape
+    assert selection_shape({"gender": ALL}) == ()
+
+
+def test_markers_of_selected_rows(dataset):
+    rows = dataset.select({"characteristic_group": "Sex"})
+    markers = dataset.markers("pt_mat_met_expected_standard", rows)
+    assert markers.tolist()[0] == "c"
+    assert markers.iloc[1:].isna().all()
@@ -0,0 +1,70 @@
+import io
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from utils import export
+from utils.data import compact
+from utils.engine import Dataset
+
+FILENAME = "test.csv"
+
+
+@pytest.fixture
+def dataset():
+    frame, reasons = compact(pd.DataFrame({
+        "time_period": [201819, 201819, 202122, 202122, 202122],
+        "characteristic": ["Total", "Boys", "Total", "Boys", "Girls"],
+        "t_mat_eligible_pupils": ["100", "c", "80", "40", "x"],
+        "pt_mat_met_expected_standard": ["70", "68.5", "low", "65", "66"],
+    }))
+    return Dataset(FILENAME, frame, {}, reasons)
+
+
+def export_csv(dataset, selection):
+    return "".join(export.csv_chunks(dataset, selection, list(dataset.df.columns)))
+
+
+def test_csv_writes_markers_and_whole_numbers(dataset):
+    text = export_csv(dataset, {})
+    rows = pd.read_csv(io.StringIO(text), dtype=str)
+    assert rows["t_mat_eligible_pupils"].tolist() == ["100", "c", "80", "40", "x"]
+    assert rows["pt_mat_met_expected_standard"].tolist() == ["70.0", "68.5", "low", "65.0", "66.0"]
+    assert text.splitlines()[1] == "201819,Total,100,70.0"
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 2, 3, 1000])
+def test_csv_same_for_any_chunk_size(dataset, monkeypatch, chunk_rows):
+    expected = export_csv(dataset, {})
+    monkeypatch.setattr(export, "EXPORT_CHUNK_ROWS", chunk_rows)
+    assert len(list(export.chunks(dataset, {}, list(dataset.df.columns)))) == -(-5 // chunk_rows)
+    assert export_csv(dataset, {}) == expected
+
+
+def test_csv_of_an_empty_selection_is_the_header(dataset):
+    assert export_csv(dataset, {"characteristic": "unknown"}) == \
+        "time_period,characteristic,t_mat_eligible_pupils,pt_mat_met_expected_standard\n"
+
+
+def test_arrow_keeps_values_and_reasons(dataset, monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_CHUNK_ROWS", 2)
+    data = b"".join(export.arrow_chunks(dataset, {"time_period": 202122}, list(dataset.df.columns)))
+    table = pa.ipc.open_stream(data).read_all().to_pandas()
+    assert table["characteristic"].tolist() == ["Total", "Boys", "Girls"]
+    assert table["t_mat_eligible_pupils"].isna().tolist() == [False, False, True]
+    assert table["t_mat_eligible_pupils:reason"].tolist()[2] == "x"
+    assert table["pt_mat_met_expected_standard:reason"].tolist()[0] == "low"
+
+
+def test_parse_selection_rejects_unknown_parameters(dataset):
+    from werkzeug.datastructures import MultiDict
+
+    with pytest.raises(ValueError):
+        export.parse_selection(dataset, MultiDict({"school": "x"}))
+    with pytest.raises(ValueError):
+        export.parse_selection(dataset, MultiDict({"metric": "pt_unknown"}))
+    selection, columns = export.parse_selection(
+        dataset, MultiDict([("year", "202122"), ("metric", "pt_mat_met_expected_standard")]))
+    assert selection == {"time_period": 202122}
+    assert columns == ["time_period", "characteristic", "pt_mat_met_expected_standard"]
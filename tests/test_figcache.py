@@ -0,0 +1,62 @@
+from utils.figcache import FigureCache, figure_patch, normalize_key
+
+
+def test_lru_bytes_and_eviction():
+    cache = FigureCache(max_bytes=10)
+    cache.put("a", "1234")
+    cache.put("b", "5678")
+    assert cache.stats()["bytes"] == 8
+    # a is used, so b is the least recently used
+    assert cache.get("a") == "1234"
+    cache.put("c", "90")
+    assert cache.stats()["bytes"] == 10
+    cache.put("d", "x")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1234"
+    stats = cache.stats()
+    assert (stats["entries"], stats["bytes"], stats["evictions"]) == (3, 7, 1)
+
+
+def test_replacing_and_oversized_entries():
+    cache = FigureCache(max_bytes=10)
+    cache.put("a", "1234")
+    cache.put("a", "12")
+    assert cache.stats()["bytes"] == 2
+    # too big to cache at all, and the entry it replaces is gone
+    cache.put("a", "x" * 11)
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 0
+
+
+def test_invalidate_and_clear():
+    cache = FigureCache(max_bytes=100)
+    cache.put(("one.csv", 1), "abc")
+    cache.put(("two.csv", 1), "de")
+    cache.invalidate(lambda key: key[0] == "one.csv")
+    assert cache.stats()["bytes"] == 2
+    assert cache.get(("two.csv", 1)) == "de"
+    cache.clear()
+    assert cache.stats()["entries"] == cache.stats()["bytes"] == 0
+
+
+def test_normalize_key_ignores_list_order():
+    assert normalize_key("f", ["b", "a"], 1) == normalize_key("f", ("a", "b"), 1) == ("f", ("a", "b"), 1)
+
+
+def figure(y, layout=None, traces=1, kind="bar"):
+    return {"data": [{"type": kind, "x": [1, 2], "y": y}] * traces, "layout": layout or {"title": "t"}}
+
+
+def test_figure_patch_replaces_only_what_changed():
+    patch = figure_patch(figure([1, 2], {"title": "t", "height": 400}), figure([3, 4], {"title": "t", "width": 500}))
+    operations = patch.to_plotly_json()["operations"]
+    changes = {(tuple(op["location"]), op["operation"]): op["params"] for op in operations}
+    assert changes[(("data", 0, "y"), "Assign")] == {"value": [3, 4]}
+    assert changes[(("layout", "width"), "Assign")] == {"value": 500}
+    assert (("layout", "height"), "Delete") in changes
+    assert not any(location[:3] == ("data", 0, "x") for location, _ in changes)
+
+
+def test_figure_patch_needs_matching_traces():
+    assert figure_patch(figure([1, 2]), figure([1, 2], traces=2)) is None
+    assert figure_patch(figure([1, 2]), figure([1, 2], kind="scatter")) is None
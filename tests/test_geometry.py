@@ -0,0 +1,83 @@
+import pytest
+
+from utils.geometry import (
+    AUTHORITY_NAME, build_topology, delta_decode, delta_encode, dissolve, topology_to_geojson)
+
+
+def square(name, x0, y0, size=1):
+    ring = [[x0, y0], [x0 + size, y0], [x0 + size, y0 + size], [x0, y0 + size], [x0, y0]]
+    return {
+        "type": "Feature",
+        "properties": {AUTHORITY_NAME: name, "dropped": 1},
+        "geometry": {"type": "Polygon", "coordinates": [ring]},
+    }
+
+
+@pytest.fixture
+def topology():
+    # A and B share the border x = 1, C stands alone
+    geojson = {"type": "FeatureCollection", "features": [square("A", 0, 0), square("B", 1, 0), square("C", 3, 0)]}
+    return build_topology(geojson, tolerance=0.0001, quantization=1001)
+
+
+def corners(ring):
+    return {tuple(point) for point in ring}
+
+
+def test_shared_border_is_one_arc(topology):
+    geometries = topology["objects"]["authorities"]["geometries"]
+    a, b = ([index if index >= 0 else ~index for index in g["arcs"][0]] for g in geometries[:2])
+    assert len(set(a) & set(b)) == 1
+    # the shared arc, A's outline, B's outline and C's closed ring
+    assert len(topology["arcs"]) == 4
+    assert [g["properties"] for g in geometries] == [{AUTHORITY_NAME: name} for name in "ABC"]
+
+
+def test_geojson_round_trip(topology):
+    features = topology_to_geojson(topology)["features"]
+    for feature, x0 in zip(features, [0, 1, 3]):
+        ring = feature["geometry"]["coordinates"][0]
+        assert ring[0] == ring[-1]
+        assert corners(ring) == {(x0, 0), (x0 + 1, 0), (x0 + 1, 1), (x0, 1)}
+    kept = topology_to_geojson(topology, keep=lambda properties: properties[AUTHORITY_NAME] == "B")
+    assert [f["properties"][AUTHORITY_NAME] for f in kept["features"]] == ["B"]
+
+
+def test_delta_encoding_round_trip(topology):
+    encoded = delta_encode(topology)
+    for arc, deltas in zip(topology["arcs"], encoded["arcs"]):
+        assert tuple(deltas[0]) == tuple(arc[0])
+        assert len(deltas) == len(arc)
+    assert delta_decode(encoded)["arcs"] == [[tuple(point) for point in arc] for arc in topology["arcs"]]
+
+
+def test_dissolve_drops_inner_borders(topology):
+    group_of = lambda properties: "AB" if properties[AUTHORITY_NAME] in ("A", "B") else None
+    dissolved = dissolve(topology, group_of, {"AB": {"name": "AB"}})
+    assert dissolved["arcs"] is topology["arcs"]
+    features = topology_to_geojson(dissolved, name="groups")["features"]
+    assert [f["properties"] for f in features] == [{"name": "AB"}]
+    polygons = features[0]["geometry"]["coordinates"]
+    assert len(polygons) == 1 and len(polygons[0]) == 1
+    ring = polygons[0][0]
+    assert ring[0] == ring[-1]
+    # the outline of both squares, the shared border only at its ends
+    assert corners(ring) == {(0, 0), (1, 0), (2, 0), (2, 1), (1, 1), (0, 1)}
+    assert len(ring) == 7
+
+
+def test_simplification_keeps_neighbours_meeting():
+    # a border with two small kinks, shared by two authorities
+    border = [[1, 0], [1.0002, 0.3], [0.9999, 0.6], [1, 1]]
+    left = {"type": "Feature", "properties": {AUTHORITY_NAME: "L"}, "geometry": {
+        "type": "Polygon", "coordinates": [border + [[0, 1], [0, 0], [1, 0]]]}}
+    right = {"type": "Feature", "properties": {AUTHORITY_NAME: "R"}, "geometry": {
+        "type": "Polygon", "coordinates": [[[1, 0], [2, 0], [2, 1]] + border[::-1]]}}
+    features = topology_to_geojson(build_topology(
+        {"type": "FeatureCollection", "features": [left, right]}, tolerance=0.01))["features"]
+    rings = [corners(f["geometry"]["coordinates"][0]) for f in features]
+    # the furthest kink is kept so the border does not collapse, the other one is dropped
+    assert all(len(ring) == 5 for ring in rings)
+    shared = rings[0] & rings[1]
+    assert len(shared) == 3
+    assert shared == {point for point in rings[0] if 0.99 < point[0] < 1.01}
@@ -0,0 +1,64 @@
+import math
+
+import pandas as pd
+import pytest
+
+from utils.scores import NO_SCORE, build_distributions, percent_at_least, percentile, pupils_below
+
+KEY = (202122, "Maths", "Total", "All schools")
+
+
+@pytest.fixture
+def distribution():
+    # 10 pupils without a score, then 20 at 90, 40 at 100 and 30 at 110, out of order
+    df = pd.DataFrame({
+        "time_period": 202122,
+        "subject": "Maths",
+        "gender": "Total",
+        "characteristic_group": "All schools",
+        "scaled_scores": ["110", NO_SCORE, "90", "100"],
+        "t_eligible_pupils": [30, 10, 20, 40],
+        "pt_cumulative": [100.0, None, 30.0, 70.0],
+    })
+    return build_distributions(df)[KEY]
+
+
+def test_cumulative_counts(distribution):
+    assert distribution.scores.tolist() == [90, 100, 110]
+    assert distribution.counts.tolist() == [20, 40, 30]
+    assert distribution.cumulative.tolist() == [10, 30, 70, 100]
+    assert distribution.no_score == 10
+    assert distribution.total == 100
+    assert distribution.published.tolist() == [30.0, 70.0, 100.0]
+
+
+def test_pupils_below(distribution):
+    assert pupils_below(distribution, 80) == 10
+    assert pupils_below(distribution, 100) == 30
+    assert pupils_below(distribution, 105) == 70
+    assert pupils_below(distribution, 120) == 100
+
+
+def test_percent_at_least(distribution):
+    assert percent_at_least(distribution, 100) == 70
+    assert percent_at_least(distribution, 110) == 30
+    assert percent_at_least(distribution, 111) == 0
+
+
+def test_percentile(distribution):
+    assert percentile(distribution, 5) == NO_SCORE
+    assert percentile(distribution, 10) == NO_SCORE
+    assert percentile(distribution, 11) == 90
+    assert percentile(distribution, 50) == 100
+    assert percentile(distribution, 100) == 110
+
+
+def test_empty_distribution():
+    df = pd.DataFrame({
+        "time_period": [202122], "subject": ["Maths"], "gender": ["Total"],
+        "characteristic_group": ["All schools"], "scaled_scores": [NO_SCORE],
+        "t_eligible_pupils": [0], "pt_cumulative": [None],
+    })
+    distribution = build_distributions(df)[KEY]
+    assert distribution.total == 0
+    assert math.isnan(percent_at_least(distribution, 100))